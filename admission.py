@@ -0,0 +1,144 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Callable, Hashable
+
+
+RATE_LIMIT_MAX_KEYS = 4096
+MAX_CONCURRENT_RENDERS = 4
+MAX_RENDER_QUEUE = 16
+
+
+class RateLimiter:
+    """
+    按键(用户或群)的令牌桶
+    每个键最多积累 burst 个令牌，每 interval 秒补充一个；每次请求消耗令牌，不足时拒绝。
+    状态只在内存中，键的数量有上限，超出时丢弃最久没有请求的键(等同于它的桶已经补满)
+    """
+
+    def __init__(
+        self,
+        burst: int,
+        interval: float,
+        max_keys: int = RATE_LIMIT_MAX_KEYS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            burst (int): 桶容量，即短时间内最多连续请求的次数，0 表示不限制
+            interval (float): 补充一个令牌的秒数
+            max_keys (int): 最多记录的键数
+            clock: 单调时钟
+        """
+        self.burst = max(0, int(burst))
+        self.interval = max(0.001, float(interval))
+        self.max_keys = max(1, int(max_keys))
+        self.clock = clock
+        self.rejected = 0
+        # 键 -> [剩余令牌, 上次更新时间]
+        self._buckets: "OrderedDict[Hashable, list]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.burst > 0
+
+    def _cost(self, cost: int) -> int:
+        return min(max(1, cost), self.burst)
+
+    def peek(self, key: Hashable, cost: int = 1) -> float:
+        """
+        检查 cost 个令牌是否足够，不消耗令牌、不记录键
+        多个桶需要同时满足时，先逐个 peek，全部允许后再逐个 acquire
+        Returns:
+            float: 0 表示足够；否则为需要等待的秒数
+        """
+        if not self.enabled:
+            return 0.0
+        cost = self._cost(cost)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return 0.0  # 没有记录的键桶是满的
+        tokens = min(float(self.burst), bucket[0] + (self.clock() - bucket[1]) / self.interval)
+        if tokens >= cost:
+            return 0.0
+        return (cost - tokens) * self.interval
+
+    def acquire(self, key: Hashable, cost: int = 1) -> float:
+        """
+        尝试消耗 cost 个令牌(超过桶容量时按容量计)
+        Returns:
+            float: 0 表示允许；否则为需要等待的秒数，本次不消耗令牌
+        """
+        if not self.enabled:
+            return 0.0
+        cost = self._cost(cost)
+        now = self.clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(self.burst), now]
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            tokens = bucket[0] + (now - bucket[1]) / self.interval
+            bucket[0] = min(float(self.burst), tokens)
+            bucket[1] = now
+
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0.0
+        self.rejected += 1
+        return (cost - bucket[0]) * self.interval
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class Overloaded(Exception):
+    """渲染排队已满，请求被丢弃"""
+
+
+class RenderGate:
+    """
+    全局并发上限
+    同时进行的渲染(含下载)最多 max_inflight 个，另有最多 max_waiting 个请求排队等待；
+    队列也满时直接抛出 Overloaded，由调用方回复一条简短的文字
+    """
+
+    def __init__(
+        self,
+        max_inflight: int = MAX_CONCURRENT_RENDERS,
+        max_waiting: int = MAX_RENDER_QUEUE,
+    ):
+        self.max_inflight = max(1, int(max_inflight))
+        self.max_waiting = max(0, int(max_waiting))
+        self._semaphore = asyncio.Semaphore(self.max_inflight)
+        self.inflight = 0
+        self.waiting = 0
+        self.shed = 0
+
+    async def acquire(self):
+        """占用一个渲染名额，没有空闲名额时排队；排队已满时抛出 Overloaded"""
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            self.shed += 1
+            raise Overloaded()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.inflight += 1
+
+    def release(self):
+        self.inflight -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        """acquire/release 的上下文管理器形式"""
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import re
+from datetime import datetime
+from typing import Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+import aiohttp
+from PIL import Image, ImageDraw
+
+from astrbot.api import logger
+
+from .disk_cache import DiskCacheManager
+from .fetcher import MAX_AVATAR_BYTES, ImageFetcher
+from .io_utils import async_atomic_write, atomic_write_bytes
+
+
+QLOGO_URL = "http://q.qlogo.cn/g?b=qq&nk={user_id}&s={size}"
+QLOGO_SIZES = (40, 100, 140, 640)  # qlogo 支持的头像尺寸
+
+_AVATAR_FILE = re.compile(r"^(.+?)(?:_\d+x\d+\.png|\.meta\.json)$")
+
+
+def pick_upstream_size(avatar_size: Tuple[int, int]) -> int:
+    """
+    选择能覆盖目标头像尺寸的最小上游尺寸
+    Args:
+        avatar_size (tuple): 海报上的头像尺寸
+    Returns:
+        int: qlogo 的 s 参数
+    """
+    target = max(avatar_size)
+    for size in QLOGO_SIZES:
+        if size >= target:
+            return size
+    return QLOGO_SIZES[-1]
+
+
+def avatar_entry_key(filename: str) -> Optional[str]:
+    """
+    头像目录中文件所属的缓存条目：同一用户的各尺寸头像和元数据属于同一条目
+    Args:
+        filename (str): 文件名
+    Returns:
+        Optional[str]: 条目键(过滤后的用户 ID)
+    """
+    match = _AVATAR_FILE.match(filename)
+    if match:
+        return match.group(1)
+    # 旧版本保存的头像文件也纳入管理
+    return os.path.splitext(filename)[0] or None
+
+
+class AvatarStore:
+    """
+    头像缓存
+    1. 保存已经缩放并裁成圆形的 RGBA 头像，渲染时直接粘贴
+    2. 记录 ETag / Last-Modified / 内容哈希，过期后用条件请求重新验证，头像没变时只需要一个 304
+    3. 只下载能覆盖配置尺寸的最小上游头像
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        avatar_dir: str,
+        avatar_size: Tuple[int, int],
+        expiration: int,
+        url_template: str = QLOGO_URL,
+        disk_cache: Optional[DiskCacheManager] = None,
+        fetcher: Optional[ImageFetcher] = None,
+        max_bytes: int = MAX_AVATAR_BYTES,
+    ):
+        self._fetcher = fetcher or ImageFetcher(session)
+        self.max_bytes = max_bytes  # 上游头像的大小上限
+        self.avatar_dir = avatar_dir
+        self.avatar_size = tuple(avatar_size)
+        self.expiration = expiration
+        self.url_template = url_template
+        self.upstream_size = pick_upstream_size(self.avatar_size)
+        self.disk_cache = disk_cache  # 记录访问，用于容量淘汰
+        self.not_modified = 0  # 304 次数
+        self.unchanged = 0  # 200 但内容哈希未变的次数
+        self.downloads = 0  # 实际重新处理头像的次数
+        os.makedirs(self.avatar_dir, exist_ok=True)
+
+    def _safe_name(self, user_id: str) -> str:
+        return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(user_id))
+
+    def processed_path(self, user_id: str) -> str:
+        """处理后头像的路径，按用户和头像尺寸区分"""
+        width, height = self.avatar_size
+        return os.path.join(
+            self.avatar_dir, f"{self._safe_name(user_id)}_{width}x{height}.png"
+        )
+
+    def _meta_path(self, user_id: str) -> str:
+        return os.path.join(self.avatar_dir, f"{self._safe_name(user_id)}.meta.json")
+
+    async def _read_meta(self, user_id: str) -> dict:
+        path = self._meta_path(user_id)
+        if not await aiofiles.os.path.exists(path):
+            return {}
+        try:
+            async with aiofiles.open(path, "r", encoding="utf-8") as f:
+                return json.loads(await f.read())
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    async def _write_meta(self, user_id: str, meta: dict):
+        path = self._meta_path(user_id)
+        await async_atomic_write(path, json.dumps(meta).encode("utf-8"))
+
+    def _process(self, content: bytes, path: str):
+        """
+        缩放头像并裁成圆形后保存为 PNG
+        Args:
+            content (bytes): 上游头像数据
+            path (str): 保存路径
+        """
+        avatar = Image.open(io.BytesIO(content)).convert("RGBA")
+        avatar = avatar.resize(self.avatar_size, Image.LANCZOS)
+
+        # 绘制一个白色的圆形作为不透明区域
+        mask = Image.new("L", avatar.size, 0)
+        ImageDraw.Draw(mask).ellipse((0, 0, avatar.size[0], avatar.size[1]), fill=255)
+        avatar.putalpha(mask)
+
+        buffer = io.BytesIO()
+        avatar.save(buffer, format="PNG")
+        atomic_write_bytes(path, buffer.getvalue())
+
+    async def get(self, user_id: str) -> Optional[str]:
+        """
+        获取处理后的用户头像
+        Args:
+            user_id (str): 用户 ID
+        Returns:
+            Optional[str]: 处理后头像的路径，获取失败且没有旧缓存时返回 None
+        """
+        path = self.processed_path(user_id)
+        meta = await self._read_meta(user_id)
+        has_processed = await aiofiles.os.path.exists(path)
+        if self.disk_cache is not None:
+            self.disk_cache.touch(self._safe_name(user_id), hit=has_processed)
+
+        now = datetime.now().timestamp()
+        if has_processed and now - meta.get("checked_at", 0) < self.expiration:
+            return path
+
+        headers = {}
+        if has_processed and meta.get("size") == self.upstream_size:
+            # 只有已经有处理结果时才做条件请求，否则需要完整的头像数据
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        url = self.url_template.format(user_id=user_id, size=self.upstream_size)
+        try:
+            result = await self._fetcher.fetch(
+                url, "avatar", max_bytes=self.max_bytes, headers=headers
+            )
+            if result.status == 304:
+                self.not_modified += 1
+                meta["checked_at"] = now
+                await self._write_meta(user_id, meta)
+                return path
+
+            content = result.data
+            etag = result.headers.get("ETag")
+            last_modified = result.headers.get("Last-Modified")
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"下载头像失败: {e}")
+            # 重新验证失败时继续使用旧头像
+            return path if has_processed else None
+
+        digest = hashlib.sha1(content).hexdigest()
+        if has_processed and digest == meta.get("sha1") and meta.get("size") == self.upstream_size:
+            self.unchanged += 1
+        else:
+            try:
+                await asyncio.to_thread(self._process, content, path)
+            except Exception as e:
+                logger.error(f"处理头像失败: {e}")
+                return path if has_processed else None
+            self.downloads += 1
+
+        await self._write_meta(
+            user_id,
+            {
+                "etag": etag,
+                "last_modified": last_modified,
+                "sha1": digest,
+                "size": self.upstream_size,
+                "checked_at": now,
+            },
+        )
+        return path
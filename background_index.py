@@ -0,0 +1,238 @@
+import os
+import random
+import time
+from array import array
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from astrbot.api import logger
+
+from .sampling import AliasSampler
+
+
+SAMPLE_POLICIES = ("url", "pack", "weighted")
+INDEX_REFRESH_INTERVAL = 30  # 秒
+
+
+class BackgroundPack:
+    """
+    一个背景图片包(backgroundFolder 下的一个 txt 文件)
+    所有 URL 拼接成一个字符串，配合偏移数组按下标取出，避免为每个 URL 保存单独的列表项。
+    """
+
+    __slots__ = ("name", "mtime_ns", "size", "_blob", "_offsets")
+
+    def __init__(self, name: str, mtime_ns: int, size: int, urls: List[str]):
+        self.name = name
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self._blob = "".join(urls)
+        offsets = array("I", [0])
+        for url in urls:
+            offsets.append(offsets[-1] + len(url))
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def url(self, i: int) -> str:
+        return self._blob[self._offsets[i] : self._offsets[i + 1]]
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self.url(i)
+
+
+def parse_pack_weights(items: Sequence[str]) -> Dict[str, float]:
+    """
+    解析背景包权重配置
+    Args:
+        items (list[str]): 形如 "ba:3" 或 "ba.txt:3" 的字符串列表
+    Returns:
+        dict: 背景包文件名 -> 权重
+    """
+    weights = {}
+    for item in items or []:
+        name, sep, value = str(item).rpartition(":")
+        if not sep:
+            continue
+        try:
+            weight = float(value)
+        except ValueError:
+            logger.warning(f"背景包权重配置无效: {item}")
+            continue
+        name = name.strip()
+        if not name.endswith(".txt"):
+            name += ".txt"
+        weights[name] = max(0.0, weight)
+    return weights
+
+
+class BackgroundIndex:
+    """
+    背景图片 URL 索引
+    1. 一次性加载所有背景包，之后按 txt 文件的修改时间增量刷新
+    2. 记录哪些 URL 对应的图片已经下载到本地
+    3. 支持三种 O(1) 抽样策略：
+       url: 所有 URL 等概率(大背景包被抽中的概率更高)
+       pack: 先等概率选背景包，再在包内等概率选 URL
+       weighted: 按配置的权重选背景包，再在包内等概率选 URL
+    """
+
+    def __init__(
+        self,
+        background_dir: str,
+        image_dir: str,
+        policy: str = "url",
+        pack_weights: Optional[Dict[str, float]] = None,
+        refresh_interval: float = INDEX_REFRESH_INTERVAL,
+    ):
+        if policy not in SAMPLE_POLICIES:
+            logger.warning(f"未知的背景抽样策略 {policy}，使用 url")
+            policy = "url"
+        self.background_dir = background_dir
+        self.image_dir = image_dir
+        self.policy = policy
+        self.pack_weights = pack_weights or {}
+        self.refresh_interval = refresh_interval
+
+        self._packs: Dict[str, BackgroundPack] = {}
+        # (背景包列表, 抽样器)，刷新时整体替换，抽样时读取的总是一份完整的快照
+        self._snapshot: Tuple[List[BackgroundPack], Optional[AliasSampler]] = ([], None)
+        self._cached_names = set()
+        self._cached_pool: Optional[Tuple[str, ...]] = None  # 已下载图片的抽样池
+        # 单调时钟的起点不确定(开机不久时可能小于刷新间隔)，用 None 表示还没有刷新过
+        self._last_refresh: Optional[float] = None
+
+    def needs_refresh(self) -> bool:
+        if self._last_refresh is None:
+            return True
+        return time.monotonic() - self._last_refresh >= self.refresh_interval
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        检查背景包文件的变化并增量更新索引(同步函数，会访问磁盘)
+        Args:
+            force (bool): 忽略刷新间隔
+        Returns:
+            bool: 索引是否发生了变化
+        """
+        if not force and not self.needs_refresh():
+            return False
+        self._last_refresh = time.monotonic()
+
+        try:
+            entries = [
+                e
+                for e in os.scandir(self.background_dir)
+                if e.is_file() and e.name.endswith(".txt")
+            ]
+        except FileNotFoundError:
+            entries = []
+
+        changed = False
+        packs: Dict[str, BackgroundPack] = {}
+        for entry in entries:
+            st = entry.stat()
+            old = self._packs.get(entry.name)
+            if old is not None and old.mtime_ns == st.st_mtime_ns and old.size == st.st_size:
+                packs[entry.name] = old
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    urls = [line.strip() for line in f if line.strip()]
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"读取背景包 {entry.name} 失败: {e}")
+                continue
+            packs[entry.name] = BackgroundPack(entry.name, st.st_mtime_ns, st.st_size, urls)
+            changed = True
+            logger.info(f"加载背景包 {entry.name}，共 {len(urls)} 个 URL")
+
+        if set(packs) != set(self._packs):
+            changed = True
+
+        if changed:
+            self._packs = packs
+            self._rebuild()
+        return changed
+
+    def _rebuild(self):
+        packs = [p for p in self._packs.values() if len(p) > 0]
+        sampler = None
+        if packs:
+            if self.policy == "url":
+                weights = [len(p) for p in packs]
+            elif self.policy == "pack":
+                weights = [1.0] * len(packs)
+            else:
+                weights = [self.pack_weights.get(p.name, 1.0) for p in packs]
+            if sum(weights) > 0:
+                sampler = AliasSampler(weights)
+        self._snapshot = (packs, sampler)
+
+        # 重新核对本地已下载的图片
+        try:
+            local = set(os.listdir(self.image_dir))
+        except FileNotFoundError:
+            local = set()
+        self._cached_names = {
+            name
+            for p in packs
+            for name in (os.path.basename(u) for u in p)
+            if name in local
+        }
+        self._cached_pool = None
+
+    def sample(self, rng: random.Random = random) -> Optional[str]:
+        """按当前策略抽取一个背景 URL，索引为空时返回 None"""
+        packs, sampler = self._snapshot
+        if sampler is None:
+            return None
+        pack = packs[sampler.sample(rng)]
+        return pack.url(int(rng.random() * len(pack)))
+
+    def sample_cached(self, rng: random.Random = random) -> Optional[str]:
+        """从已下载到本地的图片中等概率抽取一张，返回图片路径，没有时返回 None"""
+        pool = self._cached_pool
+        if pool is None:
+            pool = self._cached_pool = tuple(self._cached_names)
+        if not pool:
+            return None
+        return os.path.join(self.image_dir, pool[int(rng.random() * len(pool))])
+
+    def image_path(self, url: str) -> str:
+        """URL 对应的本地图片路径"""
+        return os.path.join(self.image_dir, os.path.basename(url))
+
+    def is_cached(self, url: str) -> bool:
+        return os.path.basename(url) in self._cached_names
+
+    def mark_cached(self, url: str, cached: bool = True):
+        name = os.path.basename(url)
+        if cached:
+            self._cached_names.add(name)
+        else:
+            self._cached_names.discard(name)
+        self._cached_pool = None
+
+    def iter_urls(self, cached: Optional[bool] = None) -> Iterator[str]:
+        """
+        遍历索引中的 URL
+        Args:
+            cached (bool): True 只返回已下载的，False 只返回未下载的，None 返回全部
+        """
+        packs, _ = self._snapshot
+        for pack in packs:
+            for url in pack:
+                if cached is None or self.is_cached(url) == cached:
+                    yield url
+
+    @property
+    def pack_count(self) -> int:
+        return len(self._snapshot[0])
+
+    @property
+    def cached_count(self) -> int:
+        return len(self._cached_names)
+
+    def __len__(self) -> int:
+        return sum(len(p) for p in self._snapshot[0])
@@ -0,0 +1,203 @@
+import asyncio
+import random
+import time
+from typing import Optional
+
+import aiofiles.os
+import aiohttp
+
+from astrbot.api import logger
+
+from .background_index import BackgroundIndex
+from .fetcher import MAX_BACKGROUND_BYTES, CircuitOpen, ImageFetcher
+from .io_utils import SingleFlight
+
+
+PREFETCH_CONCURRENCY = 2
+PREFETCH_TARGET_READY = 20
+PREFETCH_WARMUP_REQUESTS = 10
+PREFETCH_INTERVAL = 60  # 秒
+# 预取受带宽预算限制，单张图片可能需要较长时间，不使用会话默认的 5 秒总超时
+PREFETCH_TIMEOUT = aiohttp.ClientTimeout(total=300, sock_connect=10, sock_read=30)
+
+
+class BandwidthLimiter:
+    """
+    下载带宽限制(令牌桶)
+    每读取一块数据后调用 consume，超出预算时等待令牌补充；rate 为 0 表示不限速。
+    """
+
+    def __init__(self, rate: float):
+        self.rate = max(0.0, float(rate))  # 字节/秒
+        self._tokens = self.rate
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def consume(self, amount: int):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            # 桶容量为一秒的预算
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            if self._tokens < 0:
+                await asyncio.sleep(-self._tokens / self.rate)
+
+
+class BackgroundPrefetcher:
+    """
+    背景图片预取服务
+    1. 插件启动后在后台持续下载未缓存的背景图片，直到本地可用图片达到目标数量
+    2. 下载并发数和带宽预算可配置，避免和用户请求抢占连接
+    3. 预热阶段：重启后的前 N 次请求只从本地已有的图片中抽取，保证全部命中本地缓存
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        index: BackgroundIndex,
+        concurrency: int = PREFETCH_CONCURRENCY,
+        bandwidth_limit: float = 0,
+        target_ready: int = PREFETCH_TARGET_READY,
+        warmup_requests: int = PREFETCH_WARMUP_REQUESTS,
+        interval: float = PREFETCH_INTERVAL,
+        inflight: Optional[SingleFlight] = None,
+        fetcher: Optional[ImageFetcher] = None,
+        max_bytes: int = MAX_BACKGROUND_BYTES,
+    ):
+        self._fetcher = fetcher or ImageFetcher(session)
+        self.max_bytes = max_bytes
+        # 与用户请求共用的下载合并表，同一张图片不会被同时下载两次
+        self._inflight = inflight or SingleFlight()
+        self.index = index
+        self.concurrency = max(1, int(concurrency))
+        self.limiter = BandwidthLimiter(bandwidth_limit)
+        self.target_ready = max(0, int(target_ready))
+        self.warmup_remaining = max(0, int(warmup_requests))
+        self.interval = interval
+        self.downloaded = 0
+        self.failed = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def start(self):
+        """启动后台预取任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台预取任务并等待正在进行的下载结束"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info("背景预取任务已停止")
+
+    @property
+    def in_warmup(self) -> bool:
+        """是否仍处于预热阶段(请求应只使用本地图片)"""
+        return self.warmup_remaining > 0
+
+    def take_warm_slot(self):
+        """消耗一次预热名额"""
+        if self.warmup_remaining > 0:
+            self.warmup_remaining -= 1
+
+    def wakeup(self):
+        """本地图片减少(例如被清理)时提前唤醒预取"""
+        self._wakeup.set()
+
+    async def _run(self):
+        logger.info("背景预取任务已启动")
+        while True:
+            try:
+                if self.index.needs_refresh():
+                    await asyncio.to_thread(self.index.refresh)
+                await self.fill()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"背景预取出错: {e}")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def fill(self) -> int:
+        """
+        下载未缓存的背景，直到本地可用图片达到目标数量
+        Returns:
+            int: 本轮成功下载的图片数
+        """
+        deficit = self.target_ready - self.index.cached_count
+        if deficit <= 0:
+            return 0
+
+        # 跳过最近返回过 4xx 的链接
+        candidates = [
+            url for url in self.index.iter_urls(cached=False) if not self._fetcher.is_dead(url)
+        ]
+        if not candidates:
+            return 0
+        urls = random.sample(candidates, min(deficit, len(candidates)))
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def _worker(url: str) -> bool:
+            async with semaphore:
+                return await self.download(url)
+
+        results = await asyncio.gather(*(_worker(url) for url in urls))
+        done = sum(1 for r in results if r)
+        if done:
+            logger.info(
+                f"预取背景图片 {done} 张，本地可用 {self.index.cached_count} 张"
+            )
+        return done
+
+    async def download(self, url: str) -> bool:
+        """
+        分块下载一张背景图片，写入临时文件后再重命名
+        Args:
+            url (str): 图片 URL
+        Returns:
+            bool: 是否下载成功
+        """
+        path = self.index.image_path(url)
+        if await aiofiles.os.path.exists(path):
+            self.index.mark_cached(url)
+            return False
+
+        result = await self._inflight.do(("background", url), lambda: self._download(url, path))
+        return result is not None
+
+    async def _download(self, url: str, path: str) -> Optional[str]:
+        try:
+            await self._fetcher.download(
+                url,
+                path,
+                "background",
+                max_bytes=self.max_bytes,
+                timeout=PREFETCH_TIMEOUT,
+                on_chunk=self.limiter.consume,
+            )
+        except CircuitOpen:
+            # 图床熔断期间的请求不会发出，不逐个记录
+            self.failed += 1
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            self.failed += 1
+            logger.warning(f"预取背景图片失败 {url}: {e}")
+            return None
+
+        self.index.mark_cached(url)
+        self.downloaded += 1
+        return path
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from PIL import Image
+
+from astrbot.api import logger
+
+from .io_utils import atomic_write_bytes
+
+
+TEMPLATE_MEMORY_CACHE_SIZE = 16
+TEMPLATE_FORMAT_VERSION = 2
+RAW_SUFFIX = ".rgba"
+COMPRESSED_SUFFIX = ".rgbz"
+COMPRESS_LEVEL = 1  # 背景照片用更高的压缩级别几乎不会更小，只会更慢
+
+# (x, y, 宽, 高, 圆角半径, RGBA 颜色)
+PanelGeometry = Tuple[int, int, int, int, int, Tuple[int, int, int, int]]
+
+
+def template_entry_key(filename: str) -> Optional[str]:
+    """
+    模板目录中文件所属的缓存条目
+    模板文件名为 <背景文件名>.<背景版本>.rgba(或 .rgbz)，同一张背景的模板属于同一条目，
+    条目键就是背景文件名，背景被淘汰时可以按文件名找到它的模板
+    Args:
+        filename (str): 文件名
+    Returns:
+        Optional[str]: 条目键(背景文件名)，不是模板文件时返回 None
+    """
+    if not filename.endswith((RAW_SUFFIX, COMPRESSED_SUFFIX)):
+        return None
+    parts = filename.rsplit(".", 2)
+    if len(parts) != 3 or not parts[0]:
+        return None
+    return parts[0]
+
+
+class BackgroundTemplateStore:
+    """
+    背景模板缓存
+    对同一张背景和同一套尺寸/面板配置，裁切缩放和半透明面板的合成结果永远相同，
+    因此只在第一次使用时生成一次模板，之后每次渲染只需要复制模板再绘制文字和头像。
+
+    1. 磁盘层：模板默认以原始 RGBA 数据保存，读取时通过 mmap 映射，不需要解码；
+       开启压缩时用 zlib 压缩保存，读取时解压
+    2. 内存层：有界 LRU，保存映射(或解压)好的模板图像
+    3. 失效：模板按配置签名分目录存放，配置变化后旧目录在初始化时被删除；
+       同一张背景重新下载后只保留最新的模板
+    4. 容量：目录的大小由插件的磁盘缓存管理器限制，背景图片被淘汰时它的模板也一起删除
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        width: int,
+        height: int,
+        panel: PanelGeometry,
+        max_memory_items: int = TEMPLATE_MEMORY_CACHE_SIZE,
+        purge_stale: bool = True,
+        compress: bool = False,
+    ):
+        self.width = int(width)
+        self.height = int(height)
+        self.panel = panel
+        self.compress = bool(compress)
+        self.suffix = COMPRESSED_SUFFIX if self.compress else RAW_SUFFIX
+        self.max_memory_items = max(0, int(max_memory_items))
+        self.signature = self._signature()
+        self.root_dir = cache_dir
+        self.cache_dir = os.path.join(cache_dir, self.signature)
+        self._memory: "OrderedDict[str, Tuple[Image.Image, Optional[mmap.mmap]]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if purge_stale:
+            self._purge_stale()
+
+    def _signature(self) -> str:
+        config = [
+            TEMPLATE_FORMAT_VERSION,
+            self.width,
+            self.height,
+            list(self.panel),
+            self.compress,
+        ]
+        raw = json.dumps(config, separators=(",", ":"), default=list)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+    def _purge_stale(self):
+        """删除其他配置签名下的旧模板"""
+        for name in os.listdir(self.root_dir):
+            full = os.path.join(self.root_dir, name)
+            if name != self.signature and os.path.isdir(full):
+                shutil.rmtree(full, ignore_errors=True)
+                logger.info(f"配置已变化，删除旧的背景模板目录: {name}")
+
+    def _key(self, background_path: str) -> Optional[str]:
+        # 文件名 + 大小 + 修改时间，背景被重新下载后自动生成新模板
+        try:
+            st = os.stat(background_path)
+        except OSError:
+            return None
+        version = hashlib.sha1(f"{st.st_size}:{st.st_mtime_ns}".encode("utf-8"))
+        return f"{os.path.basename(background_path)}.{version.hexdigest()[:16]}"
+
+    def _template_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def has(self, background_path: str) -> bool:
+        """背景的模板是否已经生成"""
+        key = self._key(background_path)
+        return key is not None and (
+            key in self._memory or os.path.exists(self._template_path(key))
+        )
+
+    def discard(self, background_name: str, keep: Optional[str] = None):
+        """
+        删除一张背景的模板
+        Args:
+            background_name (str): 背景文件名
+            keep (str): 需要保留的模板文件名(背景重新下载后保留新版本)
+        """
+        with self._lock:
+            for key in list(self._memory):
+                name = key + self.suffix
+                if name != keep and template_entry_key(name) == background_name:
+                    del self._memory[key]
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if name != keep and template_entry_key(name) == background_name:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    def _load(self, path: str) -> Optional[Tuple[Image.Image, Optional[mmap.mmap]]]:
+        if self.compress:
+            return self._load_compressed(path)
+        expected = self.width * self.height * 4
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size != expected:
+                    return None
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        image = Image.frombuffer(
+            "RGBA", (self.width, self.height), mapped, "raw", "RGBA", 0, 1
+        )
+        return image, mapped
+
+    def _load_compressed(self, path: str) -> Optional[Tuple[Image.Image, None]]:
+        try:
+            with open(path, "rb") as f:
+                data = zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            return None
+        if len(data) != self.width * self.height * 4:
+            return None
+        return Image.frombytes("RGBA", (self.width, self.height), data), None
+
+    def _save(self, path: str, image: Image.Image):
+        # 先写临时文件再替换，避免其他线程映射到写了一半的模板
+        data = image.tobytes("raw", "RGBA")
+        if self.compress:
+            data = zlib.compress(data, COMPRESS_LEVEL)
+        atomic_write_bytes(path, data)
+
+    def _remember(self, key: str, item: Tuple[Image.Image, Optional[mmap.mmap]]):
+        if self.max_memory_items <= 0:
+            return
+        with self._lock:
+            self._memory[key] = item
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+    def get(
+        self,
+        background_path: str,
+        build: Callable[[str], Optional[Image.Image]],
+    ) -> Optional[Image.Image]:
+        """
+        获取背景模板的可写副本
+        参数：
+            background_path (str): 背景图片路径
+            build: 模板不存在时调用，返回裁切好并合成了面板的 RGBA 图像
+        返回：
+            Image.Image: 模板副本，可以直接在上面绘制；生成失败时返回 None
+        """
+        key = self._key(background_path)
+        if key is None:
+            return build(background_path)
+
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                self._memory.move_to_end(key)
+                return item[0].copy()
+
+        path = self._template_path(key)
+        item = self._load(path)
+        if item is None:
+            image = build(background_path)
+            if image is None:
+                return None
+            if image.mode != "RGBA" or image.size != (self.width, self.height):
+                # 尺寸不符的模板不落盘，直接使用
+                return image
+            try:
+                self._save(path, image)
+            except OSError as e:
+                logger.warning(f"保存背景模板失败: {e}")
+                return image
+            # 同一张背景的旧版本模板已经用不到了
+            self.discard(os.path.basename(background_path), keep=os.path.basename(path))
+            item = self._load(path)
+            if item is None:
+                return image
+
+        self._remember(key, item)
+        return item[0].copy()
+
+    def clear(self):
+        """清空内存层(已映射的模板由垃圾回收释放)"""
+        with self._lock:
+            self._memory.clear()
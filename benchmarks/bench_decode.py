@@ -0,0 +1,192 @@
+"""
+背景解码基准测试：对比 crop_center 的旧实现(全分辨率解码并转换为 RGBA 后再缩放裁切)
+和当前实现(JPEG 按比例解码、只对裁切区域重采样和转换)的耗时、内存峰值和输出差异
+
+每种情况在独立的子进程中运行，内存峰值取子进程的常驻内存峰值减去解码前的值(Linux 上最准确)。
+需要在安装了 AstrBot 的 Python 环境中运行(渲染器使用 astrbot 的 logger)。
+
+用法(在插件目录下执行)：
+    python benchmarks/bench_decode.py
+    python benchmarks/bench_decode.py --rounds 5 --image 某张壁纸.jpg
+"""
+
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageChops, ImageStat
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+PACKAGE = os.path.basename(PLUGIN_DIR)
+
+IMAGE_WIDTH = 1080
+IMAGE_HEIGHT = 1920
+SYNTHETIC_SIZES = {
+    "4k_jpeg": ((3840, 2160), "JPEG"),
+    "4k_portrait_jpeg": ((2160, 3840), "JPEG"),
+    "8k_jpeg": ((7680, 4320), "JPEG"),
+    "4k_png": ((3840, 2160), "PNG"),
+    "small_jpeg": ((720, 1280), "JPEG"),
+}
+
+
+def legacy_crop_center(image_path: str, width: int, height: int) -> Image.Image:
+    """改动之前的 crop_center"""
+    img = Image.open(image_path).convert("RGBA")
+    img_width, img_height = img.size
+    if img_width < width or img_height < height:
+        scale = max(width / img_width, height / img_height)
+        img = img.resize((int(img_width * scale), int(img_height * scale)), Image.LANCZOS)
+    else:
+        max_scale = 1.8
+        if img_width > width * max_scale or img_height > height * max_scale:
+            scale = min((width * max_scale) / img_width, (height * max_scale) / img_height)
+            img = img.resize(
+                (int(img_width * scale), int(img_height * scale)), Image.LANCZOS
+            )
+    img_width, img_height = img.size
+    return img.crop(
+        (
+            (img_width - width) / 2,
+            (img_height - height) / 2,
+            (img_width + width) / 2,
+            (img_height + height) / 2,
+        )
+    )
+
+
+def make_renderer():
+    renderer_module = importlib.import_module(f"{PACKAGE}.renderer")
+    return renderer_module.PosterRenderer(
+        {
+            "font_path": os.path.join(PLUGIN_DIR, "font", "千图马克手写体.ttf"),
+            "jrys_path": None,
+            "image_width": IMAGE_WIDTH,
+            "image_height": IMAGE_HEIGHT,
+            "avatar_position": (60, 1350),
+            "avatar_size": (150, 150),
+            "date_y": 1300,
+            "summary_y": 1400,
+            "lucky_star_y": 1500,
+            "sign_text_y": 1600,
+            "unsign_text_y": 1700,
+            "warning_text_y": 1850,
+            "panel_geometry": (0, 1270, IMAGE_WIDTH, 700, 50, (0, 0, 0, 128)),
+        }
+    )
+
+
+def reset_peak_rss():
+    """重置常驻内存峰值(Linux)，子进程从父进程继承的峰值不计入"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def run_child(method: str, path: str, rounds: int, output: str):
+    """子进程：重复解码 rounds 次，输出耗时和内存峰值"""
+    crop = legacy_crop_center
+    if method == "current":
+        crop = make_renderer().crop_center
+    reset_peak_rss()
+    baseline = peak_rss_mb()
+    times = []
+    image = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        image = crop(path, IMAGE_WIDTH, IMAGE_HEIGHT)
+        times.append((time.perf_counter() - start) * 1000)
+    image.save(output)
+    print(json.dumps({"times": times, "peak_mb": peak_rss_mb() - baseline}))
+
+
+def make_synthetic(directory: str) -> dict:
+    paths = {}
+    for name, (size, fmt) in SYNTHETIC_SIZES.items():
+        path = os.path.join(directory, f"{name}.{fmt.lower()}")
+        image = Image.effect_mandelbrot(size, (-2.0, -1.2, 0.8, 1.2), 80).convert("RGB")
+        if fmt == "JPEG":
+            image.save(path, format=fmt, quality=90)
+        else:
+            image.save(path, format=fmt)
+        paths[name] = path
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--image", action="append", help="额外测试的图片，可以重复")
+    parser.add_argument("--child", nargs=3, metavar=("METHOD", "PATH", "OUTPUT"))
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.rounds, args.child[2])
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cases = make_synthetic(workdir)
+        for path in args.image or []:
+            cases[os.path.basename(path)] = path
+
+        print(f"{'图片':<20}{'方法':<10}{'中位数(ms)':>12}{'内存峰值(MB)':>14}{'平均差异':>10}")
+        for name, path in cases.items():
+            outputs = {}
+            for method in ("legacy", "current"):
+                output = os.path.join(workdir, f"{name}.{method}.png")
+                result = subprocess.run(
+                    [
+                        sys.executable,
+                        os.path.abspath(__file__),
+                        "--rounds",
+                        str(args.rounds),
+                        "--child",
+                        method,
+                        path,
+                        output,
+                    ],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+                stats = json.loads(result.stdout.strip().splitlines()[-1])
+                outputs[method] = output
+                diff = ""
+                if method == "current":
+                    # 与旧实现输出的平均像素差(0-255)
+                    with Image.open(outputs["legacy"]) as a, Image.open(output) as b:
+                        delta = ImageChops.difference(a.convert("RGB"), b.convert("RGB"))
+                        diff = f"{statistics.mean(ImageStat.Stat(delta).mean):.2f}"
+                print(
+                    f"{name:<20}{method:<10}{statistics.median(stats['times']):>12.1f}"
+                    f"{stats['peak_mb']:>14.1f}{diff:>10}"
+                )
+
+
+if __name__ == "__main__":
+    main()
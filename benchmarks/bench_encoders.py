@@ -0,0 +1,74 @@
+"""
+编码配置基准测试：对每个编码配置报告编码耗时和输出大小
+
+用法(在插件目录下执行)：
+    python benchmarks/bench_encoders.py --rounds 10
+    python benchmarks/bench_encoders.py --image 某张已生成的海报.jpg
+"""
+
+import argparse
+import os
+import statistics
+import sys
+
+from PIL import Image, ImageDraw, ImageFont
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PLUGIN_DIR)
+
+from encoders import ENCODER_PROFILES, encode_image  # noqa: E402
+
+FONT_PATH = os.path.join(PLUGIN_DIR, "font", "千图马克手写体.ttf")
+
+
+def synthetic_poster(width: int, height: int) -> Image.Image:
+    """生成与海报结构相近的测试图：细节丰富的背景 + 半透明面板 + 文字"""
+    image = Image.effect_mandelbrot(
+        (width, height), (-2.0, -1.5, 1.0, 1.5), 60
+    ).convert("RGBA")
+    overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    panel_y = height * 2 // 3
+    draw.rounded_rectangle((0, panel_y, width, height), 50, fill=(0, 0, 0, 128))
+    image = Image.alpha_composite(image, overlay)
+
+    try:
+        font = ImageFont.truetype(FONT_PATH, 36)
+    except OSError:
+        font = ImageFont.load_default()
+    draw = ImageDraw.Draw(image)
+    for i in range(6):
+        draw.text((40, panel_y + 40 + i * 60), "今日运势 大吉 ★★★★★☆☆", font=font)
+    return image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=10, help="每个编码配置编码的次数")
+    parser.add_argument("--image", help="使用已有的海报代替合成图")
+    parser.add_argument("--width", type=int, default=1080)
+    parser.add_argument("--height", type=int, default=1920)
+    args = parser.parse_args()
+
+    if args.image:
+        image = Image.open(args.image).convert("RGBA")
+    else:
+        image = synthetic_poster(args.width, args.height)
+
+    print(f"海报 {image.width}x{image.height}，每个编码配置 {args.rounds} 次")
+    for name, profile in ENCODER_PROFILES.items():
+        timings = []
+        size = 0
+        for _ in range(args.rounds):
+            poster = encode_image(image, profile)
+            timings.append(poster.encode_ms)
+            size = len(poster.data)
+        print(
+            f"{name:<8} {profile.format:<5} 平均 {statistics.mean(timings):7.2f} ms"
+            f"  中位数 {statistics.median(timings):7.2f} ms"
+            f"  大小 {size / 1024:7.1f} KB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+渐变文字基准测试：对比字形蒙版缓存开启前后，每张海报绘制日期行和幸运星行的耗时
+
+用法(在插件目录下执行)：
+    python benchmarks/bench_gradient_text.py --rounds 50
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from PIL import Image, ImageDraw, ImageFont
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PLUGIN_DIR)
+
+from gradient_text import GlyphMaskCache, draw_gradient_line  # noqa: E402
+
+FONT_PATH = os.path.join(PLUGIN_DIR, "font", "千图马克手写体.ttf")
+LIGHT_COLORS = [
+    (255, 250, 205),
+    (173, 216, 230),
+    (221, 160, 221),
+    (255, 182, 193),
+    (240, 230, 140),
+    (224, 255, 255),
+    (245, 245, 220),
+    (230, 230, 250),
+]
+
+
+def light_colors():
+    return random.choices(LIGHT_COLORS, k=4)
+
+
+def draw_centered(img, text, font, y, cache):
+    draw = ImageDraw.Draw(img)
+    bbox = draw.textbbox((0, 0), text, font=font)
+    x = (img.width - (bbox[2] - bbox[0])) // 2 - bbox[0]
+    draw_gradient_line(img, text, font, x, y, light_colors, cache)
+
+
+def run(rounds: int, cache: GlyphMaskCache, fonts) -> list:
+    date = datetime.now().strftime("%Y/%m/%d")
+    stars = "★★★★★★☆"
+    canvas = Image.new("RGBA", (1080, 1920), (40, 40, 40, 255))
+    timings = []
+    for _ in range(rounds):
+        img = canvas.copy()
+        start = time.perf_counter()
+        draw_centered(img, date, fonts[50], 1300, cache)
+        draw_centered(img, stars, fonts[60], 1500, cache)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=50, help="每种模式绘制的海报数量")
+    parser.add_argument("--font", default=FONT_PATH, help="字体文件路径")
+    args = parser.parse_args()
+
+    fonts = {size: ImageFont.truetype(args.font, size) for size in (50, 60)}
+
+    results = {
+        # 不保存任何字形，每个字符都重新光栅化，等价于加缓存之前的行为
+        "无缓存(之前)": run(args.rounds, GlyphMaskCache(max_items=0), fonts),
+        "字形缓存(之后)": run(args.rounds, GlyphMaskCache(), fonts),
+    }
+
+    print(f"渐变文字行(日期 + 幸运星)，每种模式 {args.rounds} 张海报")
+    for name, timings in results.items():
+        print(
+            f"{name:<12} 平均 {statistics.mean(timings):7.2f} ms"
+            f"  中位数 {statistics.median(timings):7.2f} ms"
+            f"  最小 {min(timings):7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
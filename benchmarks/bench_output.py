@@ -0,0 +1,80 @@
+"""
+海报发送路径基准测试：对比每次请求写临时文件再删除(之前)、spool 目录写入和直接 base64 编码的耗时
+
+用法(在插件目录下执行)：
+    python benchmarks/bench_output.py --rounds 200 --size-kb 300
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+import aiofiles
+import aiofiles.os
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PLUGIN_DIR)
+
+from io_utils import async_atomic_write  # noqa: E402
+
+
+async def temp_file(poster: bytes, spool_dir: str):
+    # 之前的做法：mkstemp 写入，发送后立即删除
+    fd, path = tempfile.mkstemp(suffix=".jpg")
+    os.close(fd)
+    async with aiofiles.open(path, "wb") as f:
+        await f.write(poster)
+    await aiofiles.os.remove(path)
+
+
+async def spool_file(poster: bytes, spool_dir: str):
+    # 不支持 base64 的平台：写入 spool 目录，由后台任务统一清理
+    path = os.path.join(spool_dir, f"{uuid.uuid4().hex}.jpg")
+    await async_atomic_write(path, poster)
+
+
+async def in_memory(poster: bytes, spool_dir: str):
+    # 支持 base64 的平台：Image.fromBytes 最终只做一次 base64 编码
+    base64.b64encode(poster)
+
+
+async def run(func, rounds: int, poster: bytes, spool_dir: str) -> list:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await func(poster, spool_dir)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=200, help="每种方式发送的海报数量")
+    parser.add_argument("--size-kb", type=int, default=300, help="模拟海报的大小(KB)")
+    args = parser.parse_args()
+
+    poster = os.urandom(args.size_kb * 1024)
+    with tempfile.TemporaryDirectory() as spool_dir:
+        results = {
+            "临时文件(之前)": await run(temp_file, args.rounds, poster, spool_dir),
+            "spool 目录": await run(spool_file, args.rounds, poster, spool_dir),
+            "内存 base64": await run(in_memory, args.rounds, poster, spool_dir),
+        }
+
+    print(f"海报发送路径，{args.size_kb} KB，每种方式 {args.rounds} 次")
+    for name, timings in results.items():
+        print(
+            f"{name:<12} 平均 {statistics.mean(timings):7.3f} ms"
+            f"  中位数 {statistics.median(timings):7.3f} ms"
+            f"  最大 {max(timings):7.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
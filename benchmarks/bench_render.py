@@ -0,0 +1,399 @@
+"""
+渲染流程基准测试：离线渲染 jrys.json 中的每一条运势，统计各阶段耗时、内存峰值和输出大小
+
+背景使用合成图片，分为三种尺寸：比海报小(需要放大)、接近海报尺寸、超过海报 1.8 倍(需要缩小)。
+需要在安装了 AstrBot 的 Python 环境中运行(渲染器使用 astrbot 的 logger)。
+
+用法(在插件目录下执行)：
+    python benchmarks/bench_render.py
+    python benchmarks/bench_render.py --limit 20 --output bench_results.json
+    python benchmarks/bench_render.py --output new.json --compare old.json
+    python benchmarks/bench_render.py --render-profiles standard,fast  # 对比不同画布尺寸
+
+各阶段耗时是包含关系：draw_text 包含它内部的 layout_text，模板生成包含 crop_center 和 add_transparent_layer。
+
+内存有三个数字：
+    常驻内存增量峰值：单独渲染并编码一次期间，进程常驻内存(RSS)相对开始时的最大增量，
+                      包含 Pillow 的像素缓冲区，每 1 ms 采样一次(仅 Linux)；
+                      glibc 下测量前固定 mmap 阈值并归还空闲内存，否则之前释放的内存被复用，增量偏小
+    Python 分配峰值：tracemalloc 统计的同一次渲染的峰值，只包含 Python 对象，不含像素缓冲区
+    进程常驻内存峰值：整个基准测试进程的 RSS 峰值(ru_maxrss)
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import functools
+import importlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+
+import PIL
+from PIL import Image
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+
+# 插件模块之间使用相对导入，需要按包导入
+PACKAGE = os.path.basename(PLUGIN_DIR)
+renderer_module = importlib.import_module(f"{PACKAGE}.renderer")
+encoders = importlib.import_module(f"{PACKAGE}.encoders")
+layout_module = importlib.import_module(f"{PACKAGE}.layout")
+
+BACKGROUND_SIZES = {
+    "small": (720, 1280),  # 比海报小，需要放大
+    "near": (1200, 2100),  # 接近海报尺寸
+    "large": (2160, 3840),  # 超过 1.8 倍，需要缩小
+}
+
+
+def renderer_config(size, template_dir=None) -> dict:
+    """与 main.py 中的默认配置一致，版式按画布尺寸缩放"""
+    layout = layout_module.REFERENCE_LAYOUT.scaled(*size)
+    return {
+        "font_path": os.path.join(PLUGIN_DIR, "font", "千图马克手写体.ttf"),
+        "jrys_path": os.path.join(PLUGIN_DIR, "jrys.json"),
+        "jrys_cache_path": None,
+        "template_dir": template_dir,
+        **layout._asdict(),
+    }
+
+
+def make_assets(directory: str) -> dict:
+    """生成合成背景和头像"""
+    paths = {}
+    for name, size in BACKGROUND_SIZES.items():
+        path = os.path.join(directory, f"bg_{name}.jpg")
+        image = Image.effect_mandelbrot(size, (-2.0, -1.5, 1.0, 1.5), 60)
+        image.convert("RGB").save(path, quality=90)
+        paths[name] = path
+    avatar = os.path.join(directory, "avatar.jpg")
+    Image.radial_gradient("L").resize((640, 640)).convert("RGB").save(avatar)
+    paths["avatar"] = avatar
+    return paths
+
+
+class StageTimer:
+    """包装渲染器的方法，记录每次调用的耗时(毫秒)"""
+
+    def __init__(self):
+        self.timings = defaultdict(list)
+
+    def wrap(self, name, func, classify=None):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stage = classify(args, kwargs) if classify else name
+                self.timings[stage].append((time.perf_counter() - start) * 1000)
+
+        return timed
+
+
+def instrument(renderer, timer: StageTimer):
+    for name in (
+        "crop_center",
+        "add_transparent_layer",
+        "_build_background_template",
+        "draw_avatar_img",
+    ):
+        setattr(renderer, name, timer.wrap(name, getattr(renderer, name)))
+    renderer.draw_text = timer.wrap(
+        "draw_text",
+        renderer.draw_text,
+        lambda args, kwargs: (
+            "draw_text[gradient]" if kwargs.get("gradients") else "draw_text[plain]"
+        ),
+    )
+    renderer_module.layout_text = timer.wrap("layout_text", renderer_module.layout_text)
+
+
+def summarize(values) -> dict:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.mean(ordered),
+        "median_ms": statistics.median(ordered),
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "min_ms": ordered[0],
+        "total_ms": sum(ordered),
+    }
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 的单位是 KB，macOS 是字节
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def current_rss_mb():
+    """当前进程的常驻内存(MB)，不支持的平台返回 None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def load_glibc():
+    name = ctypes.util.find_library("c")
+    if not name or not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(name)
+        libc.mallopt, libc.malloc_trim
+    except (OSError, AttributeError):  # 不是 glibc
+        return None
+    return libc
+
+
+LIBC = load_glibc()
+
+
+def fix_mmap_threshold():
+    """
+    固定 glibc 的 mmap 阈值(默认会随释放的大块内存动态升高)，
+    使像素缓冲区这样的大块内存用 mmap 分配、释放后立即归还系统，常驻内存增量才能反映每次渲染的用量
+    """
+    if LIBC is not None:
+        LIBC.mallopt(-3, 128 * 1024)  # M_MMAP_THRESHOLD
+
+
+def release_free_memory():
+    """把堆中空闲的内存归还系统，之后复用这部分内存也会体现为常驻内存的增长"""
+    if LIBC is not None:
+        LIBC.malloc_trim(0)
+
+
+class RssSampler:
+    """在后台线程中采样常驻内存，记录相对开始时的最大增量"""
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.base = None
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.is_set():
+            rss = current_rss_mb()
+            self.peak = max(self.peak, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.base = current_rss_mb()
+        if self.base is not None:
+            self.peak = self.base
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, current_rss_mb())
+
+    @property
+    def delta_mb(self):
+        if self.base is None:
+            return None
+        return self.peak - self.base
+
+
+def bench_background(renderer, timer, entries, background, avatar, profiles) -> dict:
+    timer.timings = defaultdict(list)
+    sizes = defaultdict(list)
+    date = datetime.now().strftime("%Y/%m/%d")
+
+    for entry in entries:
+        spec = renderer_module.RenderSpec(
+            entry.bucket, entry.index, background, avatar, date
+        )
+        start = time.perf_counter()
+        image = renderer.render(spec)
+        timer.timings["render"].append((time.perf_counter() - start) * 1000)
+        if image is None:
+            raise RuntimeError(f"渲染失败: {entry.bucket}/{entry.index}")
+        for profile in profiles:
+            poster = encoders.encode_image(image, profile)
+            timer.timings[f"encode[{profile.name}]"].append(poster.encode_ms)
+            sizes[profile.name].append(len(poster.data))
+
+    return {
+        "stages": {name: summarize(values) for name, values in timer.timings.items()},
+        "output_bytes": {
+            name: {"mean": statistics.mean(values), "max": max(values)}
+            for name, values in sizes.items()
+        },
+    }
+
+
+def measure_memory(renderer, entry, background, avatar, profile) -> dict:
+    """
+    单独渲染并编码一次，测量内存峰值
+    在所有耗时测量完成后调用：固定 mmap 阈值和采样线程都会影响耗时
+    """
+    spec = renderer_module.RenderSpec(entry.bucket, entry.index, background, avatar, "2000/01/01")
+    release_free_memory()
+    with RssSampler() as rss:
+        image = renderer.render(spec)
+        encoders.encode_image(image, profile)
+    del image
+
+    # tracemalloc 只统计 Python 分配，不含 Pillow 的像素缓冲区
+    tracemalloc.start()
+    image = renderer.render(spec)
+    encoders.encode_image(image, profile)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"rss_peak_delta_mb": rss.delta_mb, "python_peak_mb": peak / 1024 / 1024}
+
+
+def print_results(results: dict, baseline: dict = None):
+    for bg_name, result in results["backgrounds"].items():
+        size = "x".join(map(str, BACKGROUND_SIZES[bg_name]))
+        memory = f"Python 分配峰值 {result['python_peak_mb']:.1f} MB"
+        if result.get("rss_peak_delta_mb") is not None:
+            memory = f"常驻内存增量峰值 {result['rss_peak_delta_mb']:.1f} MB，" + memory
+        print(f"\n背景 {bg_name} ({size})，{memory}")
+        base_stages = {}
+        if baseline:
+            base_stages = baseline.get("backgrounds", {}).get(bg_name, {}).get("stages", {})
+        for stage, stats in result["stages"].items():
+            line = (
+                f"  {stage:<28} 平均 {stats['mean_ms']:8.2f} ms"
+                f"  中位数 {stats['median_ms']:8.2f} ms"
+                f"  p95 {stats['p95_ms']:8.2f} ms  次数 {stats['count']}"
+            )
+            base = base_stages.get(stage)
+            if base and base["mean_ms"] > 0:
+                change = (stats["mean_ms"] - base["mean_ms"]) / base["mean_ms"]
+                line += f"  对比 {change:+.1%}"
+            print(line)
+        for name, stats in result["output_bytes"].items():
+            print(f"  输出[{name}] 平均 {stats['mean'] / 1024:.1f} KB  最大 {stats['max'] / 1024:.1f} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--limit", type=int, default=0, help="每种背景最多渲染的运势条数，0 表示全部")
+    parser.add_argument(
+        "--backgrounds",
+        default=",".join(BACKGROUND_SIZES),
+        help="要测试的背景尺寸，逗号分隔",
+    )
+    parser.add_argument(
+        "--profiles",
+        default=",".join(encoders.ENCODER_PROFILES),
+        help="要测试的编码配置，逗号分隔",
+    )
+    parser.add_argument(
+        "--render-profiles",
+        default="standard",
+        help="要测试的渲染尺寸配置，逗号分隔，例如 standard,fast",
+    )
+    parser.add_argument("--templates", action="store_true", help="开启背景模板缓存")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果对比")
+    args = parser.parse_args()
+
+    profiles = [encoders.ENCODER_PROFILES[name] for name in args.profiles.split(",")]
+
+    render_profiles = args.render_profiles.split(",")
+    for name in render_profiles:
+        if layout_module.get_render_size(name) is None:
+            sys.exit(f"未知的渲染尺寸配置 {name}")
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "templates": bool(args.templates),
+        "render_profiles": {},
+    }
+    memory_runs = []  # (结果, 渲染器, 运势, 背景)，耗时全部测完后再测内存
+    with tempfile.TemporaryDirectory() as workdir:
+        assets = make_assets(workdir)
+        for name in render_profiles:
+            size = layout_module.get_render_size(name)
+            template_dir = os.path.join(workdir, f"templates_{name}") if args.templates else None
+            renderer = renderer_module.PosterRenderer(renderer_config(size, template_dir))
+            timer = StageTimer()
+            instrument(renderer, timer)
+            entries = list(renderer.fortunes.load().entries)
+            if args.limit > 0:
+                entries = entries[: args.limit]
+            if not entries:
+                sys.exit("jrys.json 中没有运势数据")
+
+            # 预热一次：加载字形、排版缓存等一次性开销不计入结果
+            first = entries[0]
+            renderer.render(
+                renderer_module.RenderSpec(
+                    first.bucket, first.index, assets["near"], assets["avatar"], "2000/01/01"
+                )
+            )
+
+            result = {"size": list(size), "entries": len(entries), "backgrounds": {}}
+            for bg_name in args.backgrounds.split(","):
+                result["backgrounds"][bg_name] = bench_background(
+                    renderer, timer, entries, assets[bg_name], assets["avatar"], profiles
+                )
+                memory_runs.append(
+                    (result["backgrounds"][bg_name], renderer, first, assets[bg_name])
+                )
+            results["render_profiles"][name] = result
+
+        fix_mmap_threshold()
+        for result, renderer, entry, background in memory_runs:
+            result.update(
+                measure_memory(renderer, entry, background, assets["avatar"], profiles[0])
+            )
+        results["peak_rss_mb"] = peak_rss_mb()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print(f"模板缓存 {'开启' if args.templates else '关闭'}")
+    for name, result in results["render_profiles"].items():
+        size = "x".join(map(str, result["size"]))
+        print(f"\n===== 渲染尺寸 {name} ({size})，共 {result['entries']} 条运势 =====")
+        base = None
+        if baseline:
+            # 旧格式的结果没有按渲染尺寸分组，都是 standard
+            base = baseline.get("render_profiles", {}).get(name)
+            if base is None and name == "standard" and "backgrounds" in baseline:
+                base = baseline
+        print_results(result, base)
+    if results.get("peak_rss_mb"):
+        print(f"\n进程常驻内存峰值 {results['peak_rss_mb']:.1f} MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+午夜预渲染调度检查：向 PrerenderScheduler 注入假的时钟、计时器和休眠函数，
+不需要等到午夜就能走完"等待午夜 -> 预渲染一轮 -> 等待下一个午夜"的流程，检查：
+    1. next_run_at 在午夜前后和边界时刻算出的下一次运行时间
+    2. 调度循环第一次和第二次等待的时长
+    3. 只为 max_age_days 内活跃过的用户预渲染，最近活跃的在前，过期用户被删除
+    4. 有用户请求时按 BUSY_POLL_INTERVAL 暂停，每张渲染后按 cpu_budget 休眠
+    5. 预渲染失败或已有缓存的用户计入 skipped
+
+任何一项不符合预期时以非零状态退出，可以在修改 prerender.py 后运行。
+需要在安装了 AstrBot 的 Python 环境中运行(调度器使用 astrbot 的 logger)。
+
+用法(在插件目录下执行)：
+    python benchmarks/check_prerender_schedule.py
+"""
+
+import asyncio
+import importlib
+import os
+import sys
+from datetime import datetime
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+
+# 插件模块之间使用相对导入，需要按包导入
+PACKAGE = os.path.basename(PLUGIN_DIR)
+prerender = importlib.import_module(f"{PACKAGE}.prerender")
+
+DELAY = 120
+CPU_BUDGET = 0.25
+RENDER_SECONDS = 0.3  # 假的渲染耗时
+BUSY_CHECKS = 2  # 第一张渲染前有几次检查时有用户请求
+HOUR = 3600
+DAY = 86400
+
+
+def local(*args) -> float:
+    return datetime(*args).timestamp()
+
+
+class FakeTime:
+    """假的时钟：休眠和渲染只推进时间，不真正等待"""
+
+    def __init__(self, now: float):
+        self.now = now
+        self.sleeps = []
+        self.max_waits = 2  # 第几次长时间等待时结束调度循环
+
+    def clock(self) -> float:
+        return self.now
+
+    def timer(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        if seconds >= HOUR and sum(s >= HOUR for s in self.sleeps) >= self.max_waits:
+            raise asyncio.CancelledError()
+        self.now += seconds
+
+
+class Checker:
+    def __init__(self):
+        self.failed = 0
+
+    def check(self, name: str, actual, expected, tolerance: float = 1e-6):
+        if isinstance(expected, float):
+            ok = abs(actual - expected) <= tolerance
+        else:
+            ok = actual == expected
+        if not ok:
+            self.failed += 1
+        result = "通过" if ok else "失败"
+        hint = "" if ok else f"，应为 {expected!r}"
+        print(f"{result}  {name}: {actual!r}{hint}")
+
+
+def check_next_run_at(c: Checker):
+    c.check(
+        "午夜前",
+        prerender.next_run_at(local(2026, 10, 18, 23, 59), DELAY),
+        local(2026, 10, 19, 0, 2),
+    )
+    c.check(
+        "午夜后、运行时间前",
+        prerender.next_run_at(local(2026, 10, 19, 0, 1), DELAY),
+        local(2026, 10, 19, 0, 2),
+    )
+    c.check(
+        "恰好在运行时间",
+        prerender.next_run_at(local(2026, 10, 19, 0, 2), DELAY),
+        local(2026, 10, 20, 0, 2),
+    )
+
+
+async def check_scheduler(c: Checker):
+    start = local(2026, 10, 18, 22, 0)
+    fake = FakeTime(start)
+    busy_checks = [0]
+
+    def busy() -> bool:
+        busy_checks[0] += 1
+        return busy_checks[0] <= BUSY_CHECKS
+
+    calls = []
+
+    async def render(user_id: str, encoder: str) -> bool:
+        calls.append((user_id, encoder))
+        fake.now += RENDER_SECONDS
+        if user_id == "broken":
+            raise RuntimeError("渲染失败")
+        return user_id != "cached"
+
+    users = prerender.ActiveUsers(max_users=10, max_age_days=3)
+    scheduler = prerender.PrerenderScheduler(
+        users,
+        render,
+        busy=busy,
+        cpu_budget=CPU_BUDGET,
+        delay=DELAY,
+        clock=fake.clock,
+        sleep=fake.sleep,
+        timer=fake.timer,
+    )
+    # stale 到第一次运行(次日 00:02)时已超过 3 天没有活跃；recent 通过调度器按假时钟记录
+    users.touch("stale", "default", start - 4 * DAY)
+    users.touch("old", "small", start - 2 * DAY)
+    users.touch("cached", "default", start - DAY)
+    users.touch("broken", "default", start - 2 * HOUR)
+    scheduler.touch("recent", "small")
+
+    try:
+        await scheduler._run()
+    except asyncio.CancelledError:
+        pass
+
+    first_run = local(2026, 10, 19, 0, 2)
+    c.check("第一次等待(秒)", fake.sleeps[0], first_run - start)
+    c.check("运行时间", scheduler.last_run, first_run)
+    c.check(
+        "预渲染顺序",
+        calls,
+        [("recent", "small"), ("broken", "default"), ("cached", "default"), ("old", "small")],
+    )
+    c.check("过期用户已删除", len(users), 4)
+    c.check("生成/跳过", (scheduler.rendered, scheduler.skipped), (2, 2))
+
+    rest = RENDER_SECONDS * (1 - CPU_BUDGET) / CPU_BUDGET
+    expected = [prerender.BUSY_POLL_INTERVAL] * BUSY_CHECKS + [rest] * len(calls)
+    c.check(
+        "忙碌暂停和预算休眠",
+        [round(s, 6) for s in fake.sleeps[1:-1]],
+        [round(s, 6) for s in expected],
+    )
+
+    busy_time = prerender.BUSY_POLL_INTERVAL * BUSY_CHECKS
+    round_time = busy_time + (RENDER_SECONDS + rest) * len(calls)
+    c.check("第二次等待(秒)", fake.sleeps[-1], DAY - round_time, tolerance=1e-3)
+
+
+def main():
+    c = Checker()
+    check_next_run_at(c)
+    asyncio.run(check_scheduler(c))
+    if c.failed:
+        print(f"{c.failed} 项检查失败")
+        sys.exit(1)
+    print("全部通过")
+
+
+if __name__ == "__main__":
+    main()
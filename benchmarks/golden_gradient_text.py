@@ -0,0 +1,165 @@
+"""
+渐变文字对照测试：用固定的随机种子，分别以旧实现(逐字符逐列画线生成渐变，每个字符单独贴图)
+和当前实现(整行拼好蒙版和颜色后一次贴图)绘制日期行和幸运星行，逐像素比较结果并对比耗时
+
+两者的差异超过容差时以非零状态退出，可以在修改渐变文字的代码后运行。
+
+用法(在插件目录下执行)：
+    python benchmarks/golden_gradient_text.py
+    python benchmarks/golden_gradient_text.py --save /tmp/gradient  # 同时保存两种结果和差异图
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PLUGIN_DIR)
+
+from gradient_text import GlyphMaskCache, draw_gradient_line  # noqa: E402
+
+FONT_PATH = os.path.join(PLUGIN_DIR, "font", "千图马克手写体.ttf")
+LIGHT_COLORS = [
+    (255, 250, 205),
+    (173, 216, 230),
+    (221, 160, 221),
+    (255, 182, 193),
+    (240, 230, 140),
+    (224, 255, 255),
+    (245, 245, 220),
+    (230, 230, 250),
+]
+# (文字, 字号, y)：海报上的日期行和幸运星行，再加几行覆盖更多字形
+LINES = [
+    ("2026/10/18", 50, 1300),
+    ("★★★★★★☆", 60, 1500),
+    ("★★☆☆☆☆☆", 60, 1580),
+    ("今日运势 大吉", 60, 1660),
+    ("Lucky 7 - AVWA.", 50, 1760),
+]
+
+# 容差：平均差异(0-255)和差异超过 8 的像素比例
+MAX_MEAN_DIFF = 0.05
+MAX_DIFF_RATIO = 0.001
+
+
+def light_colors():
+    return random.choices(LIGHT_COLORS, k=4)
+
+
+def legacy_fill_gradient(mask: Image.Image, colors) -> Image.Image:
+    """改动之前的 fill_gradient：逐列画线"""
+    width, height = mask.size
+    gradient = Image.new("RGBA", (width, height), color=0)
+    draw = ImageDraw.Draw(gradient)
+    num_colors = len(colors)
+    segement_width = width / (num_colors - 1)
+    for i in range(num_colors - 1):
+        start_color = colors[i]
+        end_color = colors[i + 1]
+        start_x = int(i * segement_width)
+        end_x = int((i + 1) * segement_width)
+        for x in range(start_x, end_x):
+            factor = (x - start_x) / segement_width
+            color = tuple(
+                int(start_color[j] + (end_color[j] - start_color[j]) * factor)
+                for j in range(3)
+            )
+            draw.line([(x, 0), (x, height)], fill=color)
+    gradient.putalpha(mask)
+    return gradient
+
+
+def legacy_draw_gradient_line(img, line, font, x, y, color_func, cache):
+    """改动之前的 draw_gradient_line：每个字符单独生成渐变并贴图"""
+    base_x = x
+    offset_x = 0
+    for char in line:
+        mask, bbox = cache.get(font, char)
+        gradient_char = legacy_fill_gradient(mask, color_func())
+        img.paste(gradient_char, (base_x + offset_x, y), gradient_char)
+        base_x += bbox[2] - bbox[0]
+        offset_x += bbox[0]
+    return img
+
+
+def make_canvas() -> Image.Image:
+    # 有纹理的半透明底图，与海报面板上的效果接近
+    canvas = Image.effect_mandelbrot((1080, 1920), (-2.0, -1.2, 0.8, 1.2), 60)
+    canvas = canvas.convert("RGBA")
+    canvas.putalpha(220)
+    return canvas
+
+
+def render(draw_line, canvas, fonts, cache, seed: int):
+    random.seed(seed)
+    img = canvas.copy()
+    draw = ImageDraw.Draw(img)
+    timings = []
+    for text, size, y in LINES:
+        font = fonts[size]
+        bbox = draw.textbbox((0, 0), text, font=font)
+        x = (img.width - (bbox[2] - bbox[0])) // 2 - bbox[0]
+        start = time.perf_counter()
+        draw_line(img, text, font, x, y, light_colors, cache)
+        timings.append((time.perf_counter() - start) * 1000)
+    return img, sum(timings)
+
+
+def compare(a: Image.Image, b: Image.Image):
+    diff = np.asarray(ImageChops.difference(a, b), dtype=np.uint8)
+    mean = float(diff.mean())
+    ratio = float((diff.max(axis=2) > 8).mean())
+    return mean, ratio, int(diff.max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seeds", type=int, default=20, help="比较的随机种子数")
+    parser.add_argument("--font", default=FONT_PATH, help="字体文件路径")
+    parser.add_argument("--save", help="保存两种结果和差异图的目录")
+    args = parser.parse_args()
+
+    fonts = {size: ImageFont.truetype(args.font, size) for size in {s for _, s, _ in LINES}}
+    cache = GlyphMaskCache()
+    canvas = make_canvas()
+
+    worst = (0.0, 0.0, 0)
+    legacy_ms, current_ms = [], []
+    for seed in range(args.seeds):
+        golden, elapsed = render(legacy_draw_gradient_line, canvas, fonts, cache, seed)
+        legacy_ms.append(elapsed)
+        current, elapsed = render(draw_gradient_line, canvas, fonts, cache, seed)
+        current_ms.append(elapsed)
+
+        mean, ratio, peak = compare(golden, current)
+        worst = max(worst, (mean, ratio, peak))
+        if args.save and seed == 0:
+            os.makedirs(args.save, exist_ok=True)
+            golden.save(os.path.join(args.save, "legacy.png"))
+            current.save(os.path.join(args.save, "current.png"))
+            ImageChops.difference(golden, current).convert("RGB").point(
+                lambda v: min(255, v * 16)
+            ).save(os.path.join(args.save, "diff.png"))
+
+    print(f"{len(LINES)} 行渐变文字，{args.seeds} 个随机种子")
+    print(
+        f"逐字符(之前)  中位数 {statistics.median(legacy_ms):7.2f} ms"
+        f"    整行(之后)  中位数 {statistics.median(current_ms):7.2f} ms"
+    )
+    mean, ratio, peak = worst
+    print(f"最大平均差异 {mean:.4f}，差异>8 的像素比例 {ratio:.4%}，单像素最大差异 {peak}")
+    if mean > MAX_MEAN_DIFF or ratio > MAX_DIFF_RATIO:
+        print("超出容差")
+        sys.exit(1)
+    print("在容差范围内")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import asyncio
+import os
+import time
+import uuid
+from typing import Iterable, Optional
+
+from astrbot.api import logger
+
+from .io_utils import async_atomic_write
+
+
+OUTPUT_MODES = ("auto", "bytes", "file")
+# 这些平台适配器可以直接发送 base64 图片，不需要落盘
+BYTES_CAPABLE_PLATFORMS = {"aiocqhttp"}
+
+SPOOL_MAX_AGE = 600  # 秒，发送完成后的海报在 spool 中保留的时间
+SPOOL_CLEANUP_INTERVAL = 300  # 秒
+
+
+def wants_bytes(
+    mode: str,
+    platform_name: Optional[str],
+    extra_platforms: Iterable[str] = (),
+) -> bool:
+    """
+    判断这次发送是否直接使用内存中的图片字节
+    Args:
+        mode (str): auto / bytes / file
+        platform_name (str): 消息来源的平台适配器名称
+        extra_platforms: 用户额外配置的支持 base64 图片的平台
+    """
+    if mode == "bytes":
+        return True
+    if mode == "file":
+        return False
+    return platform_name in BYTES_CAPABLE_PLATFORMS or platform_name in set(extra_platforms)
+
+
+class PosterSpool:
+    """
+    海报文件缓冲目录
+    只在平台适配器需要文件路径时使用：海报写入固定目录，不在每次请求后删除，
+    由后台任务定期清理过期文件，避免适配器异步上传时文件已被删除。
+    """
+
+    def __init__(
+        self,
+        spool_dir: str,
+        max_age: float = SPOOL_MAX_AGE,
+        interval: float = SPOOL_CLEANUP_INTERVAL,
+    ):
+        self.spool_dir = spool_dir
+        self.max_age = max_age
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    async def write(self, data: bytes, suffix: str = ".jpg") -> str:
+        """
+        写入一张海报
+        Args:
+            data (bytes): 编码后的海报
+            suffix (str): 文件后缀
+        Returns:
+            str: 海报文件路径
+        """
+        path = os.path.join(self.spool_dir, f"{uuid.uuid4().hex}{suffix}")
+        await async_atomic_write(path, data)
+        return path
+
+    def _cleanup_sync(self) -> int:
+        deadline = time.time() - self.max_age
+        removed = 0
+        for entry in os.scandir(self.spool_dir):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < deadline:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+    async def cleanup(self) -> int:
+        """删除过期的海报文件，返回删除的数量"""
+        removed = await asyncio.to_thread(self._cleanup_sync)
+        if removed:
+            logger.info(f"清理 spool 中过期的海报 {removed} 张")
+        return removed
+
+    async def _run(self):
+        while True:
+            try:
+                await self.cleanup()
+            except Exception as e:
+                logger.warning(f"清理 spool 目录失败: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
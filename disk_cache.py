@@ -0,0 +1,251 @@
+import asyncio
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from astrbot.api import logger
+
+from .io_utils import atomic_write_bytes
+
+
+EVICTION_POLICIES = ("lru", "lfu")
+ACCESS_LOG_NAME = ".access.json"
+GC_INTERVAL = 600  # 秒
+MIN_ENTRY_AGE = 60  # 秒，最近访问过的条目不会被淘汰，避免删除正在使用的文件
+
+
+class DiskCacheManager:
+    """
+    磁盘缓存容量管理
+    1. 按条目统计目录中的文件(一个条目可以包含多个文件，例如头像和它的元数据)
+    2. 访问时间和访问次数由插件自己记录并保存在访问日志中，不依赖文件系统的 atime
+    3. 后台定期回收：超过字节数或条目数上限时，按 LRU 或 LFU 淘汰条目
+    """
+
+    def __init__(
+        self,
+        name: str,
+        directory: str,
+        entry_key: Callable[[str], Optional[str]],
+        max_bytes: int = 0,
+        max_entries: int = 0,
+        policy: str = "lru",
+        interval: float = GC_INTERVAL,
+        on_evict: Optional[Callable[[str], None]] = None,
+    ):
+        """
+        Args:
+            name (str): 缓存名称，用于日志和统计
+            directory (str): 缓存目录
+            entry_key: 文件名 -> 条目键，返回 None 的文件不受管理(例如临时文件)
+            max_bytes (int): 字节数上限，0 表示不限制
+            max_entries (int): 条目数上限，0 表示不限制
+            policy (str): lru 或 lfu
+            interval (float): 后台回收的间隔(秒)
+            on_evict: 条目被淘汰后调用，参数为条目键
+        """
+        if policy not in EVICTION_POLICIES:
+            logger.warning(f"未知的淘汰策略 {policy}，使用 lru")
+            policy = "lru"
+        self.name = name
+        self.directory = directory
+        self.entry_key = entry_key
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_entries = max(0, int(max_entries))
+        self.policy = policy
+        self.interval = interval
+        self.on_evict = on_evict
+
+        self.access_log_path = os.path.join(directory, ACCESS_LOG_NAME)
+        self._access: Dict[str, List[float]] = {}  # 条目键 -> [最后访问时间, 访问次数]
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.entries = 0  # 最近一次扫描的结果
+        self.bytes = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_access_log()
+
+    def _load_access_log(self):
+        try:
+            with open(self.access_log_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._access = {
+                str(k): [float(v[0]), int(v[1])] for k, v in data.items()
+            }
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError, IndexError) as e:
+            logger.warning(f"读取{self.name}缓存的访问日志失败: {e}")
+
+    def _save_access_log(self, access: Dict[str, List[float]]):
+        data = json.dumps(access, separators=(",", ":")).encode("utf-8")
+        atomic_write_bytes(self.access_log_path, data)
+
+    def touch(self, key: str, hit: bool = True):
+        """
+        记录一次访问
+        Args:
+            key (str): 条目键
+            hit (bool): 缓存命中为 True，需要重新下载或生成为 False
+        """
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        record = self._access.get(key)
+        if record is None:
+            self._access[key] = [time.time(), 1]
+        else:
+            record[0] = time.time()
+            record[1] += 1
+        self._dirty = True
+
+    def _scan(self) -> Dict[str, Tuple[int, float, List[str]]]:
+        """扫描缓存目录，返回 条目键 -> (字节数, 最新修改时间, 文件列表)"""
+        entries: Dict[str, Tuple[int, float, List[str]]] = {}
+        for item in os.scandir(self.directory):
+            if item.name.startswith("."):
+                continue  # 访问日志和写了一半的临时文件
+            key = self.entry_key(item.name)
+            if key is None:
+                continue
+            try:
+                st = item.stat()
+            except FileNotFoundError:
+                continue
+            if not item.is_file():
+                continue
+            size, mtime, files = entries.get(key, (0, 0.0, []))
+            files.append(item.path)
+            entries[key] = (size + st.st_size, max(mtime, st.st_mtime), files)
+        return entries
+
+    def _victims(
+        self,
+        entries: Dict[str, Tuple[int, float, List[str]]],
+        access: Dict[str, List[float]],
+        now: float,
+    ) -> List[str]:
+        """按淘汰策略选出需要删除的条目"""
+        total_bytes = sum(e[0] for e in entries.values())
+        total_entries = len(entries)
+
+        def over_limit() -> bool:
+            return (self.max_bytes and total_bytes > self.max_bytes) or (
+                self.max_entries and total_entries > self.max_entries
+            )
+
+        if not over_limit():
+            return []
+
+        def rank(key: str):
+            # 没有访问记录的条目(例如插件更新前下载的文件)以修改时间作为最后访问时间
+            last, count = access.get(key, (entries[key][1], 0))
+            if self.policy == "lfu":
+                return (count, last)
+            return (last,)
+
+        victims = []
+        for key in sorted(entries, key=rank):
+            if not over_limit():
+                break
+            last = access.get(key, (entries[key][1], 0))[0]
+            if now - last < MIN_ENTRY_AGE:
+                continue
+            victims.append(key)
+            total_bytes -= entries[key][0]
+            total_entries -= 1
+        return victims
+
+    def _collect(self, access: Dict[str, List[float]]):
+        now = time.time()
+        entries = self._scan()
+        victims = self._victims(entries, access, now)
+        for key in victims:
+            for path in entries[key][2]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            del entries[key]
+        # 访问日志只保留目录中仍然存在的条目
+        pruned = {k: v for k, v in access.items() if k in entries}
+        self._save_access_log(pruned)
+        return victims, set(entries), sum(e[0] for e in entries.values())
+
+    async def collect(self) -> int:
+        """
+        执行一次回收
+        Returns:
+            int: 淘汰的条目数
+        """
+        access = {k: list(v) for k, v in self._access.items()}
+        self._dirty = False
+        victims, remaining, self.bytes = await asyncio.to_thread(
+            self._collect, access
+        )
+        self.entries = len(remaining)
+
+        # 回收期间新增的访问记录保留，已经不在目录中的条目删除
+        for key in access:
+            if key not in remaining:
+                self._access.pop(key, None)
+        for key in victims:
+            if self.on_evict is not None:
+                self.on_evict(key)
+        if victims:
+            self.evicted += len(victims)
+            logger.info(
+                f"{self.name}缓存淘汰 {len(victims)} 个条目，"
+                f"剩余 {self.entries} 个，{self.bytes / 1024 / 1024:.1f} MB"
+            )
+        return len(victims)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.collect()
+            except Exception as e:
+                logger.warning(f"回收{self.name}缓存失败: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._dirty:
+            try:
+                await asyncio.to_thread(self._save_access_log, dict(self._access))
+            except OSError as e:
+                logger.warning(f"保存{self.name}缓存的访问日志失败: {e}")
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "entries": self.entries,
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "evicted": self.evicted,
+        }
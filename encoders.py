@@ -0,0 +1,144 @@
+import io
+import time
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from PIL import Image, features
+
+
+class EncoderProfile(NamedTuple):
+    """海报编码配置"""
+
+    name: str
+    format: str  # Pillow 的保存格式
+    suffix: str  # 文件后缀
+    options: dict  # 传给 Image.save 的参数
+
+
+class EncodedPoster(NamedTuple):
+    """编码后的海报"""
+
+    data: bytes
+    profile: str
+    suffix: str
+    encode_ms: float  # 编码耗时(毫秒)
+    timings: Optional[dict] = None  # 渲染各阶段耗时(毫秒)，由渲染器填写
+
+
+DEFAULT_PROFILE = "default"
+
+
+def _small_profile() -> EncoderProfile:
+    # 没有编译 WebP 支持的 Pillow 退回到渐进式 JPEG
+    if features.check("webp"):
+        return EncoderProfile("small", "WEBP", ".webp", {"quality": 75, "method": 4})
+    return EncoderProfile(
+        "small",
+        "JPEG",
+        ".jpg",
+        {"quality": 75, "optimize": True, "progressive": True, "subsampling": 2},
+    )
+
+
+ENCODER_PROFILES: Dict[str, EncoderProfile] = {
+    # 与之前的行为一致
+    DEFAULT_PROFILE: EncoderProfile(
+        DEFAULT_PROFILE, "JPEG", ".jpg", {"quality": 85, "optimize": True}
+    ),
+    # 跳过 optimize 的额外一遍哈夫曼表优化，适合 CPU 紧张的机器
+    "fast": EncoderProfile(
+        "fast", "JPEG", ".jpg", {"quality": 85, "optimize": False, "subsampling": 2}
+    ),
+    # 体积优先，适合上传带宽受限的平台
+    "small": _small_profile(),
+    # 画质优先，不做色度抽样
+    "quality": EncoderProfile(
+        "quality", "JPEG", ".jpg", {"quality": 95, "optimize": True, "subsampling": 0}
+    ),
+}
+
+
+def get_profile(name: Optional[str]) -> Optional[EncoderProfile]:
+    """按名称获取编码配置，名称未知时返回 None"""
+    return ENCODER_PROFILES.get(name or DEFAULT_PROFILE)
+
+
+def parse_profile_overrides(entries: Iterable[str]) -> Dict[str, str]:
+    """
+    解析按平台或群选择编码配置的规则
+    Args:
+        entries: 形如 "telegram=small" 或 "123456=fast" 的字符串，键为平台适配器名称或群号
+    Returns:
+        dict: 键 -> 编码配置名称，无效的条目被忽略
+    """
+    overrides = {}
+    for entry in entries or []:
+        key, sep, name = str(entry).partition("=")
+        key, name = key.strip(), name.strip()
+        if sep and key and name in ENCODER_PROFILES:
+            overrides[key] = name
+    return overrides
+
+
+def select_profile(
+    default: str,
+    overrides: Dict[str, str],
+    platform_name: Optional[str],
+    group_id: Optional[str],
+) -> str:
+    """
+    选择本次发送使用的编码配置，群规则优先于平台规则
+    Args:
+        default (str): 默认编码配置
+        overrides (dict): parse_profile_overrides 的结果
+        platform_name (str): 平台适配器名称
+        group_id (str): 群号，私聊时为空
+    """
+    if group_id and str(group_id) in overrides:
+        return overrides[str(group_id)]
+    if platform_name and platform_name in overrides:
+        return overrides[platform_name]
+    return default if default in ENCODER_PROFILES else DEFAULT_PROFILE
+
+
+def encode_image(image: Image.Image, profile: EncoderProfile) -> EncodedPoster:
+    """
+    按编码配置编码海报，并记录耗时
+    Args:
+        image (Image.Image): 绘制好的海报
+        profile (EncoderProfile): 编码配置
+    Returns:
+        EncodedPoster: 编码结果
+    """
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    image = image.convert("RGB")  # 确保图片是RGB模式
+    image.save(buffer, format=profile.format, **profile.options)
+    encode_ms = (time.perf_counter() - start) * 1000
+    return EncodedPoster(buffer.getvalue(), profile.name, profile.suffix, encode_ms)
+
+
+class EncoderStats:
+    """按编码配置累计编码次数、耗时和输出大小"""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, poster: EncodedPoster):
+        item = self._stats.setdefault(
+            poster.profile, {"count": 0, "encode_ms": 0.0, "bytes": 0}
+        )
+        item["count"] += 1
+        item["encode_ms"] += poster.encode_ms
+        item["bytes"] += len(poster.data)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """返回每个编码配置的次数、平均耗时(毫秒)和平均大小(字节)"""
+        result = {}
+        for name, item in self._stats.items():
+            count = item["count"] or 1
+            result[name] = {
+                "count": item["count"],
+                "avg_encode_ms": item["encode_ms"] / count,
+                "avg_bytes": item["bytes"] / count,
+            }
+        return result
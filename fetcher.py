@@ -0,0 +1,410 @@
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiofiles
+import aiofiles.os
+import aiohttp
+
+from .io_utils import temp_path_for
+
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+MAX_BACKGROUND_BYTES = 20 * 1024 * 1024
+MAX_AVATAR_BYTES = 2 * 1024 * 1024
+SNIFF_BYTES = 12  # 判断图片格式需要的文件头长度
+
+CONNECT_TIMEOUT = 3  # 秒
+READ_TIMEOUT = 10  # 两次读取之间的最长间隔(秒)
+TOTAL_TIMEOUT = 60  # 单次请求的总时长上限(秒)
+FETCH_RETRIES = 2
+RETRY_BACKOFF = 0.3  # 第一次重试前的平均等待(秒)，之后每次翻倍
+BREAKER_THRESHOLD = 5  # 连续失败多少次后熔断
+BREAKER_COOLDOWN = 30  # 熔断后多少秒允许一次试探请求
+NEGATIVE_TTL = 3600  # 返回 4xx 的 URL 在多少秒内直接跳过
+NEGATIVE_CACHE_SIZE = 4096
+# 这些 4xx 是暂时性的，不计入失效链接
+TRANSIENT_STATUSES = (408, 425, 429)
+
+# 部分图床不返回准确的 Content-Type，这些类型交给文件头判断
+GENERIC_CONTENT_TYPES = ("application/octet-stream", "binary/octet-stream")
+
+
+def sniff_image(head: bytes) -> Optional[str]:
+    """
+    按文件头判断图片格式
+    Args:
+        head (bytes): 文件开头至少 SNIFF_BYTES 个字节
+    Returns:
+        Optional[str]: jpeg/png/gif/webp/bmp，不是已知图片格式时返回 None
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith(b"BM"):
+        return "bmp"
+    return None
+
+
+class DownloadRejected(aiohttp.ClientError):
+    """响应不是图片或超过大小上限，在写入之前中止"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason  # too_large / content_type / not_image
+
+
+class CircuitOpen(aiohttp.ClientError):
+    """主机处于熔断状态，请求没有发出"""
+
+
+class DeadLink(aiohttp.ClientError):
+    """URL 最近返回过 4xx 或不是图片，在失效缓存有效期内直接跳过"""
+
+
+class CircuitBreaker:
+    """
+    单个主机的熔断器
+    连续失败 threshold 次后打开，cooldown 秒内的请求直接失败；
+    冷却结束后放行一次试探请求，成功则关闭，失败则重新计时
+    """
+
+    __slots__ = ("threshold", "cooldown", "clock", "failures", "opened_at")
+
+    def __init__(
+        self,
+        threshold: int = BREAKER_THRESHOLD,
+        cooldown: float = BREAKER_COOLDOWN,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.threshold = max(1, int(threshold))
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        now = self.clock()
+        if now - self.opened_at >= self.cooldown:
+            # 试探请求期间其他请求继续失败
+            self.opened_at = now
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = self.clock()
+
+
+class FetchResult(NamedTuple):
+    status: int
+    headers: Mapping[str, str]
+    data: Optional[bytes]  # 304 时为 None
+
+
+class ImageFetcher:
+    """
+    图片下载
+    1. 分块读取响应，背景直接流式写入临时文件，头像在内存中累积，都有大小上限
+    2. 先检查 Content-Type 和 Content-Length，再用前几个字节的文件头确认是图片，
+       HTML 错误页或超大文件在写入之前就被中止
+    3. 按用途统计下载字节数和耗时，用于计算吞吐量(字节/秒)
+    4. 连接超时和读取超时分开设置，超时、连接错误和 5xx 按带抖动的指数退避重试
+    5. 每个主机一个熔断器，主机持续失败时请求直接失败，由调用方回退到本地缓存
+    6. 返回 4xx 或不是图片的 URL 记入有 TTL 的失效缓存，有效期内不再请求
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        retries: int = FETCH_RETRIES,
+        breaker_threshold: int = BREAKER_THRESHOLD,
+        breaker_cooldown: float = BREAKER_COOLDOWN,
+        negative_ttl: float = NEGATIVE_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._session = session
+        self.timeout = aiohttp.ClientTimeout(
+            total=TOTAL_TIMEOUT, sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        self.retries = max(0, int(retries))
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        # URL -> 失效缓存的过期时间
+        self._dead: "OrderedDict[str, float]" = OrderedDict()
+        # 用途 -> [次数, 字节数, 秒]
+        self._stats: Dict[str, List[float]] = {}
+        self.rejected: Dict[str, int] = {}
+        self.retried = 0
+        self.short_circuited = 0  # 因熔断没有发出的请求
+        self.dead_skipped = 0  # 因失效缓存跳过的请求
+
+    def is_dead(self, url: str) -> bool:
+        """URL 是否在失效缓存中"""
+        expires = self._dead.get(url)
+        if expires is None:
+            return False
+        if self.clock() >= expires:
+            del self._dead[url]
+            return False
+        return True
+
+    def _mark_dead(self, url: str):
+        if self.negative_ttl <= 0:
+            return
+        self._dead[url] = self.clock() + self.negative_ttl
+        self._dead.move_to_end(url)
+        while len(self._dead) > NEGATIVE_CACHE_SIZE:
+            self._dead.popitem(last=False)
+
+    def _breaker(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(
+                self.breaker_threshold, self.breaker_cooldown, self.clock
+            )
+        return breaker
+
+    def open_hosts(self) -> List[str]:
+        """当前处于熔断状态的主机"""
+        return [host for host, b in self._breakers.items() if b.is_open]
+
+    async def _call(self, url: str, attempt: Callable[[], Awaitable]):
+        """
+        带重试、熔断和失效缓存地执行一次请求
+        Args:
+            attempt: 发出一次请求并处理响应的协程函数，每次重试重新调用
+        """
+        if self.is_dead(url):
+            self.dead_skipped += 1
+            raise DeadLink(f"最近失效的链接，已跳过: {url}")
+        breaker = self._breaker(url)
+        if not breaker.allow():
+            self.short_circuited += 1
+            raise CircuitOpen(f"主机 {urlsplit(url).netloc} 暂时不可用")
+
+        for i in range(self.retries + 1):
+            try:
+                result = await attempt()
+            except DownloadRejected as e:
+                # 主机正常响应了，只是内容不可用
+                breaker.success()
+                self._reject(e)
+                self._mark_dead(url)
+                raise
+            except aiohttp.ClientResponseError as e:
+                if 400 <= e.status < 500 and e.status not in TRANSIENT_STATUSES:
+                    breaker.success()
+                    self._mark_dead(url)
+                    raise
+                error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            else:
+                breaker.success()
+                return result
+
+            if i == self.retries:
+                break
+            self.retried += 1
+            # 抖动避免多个请求在同一时刻重试
+            await asyncio.sleep(RETRY_BACKOFF * (2**i) * random.uniform(0.5, 1.5))
+
+        breaker.failure()
+        raise error
+
+    def _check_headers(self, response: aiohttp.ClientResponse, max_bytes: int):
+        content_type = response.headers.get("Content-Type", "")
+        mime = content_type.split(";", 1)[0].strip().lower()
+        if mime and not mime.startswith("image/") and mime not in GENERIC_CONTENT_TYPES:
+            raise DownloadRejected("content_type", f"不是图片: Content-Type {mime}")
+        length = response.content_length
+        if max_bytes and length is not None and length > max_bytes:
+            raise DownloadRejected(
+                "too_large", f"文件过大: {length} 字节，上限 {max_bytes} 字节"
+            )
+
+    async def _stream(
+        self,
+        response: aiohttp.ClientResponse,
+        max_bytes: int,
+        sink: Callable[[bytes], Awaitable[None]],
+    ) -> int:
+        """逐块读取响应体交给 sink，开头不是图片或超过上限时抛出 DownloadRejected"""
+        self._check_headers(response, max_bytes)
+        total = 0
+        head = b""
+        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+            total += len(chunk)
+            if max_bytes and total > max_bytes:
+                raise DownloadRejected(
+                    "too_large", f"文件过大: 超过上限 {max_bytes} 字节"
+                )
+            if head is not None:
+                # 文件头凑够之前先缓存，确认是图片后再交给 sink
+                head += chunk
+                if len(head) < SNIFF_BYTES:
+                    continue
+                if sniff_image(head) is None:
+                    raise DownloadRejected("not_image", "文件头不是已知的图片格式")
+                chunk, head = head, None
+            await sink(chunk)
+        if head is not None:
+            # 整个响应不足 SNIFF_BYTES 字节
+            if sniff_image(head) is None:
+                raise DownloadRejected("not_image", "文件头不是已知的图片格式")
+            await sink(head)
+        return total
+
+    def _record(self, label: str, size: int, start: float):
+        item = self._stats.setdefault(label, [0, 0, 0.0])
+        item[0] += 1
+        item[1] += size
+        item[2] += time.perf_counter() - start
+
+    def _reject(self, error: DownloadRejected):
+        self.rejected[error.reason] = self.rejected.get(error.reason, 0) + 1
+
+    async def fetch(
+        self,
+        url: str,
+        label: str,
+        max_bytes: int = MAX_AVATAR_BYTES,
+        headers: Optional[Mapping[str, str]] = None,
+        timeout: Optional[aiohttp.ClientTimeout] = None,
+    ) -> FetchResult:
+        """
+        下载一张小图片到内存(例如头像)
+        Args:
+            url (str): 图片 URL
+            label (str): 统计用的用途名称
+            max_bytes (int): 大小上限，0 表示不限制
+            headers (dict): 额外的请求头，例如条件请求
+        Returns:
+            FetchResult: 304 时 data 为 None
+        Raises:
+            aiohttp.ClientError: 重试后仍失败、状态码错误、响应被拒绝(DownloadRejected)、
+                主机熔断中(CircuitOpen)或链接最近失效(DeadLink)
+        """
+
+        async def _attempt() -> FetchResult:
+            start = time.perf_counter()
+            async with self._session.get(
+                url, headers=headers, timeout=timeout or self.timeout
+            ) as response:
+                if response.status == 304:
+                    return FetchResult(304, response.headers, None)
+                response.raise_for_status()
+                buffer = bytearray()
+
+                async def _append(chunk: bytes):
+                    buffer.extend(chunk)
+
+                size = await self._stream(response, max_bytes, _append)
+                self._record(label, size, start)
+                return FetchResult(response.status, response.headers, bytes(buffer))
+
+        return await self._call(url, _attempt)
+
+    async def download(
+        self,
+        url: str,
+        path: str,
+        label: str,
+        max_bytes: int = MAX_BACKGROUND_BYTES,
+        timeout: Optional[aiohttp.ClientTimeout] = None,
+        on_chunk: Optional[Callable[[int], Awaitable[None]]] = None,
+    ) -> int:
+        """
+        把图片流式下载到 path，先写入临时文件，完整且通过检查后再重命名
+        Args:
+            url (str): 图片 URL
+            path (str): 保存路径
+            label (str): 统计用的用途名称
+            max_bytes (int): 大小上限，0 表示不限制
+            on_chunk: 每写入一块后以块大小调用，例如带宽限制
+        Returns:
+            int: 下载的字节数
+        Raises:
+            aiohttp.ClientError: 重试后仍失败、状态码错误、响应被拒绝(DownloadRejected)、
+                主机熔断中(CircuitOpen)或链接最近失效(DeadLink)
+        """
+
+        async def _attempt() -> int:
+            start = time.perf_counter()
+            tmp_path = temp_path_for(path)
+            try:
+                async with self._session.get(
+                    url, timeout=timeout or self.timeout
+                ) as response:
+                    response.raise_for_status()
+                    async with aiofiles.open(tmp_path, "wb") as f:
+
+                        async def _write(chunk: bytes):
+                            await f.write(chunk)
+                            if on_chunk is not None:
+                                await on_chunk(len(chunk))
+
+                        size = await self._stream(response, max_bytes, _write)
+                await aiofiles.os.replace(tmp_path, path)
+            finally:
+                # 下载失败、被拒绝或任务被取消时清理临时文件
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self._record(label, size, start)
+            return size
+
+        return await self._call(url, _attempt)
+
+    def throughput(self) -> Dict[str, Tuple[int, float, float]]:
+        """
+        Returns:
+            dict: 用途 -> (次数, 平均大小(字节), 平均吞吐量(字节/秒))
+        """
+        result = {}
+        for label, (count, size, seconds) in self._stats.items():
+            result[label] = (
+                int(count),
+                size / count if count else 0.0,
+                size / seconds if seconds else 0.0,
+            )
+        return result
+
+    def counters(self) -> Dict[Tuple[str, str], int]:
+        """供指标收集的计数：下载字节数、下载耗时(毫秒)和被拒绝的次数"""
+        counters = {}
+        for label, (_, size, seconds) in self._stats.items():
+            counters[("download_bytes", label)] = int(size)
+            counters[("download_ms", label)] = int(seconds * 1000)
+        for reason, count in self.rejected.items():
+            counters[("downloads_rejected", reason)] = count
+        counters[("download_retries", "")] = self.retried
+        counters[("downloads_skipped", "circuit_open")] = self.short_circuited
+        counters[("downloads_skipped", "dead_link")] = self.dead_skipped
+        return counters
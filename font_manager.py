@@ -0,0 +1,251 @@
+import os
+import struct
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from PIL import ImageFont
+
+from astrbot.api import logger
+
+
+FONT_FACE_CACHE_SIZE = 32
+UNICODE_MAX = 0x110000
+
+# 存在时自动加入回退链的系统字体
+SYSTEM_FALLBACK_FONTS = (
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    "C:/Windows/Fonts/msyh.ttc",
+    "C:/Windows/Fonts/seguisym.ttf",
+)
+
+
+def _parse_cmap_format4(data: bytes, offset: int, bits: bytearray):
+    seg_count = struct.unpack_from(">H", data, offset + 6)[0] // 2
+    end_codes = offset + 14
+    start_codes = end_codes + seg_count * 2 + 2  # 跳过 reservedPad
+    id_deltas = start_codes + seg_count * 2
+    id_range_offsets = id_deltas + seg_count * 2
+    for i in range(seg_count):
+        end = struct.unpack_from(">H", data, end_codes + i * 2)[0]
+        start = struct.unpack_from(">H", data, start_codes + i * 2)[0]
+        delta = struct.unpack_from(">h", data, id_deltas + i * 2)[0]
+        range_offset_pos = id_range_offsets + i * 2
+        range_offset = struct.unpack_from(">H", data, range_offset_pos)[0]
+        for code in range(start, min(end, 0xFFFE) + 1):
+            if range_offset == 0:
+                glyph = (code + delta) & 0xFFFF
+            else:
+                pos = range_offset_pos + range_offset + (code - start) * 2
+                if pos + 2 > len(data):
+                    continue
+                glyph = struct.unpack_from(">H", data, pos)[0]
+                if glyph:
+                    glyph = (glyph + delta) & 0xFFFF
+            if glyph:
+                bits[code >> 3] |= 1 << (code & 7)
+
+
+def _parse_cmap_format12(data: bytes, offset: int, bits: bytearray):
+    groups = struct.unpack_from(">I", data, offset + 12)[0]
+    pos = offset + 16
+    for _ in range(groups):
+        start, end, glyph = struct.unpack_from(">III", data, pos)
+        pos += 12
+        if glyph == 0:
+            start += 1  # 映射到 .notdef 的字符不算覆盖
+        for code in range(start, min(end, UNICODE_MAX - 1) + 1):
+            bits[code >> 3] |= 1 << (code & 7)
+
+
+def read_cmap_coverage(path: str) -> bytearray:
+    """
+    读取字体文件的 cmap 表，返回字符覆盖位图
+    支持 TrueType/OpenType 以及字体集合(取第一个字体)，解析 Unicode 子表的 format 4 和 format 12
+    Args:
+        path (str): 字体文件路径
+    Returns:
+        bytearray: 第 n 位为 1 表示字体包含码位 n 的字形
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    font_offset = 0
+    if data[:4] == b"ttcf":
+        font_offset = struct.unpack_from(">I", data, 12)[0]
+
+    num_tables = struct.unpack_from(">H", data, font_offset + 4)[0]
+    cmap = None
+    for i in range(num_tables):
+        tag, _, table_offset, _ = struct.unpack_from(
+            ">4sIII", data, font_offset + 12 + i * 16
+        )
+        if tag == b"cmap":
+            cmap = table_offset
+            break
+    if cmap is None:
+        raise ValueError("字体中没有 cmap 表")
+
+    subtables: Dict[int, List[int]] = {}
+    count = struct.unpack_from(">H", data, cmap + 2)[0]
+    for i in range(count):
+        platform_id, encoding_id, sub_offset = struct.unpack_from(
+            ">HHI", data, cmap + 4 + i * 8
+        )
+        # 只使用 Unicode 平台和 Windows 平台的 Unicode 编码
+        if platform_id == 0 or (platform_id == 3 and encoding_id in (1, 10)):
+            offset = cmap + sub_offset
+            fmt = struct.unpack_from(">H", data, offset)[0]
+            subtables.setdefault(fmt, []).append(offset)
+
+    bits = bytearray(UNICODE_MAX // 8)
+    if 12 in subtables:
+        # format 12 覆盖完整的 Unicode 范围，包含 format 4 的内容
+        for offset in subtables[12]:
+            _parse_cmap_format12(data, offset, bits)
+    elif 4 in subtables:
+        for offset in subtables[4]:
+            _parse_cmap_format4(data, offset, bits)
+    return bits
+
+
+class FontManager:
+    """
+    进程内共享的字体管理器
+    1. 按 (路径, 字号) 懒加载字体，有界 LRU 保存已加载的字体对象
+    2. 每个字体文件解析一次 cmap，得到字符覆盖位图，选择回退字体只需要查表
+    """
+
+    def __init__(self, max_faces: int = FONT_FACE_CACHE_SIZE):
+        self.max_faces = max(1, int(max_faces))
+        self._faces: "OrderedDict[Tuple[str, int], ImageFont.ImageFont]" = OrderedDict()
+        self._coverage: Dict[str, Optional[bytearray]] = {}
+        self._failed = set()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, size: int) -> ImageFont.ImageFont:
+        """
+        获取字体对象，加载失败时返回默认字体
+        Args:
+            path (str): 字体文件路径
+            size (int): 字号
+        """
+        key = (path, int(size))
+        with self._lock:
+            face = self._faces.get(key)
+            if face is not None:
+                self._faces.move_to_end(key)
+                return face
+
+        try:
+            face = ImageFont.truetype(path, size)
+        except Exception:
+            if path not in self._failed:
+                self._failed.add(path)
+                logger.error(f"无法加载字体文件 {path},使用默认字体回退")
+            return ImageFont.load_default()
+
+        with self._lock:
+            face = self._faces.setdefault(key, face)
+            self._faces.move_to_end(key)
+            while len(self._faces) > self.max_faces:
+                self._faces.popitem(last=False)
+        return face
+
+    def coverage(self, path: str) -> Optional[bytearray]:
+        """字体文件的字符覆盖位图，无法解析时返回 None(视为覆盖所有字符)"""
+        # 位图解析后不再变化，读取不需要加锁
+        if path in self._coverage:
+            return self._coverage[path]
+        try:
+            bits = read_cmap_coverage(path)
+        except Exception as e:
+            logger.warning(f"解析字体 {path} 的字符表失败: {e}")
+            bits = None
+        with self._lock:
+            self._coverage[path] = bits
+        return bits
+
+    def covers(self, path: str, char: str) -> bool:
+        bits = self.coverage(path)
+        if bits is None:
+            return True
+        code = ord(char)
+        return bool(bits[code >> 3] & (1 << (code & 7)))
+
+
+font_manager = FontManager()
+
+
+class FontChain:
+    """
+    主字体加回退字体链
+    按字号取主字体；某个字符主字体没有字形时，按顺序选第一个包含该字符的回退字体
+    """
+
+    def __init__(
+        self,
+        primary: str,
+        fallbacks: Sequence[str] = (),
+        manager: Optional[FontManager] = None,
+    ):
+        self.primary = primary
+        self.manager = manager or font_manager
+        self.fallbacks = [p for p in fallbacks if p != primary and os.path.exists(p)]
+        self._choice: Dict[str, Optional[str]] = {}  # 字符 -> 回退字体路径
+
+    def __getitem__(self, size: int) -> ImageFont.ImageFont:
+        return self.manager.get(self.primary, size)
+
+    def _fallback_path(self, char: str) -> Optional[str]:
+        path = self._choice.get(char, "")
+        if path != "":
+            return path
+        path = None
+        for candidate in self.fallbacks:
+            if self.manager.covers(candidate, char):
+                path = candidate
+                break
+        self._choice[char] = path
+        return path
+
+    def is_primary(self, font: ImageFont.ImageFont) -> bool:
+        return getattr(font, "path", None) == self.primary
+
+    def missing(self, text: str) -> bool:
+        """文字中是否有主字体没有字形的字符"""
+        if not self.fallbacks:
+            return False
+        bits = self.manager.coverage(self.primary)
+        if bits is None:
+            return False
+        for char in text:
+            code = ord(char)
+            if not bits[code >> 3] & (1 << (code & 7)) and not char.isspace():
+                return True
+        return False
+
+    def font_for(self, char: str, font: ImageFont.ImageFont) -> ImageFont.ImageFont:
+        """返回绘制该字符使用的字体，font 为主字体在当前字号的对象"""
+        if char.isspace() or self.manager.covers(self.primary, char):
+            return font
+        path = self._fallback_path(char)
+        if path is None:
+            return font
+        return self.manager.get(path, font.size)
+
+    def split_runs(
+        self, text: str, font: ImageFont.ImageFont
+    ) -> List[Tuple[str, ImageFont.ImageFont]]:
+        """把文字拆成使用同一字体的连续片段"""
+        runs: List[Tuple[str, ImageFont.ImageFont]] = []
+        for char in text:
+            face = self.font_for(char, font)
+            if runs and runs[-1][1] is face:
+                runs[-1] = (runs[-1][0] + char, face)
+            else:
+                runs.append((char, face))
+        return runs
@@ -0,0 +1,277 @@
+import json
+import marshal
+import math
+import os
+import random
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from astrbot.api import logger
+
+from .io_utils import atomic_write_bytes
+from .sampling import AliasSampler
+
+
+FORTUNE_WEIGHTINGS = ("bucket", "entry", "luck")
+TABLE_CACHE_VERSION = 3
+
+
+class FortuneEntry:
+    """一条编译好的运势，缺失的字段在编译时填好默认文本"""
+
+    __slots__ = (
+        "bucket",
+        "index",
+        "fortune_summary",
+        "lucky_star",
+        "sign_text",
+        "unsign_text",
+        "luck_value",
+    )
+
+    def __init__(
+        self,
+        bucket: str,
+        index: int,
+        fortune_summary: str,
+        lucky_star: str,
+        sign_text: str,
+        unsign_text: str,
+        luck_value: float,
+    ):
+        self.bucket = bucket
+        self.index = index
+        self.fortune_summary = fortune_summary
+        self.lucky_star = lucky_star
+        self.sign_text = sign_text
+        self.unsign_text = unsign_text
+        self.luck_value = luck_value
+
+    def to_tuple(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    @classmethod
+    def from_tuple(cls, row) -> "FortuneEntry":
+        """
+        从 to_tuple 的结果还原，字段类型不对时抛出 ValueError
+        """
+        if not isinstance(row, tuple) or len(row) != len(_ENTRY_FIELD_TYPES):
+            raise ValueError("运势条目格式错误")
+        for value, kind in zip(row, _ENTRY_FIELD_TYPES):
+            if type(value) is not kind:
+                raise ValueError("运势条目格式错误")
+        return cls(*row)
+
+
+# FortuneEntry 各字段的类型，与 __slots__ 的顺序一致
+_ENTRY_FIELD_TYPES = (str, int, str, str, str, str, float)
+
+
+def _as_luck(value) -> Optional[float]:
+    try:
+        luck = float(value)
+    except (TypeError, ValueError):
+        return None
+    return luck if math.isfinite(luck) else None
+
+
+def _luck_value(item: dict, bucket: str) -> float:
+    """
+    运势的幸运值：优先使用条目的 luckValue，缺失或不是数字时使用分组键
+    (jrys.json 的分组键就是该组的幸运值)；都不是数字时为 0
+    """
+    luck = _as_luck(item.get("luckValue"))
+    if luck is None:
+        luck = _as_luck(bucket)
+    return max(0.0, luck or 0.0)
+
+
+def _entry_weights(entries: Sequence[FortuneEntry], weighting: str) -> List[float]:
+    """
+    计算每条运势的抽取权重
+    bucket: 先等概率选分组再等概率选组内条目(与之前的抽取方式一致)
+    entry: 每条运势等概率
+    luck: 按 luckValue 加权，幸运值为 0 的运势不会被抽到
+    """
+    if weighting == "entry":
+        return [1.0] * len(entries)
+    if weighting == "luck":
+        weights = [e.luck_value for e in entries]
+        if sum(weights) > 0:
+            return weights
+        return [1.0] * len(entries)
+    sizes: Dict[str, int] = {}
+    for e in entries:
+        sizes[e.bucket] = sizes.get(e.bucket, 0) + 1
+    return [1.0 / sizes[e.bucket] for e in entries]
+
+
+class FortuneTable:
+    """
+    编译好的运势表
+    所有运势展开成一个扁平的元组，配合预先构建的别名采样器，抽取一条运势是 O(1) 且不分配新对象
+    """
+
+    def __init__(self, entries: Sequence[FortuneEntry], weighting: str = "bucket"):
+        self.entries: Tuple[FortuneEntry, ...] = tuple(entries)
+        self.weighting = weighting
+        self._lookup: Dict[Tuple[str, int], FortuneEntry] = {
+            (e.bucket, e.index): e for e in self.entries
+        }
+        self._sampler = (
+            AliasSampler(_entry_weights(self.entries, weighting))
+            if self.entries
+            else None
+        )
+
+    @classmethod
+    def compile(cls, data: dict, weighting: str = "bucket") -> "FortuneTable":
+        """
+        把 jrys.json 的内容编译成运势表
+        Args:
+            data (dict): 分组键 -> 运势列表
+            weighting (str): 抽取权重，见 FORTUNE_WEIGHTINGS
+        """
+        entries = []
+        for bucket, items in data.items():
+            if not isinstance(items, list):
+                continue
+            for index, item in enumerate(items):
+                if not isinstance(item, dict):
+                    continue
+                entries.append(
+                    FortuneEntry(
+                        str(bucket),
+                        index,
+                        item.get("fortuneSummary", "运势数据未知"),
+                        item.get("luckyStar", "幸运星未知"),
+                        item.get("signText", "星座运势未知"),
+                        item.get("unsignText", "非星座运势未知"),
+                        _luck_value(item, bucket),
+                    )
+                )
+        return cls(entries, weighting)
+
+    def pick(self, rng: random.Random = random) -> Optional[FortuneEntry]:
+        """按权重抽取一条运势，运势表为空时返回 None"""
+        if self._sampler is None:
+            return None
+        return self.entries[self._sampler.sample(rng)]
+
+    def get(self, bucket: str, index: int) -> Optional[FortuneEntry]:
+        return self._lookup.get((bucket, index))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+EMPTY_TABLE = FortuneTable(())
+
+
+class FortuneStore:
+    """
+    运势表的加载和热更新
+    1. 按 jrys.json 的修改时间和大小判断是否需要重新加载，文件变化后自动生效，不需要重启
+    2. 编译结果用 marshal 保存为二进制缓存，源文件没有变化时跳过 JSON 解析；
+       marshal 只能还原内置类型，缓存文件被改坏也不会执行任何代码
+    3. 新表编译完成后整体替换，读取方看到的总是一份完整的表；加载失败时继续使用旧表
+    """
+
+    def __init__(
+        self,
+        path: str,
+        cache_path: Optional[str] = None,
+        weighting: str = "bucket",
+    ):
+        if weighting not in FORTUNE_WEIGHTINGS:
+            logger.warning(f"未知的运势权重 {weighting}，使用 bucket")
+            weighting = "bucket"
+        self.path = path
+        self.cache_path = cache_path
+        self.weighting = weighting
+        self.table: FortuneTable = EMPTY_TABLE
+        self._signature: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def is_stale(self) -> bool:
+        """源文件是否在上次加载后发生了变化"""
+        return self._stat() != self._signature
+
+    def _read_cache(self, signature: Tuple[int, int]) -> Optional[FortuneTable]:
+        if not self.cache_path:
+            return None
+        try:
+            with open(self.cache_path, "rb") as f:
+                data = marshal.load(f)
+            if not isinstance(data, tuple) or len(data) != 2:
+                raise ValueError("缓存格式错误")
+            header, rows = data
+            if header != (TABLE_CACHE_VERSION, marshal.version, signature):
+                return None
+            if not isinstance(rows, tuple):
+                raise ValueError("缓存格式错误")
+            entries = [FortuneEntry.from_tuple(row) for row in rows]
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"读取运势表缓存 {self.cache_path} 失败: {e}")
+            return None
+        return FortuneTable(entries, self.weighting)
+
+    def _write_cache(self, signature: Tuple[int, int], table: FortuneTable):
+        if not self.cache_path:
+            return
+        # (版本, marshal 格式版本, 源文件签名), 条目元组
+        data = (
+            (TABLE_CACHE_VERSION, marshal.version, signature),
+            tuple(e.to_tuple() for e in table.entries),
+        )
+        try:
+            atomic_write_bytes(self.cache_path, marshal.dumps(data))
+        except OSError as e:
+            logger.warning(f"保存运势表缓存 {self.cache_path} 失败: {e}")
+
+    def load(self) -> FortuneTable:
+        """
+        按需加载运势表(同步函数，会访问磁盘)
+        Returns:
+            FortuneTable: 当前的运势表，源文件没有变化时直接返回
+        """
+        signature = self._stat()
+        if signature == self._signature:
+            return self.table
+
+        with self._lock:
+            if signature == self._signature:
+                return self.table
+            if signature is None:
+                logger.error(f"运势数据文件 {self.path} 不存在")
+                self._signature = None
+                return self.table
+
+            table = self._read_cache(signature)
+            if table is None:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                    if not isinstance(data, dict):
+                        raise ValueError("顶层必须是对象")
+                except (OSError, ValueError) as e:
+                    # 记住这个版本，文件修改之前不再重复读取
+                    logger.error(f"读取运势数据文件 {self.path} 失败: {e}")
+                    self._signature = signature
+                    return self.table
+                table = FortuneTable.compile(data, self.weighting)
+                self._write_cache(signature, table)
+
+            self.table = table
+            self._signature = signature
+            logger.info(f"读取运势数据文件: {self.path}，共 {len(table)} 条运势")
+            return table
@@ -0,0 +1,257 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+
+GLYPH_CACHE_SIZE = 2048
+
+BBox = Tuple[int, int, int, int]
+
+
+class GlyphMaskCache:
+    """
+    字形蒙版缓存
+    以 (字体路径, 字号, 字符) 为键缓存字形蒙版和 bbox，超出上限时按最近最少使用淘汰。
+    日期行和幸运星行只用到很少的字符，缓存命中后每次只需要重新填充颜色。
+    渲染在多个线程中进行，所有读写都在锁内完成；返回的蒙版是共享对象，调用方不能修改。
+    """
+
+    def __init__(self, max_items: int = GLYPH_CACHE_SIZE):
+        self.max_items = max(0, int(max_items))
+        self._items: "OrderedDict[tuple, Tuple[Image.Image, BBox]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(font: ImageFont.ImageFont, char: str) -> tuple:
+        # 默认字体没有路径，用对象 id 区分
+        return (getattr(font, "path", None) or id(font), getattr(font, "size", 0), char)
+
+    def get(self, font: ImageFont.ImageFont, char: str) -> Tuple[Image.Image, BBox]:
+        """
+        获取字符的字形蒙版
+        参数：
+            font (ImageFont): 字体对象
+            char (str): 单个字符
+        返回：
+            (蒙版, bbox): 蒙版为 L 模式图像，bbox 为 font.getbbox(char) 的结果
+        """
+        key = self._key(font, char)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item
+            self.misses += 1
+
+        item = self._rasterize(font, char)
+
+        if self.max_items > 0:
+            with self._lock:
+                self._items[key] = item
+                self._items.move_to_end(key)
+                while len(self._items) > self.max_items:
+                    self._items.popitem(last=False)
+        return item
+
+    @staticmethod
+    def _rasterize(font: ImageFont.ImageFont, char: str) -> Tuple[Image.Image, BBox]:
+        bbox = font.getbbox(char)
+        width = bbox[2] - bbox[0]  # 字符宽度
+        height = bbox[3] - bbox[1]  # 字符高度
+        if width <= 0 or height <= 0:
+            # 空白字符没有墨迹，使用字符的步进宽度和字号
+            width = max(1, int(font.getlength(char)))
+            height = max(1, int(getattr(font, "size", 1)))
+            offset_x, offset_y = 0, 0
+        else:
+            offset_x = -bbox[0]
+            offset_y = -bbox[1]
+
+        mask = Image.new("L", (width, height), 0)
+        ImageDraw.Draw(mask).text((offset_x, offset_y), char, font=font, fill=255)
+        return mask, bbox
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+# 进程内共享的字形蒙版缓存
+glyph_mask_cache = GlyphMaskCache()
+
+
+def _interpolate(
+    local_x: np.ndarray, widths: np.ndarray, stops: np.ndarray, counts: np.ndarray
+) -> np.ndarray:
+    """
+    按列计算多段渐变的颜色，可以一次处理多个字符
+    颜色段的划分和取整方式与逐列画线的旧实现相同：第 i 段覆盖 [int(i*w), int((i+1)*w)) 列，
+    颜色按 int() 向零取整；最后一段之后没有被覆盖的列为黑色
+    参数：
+        local_x: 每一列在所属字符内的横坐标
+        widths: 每一列所属字符的渐变宽度
+        stops: 每一列所属字符的渐变色，形状为 (列数, 颜色数, 3)
+        counts: 每一列所属字符的颜色数
+    返回：
+        np.ndarray: 形状为 (列数, 3) 的 uint8 数组
+    """
+    segment_width = widths / (counts - 1)  # 每个颜色段的宽度
+    # int(i * w) <= x 等价于 i * w < x + 1，取满足条件的最大 i，再修正浮点误差
+    segment = np.ceil((local_x + 1) / segment_width).astype(np.int64) - 1
+    segment -= (segment * segment_width).astype(np.int64) > local_x
+    segment += ((segment + 1) * segment_width).astype(np.int64) <= local_x
+    covered = local_x < ((counts - 1) * segment_width).astype(np.int64)
+    segment = np.clip(segment, 0, counts - 2)
+
+    factor = (local_x - (segment * segment_width).astype(np.int64)) / segment_width
+    rows = np.arange(len(local_x))
+    start = stops[rows, segment]
+    end = stops[rows, segment + 1]
+    columns = start + (end - start) * factor[:, None]
+    columns[~covered] = 0
+    return columns.astype(np.uint8)  # 与 int() 相同，向零取整
+
+
+def gradient_columns(width: int, colors: Sequence[Tuple[int, int, int]]) -> np.ndarray:
+    """
+    计算横向多颜色渐变每一列的颜色，与逐列画线的旧实现逐像素一致
+    参数：
+        width (int): 渐变宽度
+        colors (list of tuple): 渐变色列表，至少包含两个颜色
+    返回：
+        np.ndarray: 形状为 (width, 3) 的 uint8 数组
+    """
+    num_colors = len(colors)
+    if num_colors < 2:
+        raise ValueError("至少需要两个颜色进行渐变")
+
+    stops = np.asarray(colors, dtype=np.float64)[:, :3]
+    return _interpolate(
+        np.arange(width),
+        np.full(width, width),
+        np.broadcast_to(stops, (width,) + stops.shape),
+        np.full(width, num_colors),
+    )
+
+
+def fill_gradient(mask: Image.Image, colors: List[Tuple[int, int, int]]) -> Image.Image:
+    """
+    用横向多颜色渐变填充字形蒙版
+    参数：
+        mask (Image): L 模式字形蒙版
+        colors (list of tuple): 渐变色列表，至少包含两个颜色
+    返回：
+        Image: 渐变色字体图像(RGBA)
+    """
+    width, height = mask.size
+    pixels = np.empty((height, width, 4), dtype=np.uint8)
+    pixels[:, :, :3] = gradient_columns(width, colors)
+    pixels[:, :, 3] = np.asarray(mask)  # 添加蒙版
+    return Image.fromarray(pixels, "RGBA")
+
+
+def create_gradient_glyph(
+    char: str,
+    font: ImageFont.ImageFont,
+    colors: List[Tuple[int, int, int]],
+    cache: Optional[GlyphMaskCache] = None,
+) -> Image.Image:
+    """
+    创建渐变色字体图像
+    参数：
+        char (str): 要绘制的字符
+        font: ImageFont对象
+        colors (list of tuple): 渐变色列表，至少包含两个颜色
+        cache (GlyphMaskCache): 字形蒙版缓存，默认使用进程内共享缓存
+    返回：
+        Image: 渐变色字体图像(RGBA)
+    """
+    cache = cache if cache is not None else glyph_mask_cache
+    mask, _ = cache.get(font, char)
+    return fill_gradient(mask, colors)
+
+
+def draw_gradient_line(
+    img: Image.Image,
+    line: str,
+    font: ImageFont.ImageFont,
+    x: int,
+    y: int,
+    color_func: Callable[[], List[Tuple[int, int, int]]],
+    cache: Optional[GlyphMaskCache] = None,
+    font_for: Optional[Callable[[str], ImageFont.ImageFont]] = None,
+) -> Image.Image:
+    """
+    绘制一行渐变色文字
+    每个字符仍然有自己的一组渐变色，但整行的蒙版和颜色先在数组中拼好，只贴图一次
+    参数：
+        img (Image): 要绘制的图片
+        line (str): 一行文字
+        font (ImageFont): 字体对象
+        x (int): 起始x坐标(已包含居中偏移)
+        y (int): y坐标
+        color_func: 每个字符调用一次，返回该字符的渐变色列表
+        cache (GlyphMaskCache): 字形蒙版缓存，默认使用进程内共享缓存
+        font_for: 按字符选择字体(主字体缺字时使用回退字体)，为None时全部使用 font
+    返回：
+        Image: 绘制后的图片
+    """
+    cache = cache if cache is not None else glyph_mask_cache
+
+    # 1. 按原来逐字符贴图的方式计算每个字符的位置(字形墨迹顶端对齐 y)
+    glyphs = []
+    base_x = x
+    offset_x = 0
+    for char in line:
+        mask, bbox = cache.get(font_for(char) if font_for else font, char)
+        glyphs.append((mask, base_x + offset_x, color_func()))
+        base_x += bbox[2] - bbox[0]  # 更新x坐标
+        offset_x += bbox[0]  # 更新偏移量
+    if not glyphs:
+        return img
+
+    left = min(gx for _, gx, _ in glyphs)
+    right = max(gx + mask.width for mask, gx, _ in glyphs)
+    height = max(mask.height for mask, _, _ in glyphs)
+    num_colors = max(len(colors) for _, _, colors in glyphs)
+    if num_colors < 2:
+        raise ValueError("至少需要两个颜色进行渐变")
+
+    # 2. 拼出整行的蒙版，并记下每一列属于哪个字符；字形重叠时后面的字符在上
+    alpha = np.zeros((height, right - left), dtype=np.uint8)
+    owner = np.full(right - left, -1, dtype=np.int64)
+    widths = np.empty(len(glyphs), dtype=np.int64)
+    starts = np.empty(len(glyphs), dtype=np.int64)
+    counts = np.empty(len(glyphs), dtype=np.int64)
+    stops = np.zeros((len(glyphs), num_colors, 3), dtype=np.float64)
+    for i, (mask, gx, colors) in enumerate(glyphs):
+        width, glyph_height = mask.size
+        start = gx - left
+        region = alpha[:glyph_height, start : start + width]
+        np.maximum(region, np.asarray(mask), out=region)
+        owner[start : start + width] = i
+        widths[i], starts[i], counts[i] = width, start, len(colors)
+        stops[i, : len(colors)] = [c[:3] for c in colors]
+
+    # 3. 整行的渐变色一次插值得到，每一列颜色相同，纵向拉伸到行高
+    columns = np.zeros((1, right - left, 3), dtype=np.uint8)
+    cols = np.flatnonzero(owner >= 0)
+    k = owner[cols]
+    columns[0, cols] = _interpolate(cols - starts[k], widths[k], stops[k], counts[k])
+    layer = Image.fromarray(columns, "RGB").resize((right - left, height), Image.NEAREST)
+    layer.putalpha(Image.fromarray(alpha, "L"))
+
+    # 4. 整行一次贴图
+    img.paste(layer, (left, y), layer)
+    return img
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import uuid
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+import aiofiles
+import aiofiles.os
+
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    并发请求合并
+    同一个键同时只会有一次实际的获取，期间到达的其他调用直接等待同一个结果。
+    实际的获取运行在独立的任务中，某个等待方被取消不会影响其他等待方。
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0  # 实际执行的次数
+        self.coalesced = 0  # 被合并掉的次数
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行或加入一次获取
+        Args:
+            key: 合并用的键，例如 ("avatar", user_id)
+            func: 没有进行中的获取时调用，返回可等待对象
+        Returns:
+            获取的结果，多个并发调用方得到同一个结果(或同一个异常)
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        self.calls += 1
+        future = asyncio.ensure_future(func())
+        self._inflight[key] = future
+
+        def _done(fut: asyncio.Future):
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+            if not fut.cancelled():
+                fut.exception()  # 标记异常已被读取，避免没有等待方时输出警告
+
+        future.add_done_callback(_done)
+        return await asyncio.shield(future)
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "inflight": self.inflight,
+        }
+
+
+def temp_path_for(path: str) -> str:
+    """生成与目标文件同目录的临时文件路径，保证重命名是同一文件系统内的原子操作"""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+
+
+def atomic_write_bytes(path: str, data: bytes):
+    """先写临时文件再重命名，读取方不会看到写了一半的文件(同步版本)"""
+    tmp_path = temp_path_for(path)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+async def async_atomic_write(path: str, data: bytes):
+    """先写临时文件再重命名，读取方不会看到写了一半的文件(异步版本)"""
+    tmp_path = temp_path_for(path)
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            await f.write(data)
+        await aiofiles.os.replace(tmp_path, path)
+    finally:
+        if await aiofiles.os.path.exists(tmp_path):
+            await aiofiles.os.remove(tmp_path)
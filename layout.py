@@ -0,0 +1,141 @@
+from typing import Dict, NamedTuple, Optional, Tuple
+
+
+# 参考版式：1080x1920 画布上的像素位置，其他尺寸的画布按比例缩放
+REFERENCE_WIDTH = 1080
+REFERENCE_HEIGHT = 1920
+
+TEXT_BOX_Y = 1270
+TEXT_BOX_HEIGHT = 700
+TEXT_BOX_RADIUS = 50
+TEXT_BOX_COLOR = (0, 0, 0, 128)
+
+AVATAR_SIZE = (150, 150)
+AVATAR_POSITION = (60, 1350)
+
+DATE_Y = 1300
+SUMMARY_Y = 1400
+LUCKY_STAR_Y = 1500
+SIGN_TEXT_Y = 1600
+UNSIGN_TEXT_Y = 1700
+WARNING_TEXT_Y = 1850
+
+UNSIGN_TEXT_Y_OFFSET = 15
+TEXT_WRAP_WIDTH = 1000
+LEFT_PADDING = 20
+
+# 渲染尺寸配置：名称 -> 画布尺寸
+# fast 的像素数约为 standard 的 44%，渲染和编码更快，海报也更小
+RENDER_PROFILES: Dict[str, Tuple[int, int]] = {
+    "standard": (REFERENCE_WIDTH, REFERENCE_HEIGHT),
+    "fast": (720, 1280),
+}
+
+
+class PosterLayout(NamedTuple):
+    """
+    海报版式，所有位置和尺寸都是画布上的像素
+    字段名与渲染器配置中的键相同，可以直接从配置中读取
+    """
+
+    image_width: int
+    image_height: int
+    panel_geometry: tuple  # (x, y, 宽, 高, 圆角半径, 颜色)
+    avatar_position: Tuple[int, int]
+    avatar_size: Tuple[int, int]
+    date_y: int
+    summary_y: int
+    lucky_star_y: int
+    sign_text_y: int
+    unsign_text_y: int
+    warning_text_y: int
+    date_font_size: int = 50
+    summary_font_size: int = 60
+    lucky_star_font_size: int = 60
+    text_font_size: int = 30  # 签文、解签和警告文字
+    unsign_count_font_size: int = 36  # 统计解签行数用的字号(与绘制用的字号不同，沿用原有的排版)
+    wrap_width: int = TEXT_WRAP_WIDTH
+    left_padding: int = LEFT_PADDING
+    unsign_line_offset: int = UNSIGN_TEXT_Y_OFFSET  # 解签超过 3 行时每多一行上移的像素
+
+    @classmethod
+    def from_config(cls, config: dict) -> "PosterLayout":
+        """从渲染器配置中读取版式，配置中没有的可选字段使用参考版式的值"""
+        values = {name: config[name] for name in cls._fields if name in config}
+        for name in ("panel_geometry", "avatar_position", "avatar_size"):
+            values[name] = tuple(values[name])
+        return cls(**values)
+
+    def scaled(self, width: int, height: int) -> "PosterLayout":
+        """
+        把版式缩放到另一个画布尺寸
+        横向位置按宽度比例、纵向位置按高度比例缩放；字号、头像、圆角和行距按两者中较小的比例缩放，
+        宽高比不同时文字也不会超出面板
+        Args:
+            width (int): 画布宽度
+            height (int): 画布高度
+        Returns:
+            PosterLayout: 缩放后的版式，尺寸相同时与原版式相等
+        """
+        sx = width / self.image_width
+        sy = height / self.image_height
+        s = min(sx, sy)
+
+        def x(v: int) -> int:
+            return round(v * sx)
+
+        def y(v: int) -> int:
+            return round(v * sy)
+
+        def k(v: int) -> int:
+            return max(1, round(v * s))
+
+        px, py, pw, ph, radius, color = self.panel_geometry
+        return PosterLayout(
+            image_width=width,
+            image_height=height,
+            panel_geometry=(x(px), y(py), x(pw), y(ph), k(radius), color),
+            avatar_position=(x(self.avatar_position[0]), y(self.avatar_position[1])),
+            avatar_size=(k(self.avatar_size[0]), k(self.avatar_size[1])),
+            date_y=y(self.date_y),
+            summary_y=y(self.summary_y),
+            lucky_star_y=y(self.lucky_star_y),
+            sign_text_y=y(self.sign_text_y),
+            unsign_text_y=y(self.unsign_text_y),
+            warning_text_y=y(self.warning_text_y),
+            date_font_size=k(self.date_font_size),
+            summary_font_size=k(self.summary_font_size),
+            lucky_star_font_size=k(self.lucky_star_font_size),
+            text_font_size=k(self.text_font_size),
+            unsign_count_font_size=k(self.unsign_count_font_size),
+            wrap_width=x(self.wrap_width),
+            left_padding=x(self.left_padding),
+            unsign_line_offset=k(self.unsign_line_offset),
+        )
+
+
+REFERENCE_LAYOUT = PosterLayout(
+    image_width=REFERENCE_WIDTH,
+    image_height=REFERENCE_HEIGHT,
+    panel_geometry=(
+        0,
+        TEXT_BOX_Y,
+        REFERENCE_WIDTH,
+        TEXT_BOX_HEIGHT,
+        TEXT_BOX_RADIUS,
+        TEXT_BOX_COLOR,
+    ),
+    avatar_position=AVATAR_POSITION,
+    avatar_size=AVATAR_SIZE,
+    date_y=DATE_Y,
+    summary_y=SUMMARY_Y,
+    lucky_star_y=LUCKY_STAR_Y,
+    sign_text_y=SIGN_TEXT_Y,
+    unsign_text_y=UNSIGN_TEXT_Y,
+    warning_text_y=WARNING_TEXT_Y,
+)
+
+
+def get_render_size(name: str) -> Optional[Tuple[int, int]]:
+    """按名称获取渲染尺寸配置，不存在时返回 None"""
+    return RENDER_PROFILES.get(name)
@@ -2,42 +2,67 @@ from astrbot.api.event import filter, AstrMessageEvent
 from astrbot.api.star import Context, Star, register
 from astrbot.api import logger
 from astrbot.api import AstrBotConfig
-import random
+import astrbot.api.message_components as Comp
 import json
+import math
 import os
-import tempfile
-from typing import Optional, List, Tuple
-from PIL import Image, ImageDraw, ImageFont
+from typing import List, Optional, Tuple
 import aiohttp
 from datetime import datetime
 import asyncio
+import time
 import aiofiles
 import aiofiles.os
 
+from .admission import Overloaded, RateLimiter, RenderGate
+from .avatar_store import AvatarStore, avatar_entry_key
+from .background_index import BackgroundIndex, parse_pack_weights
+from .background_prefetch import BackgroundPrefetcher
+from .background_templates import template_entry_key
+from .delivery import PosterSpool, wants_bytes
+from .disk_cache import DiskCacheManager
+from .encoders import (
+    DEFAULT_PROFILE,
+    EncodedPoster,
+    EncoderStats,
+    get_profile,
+    parse_profile_overrides,
+    select_profile,
+)
+from .fetcher import ImageFetcher
+from .font_manager import SYSTEM_FALLBACK_FONTS
+from .fortune_table import FortuneTable
+from .io_utils import SingleFlight
+from .layout import (
+    AVATAR_POSITION,
+    AVATAR_SIZE,
+    DATE_Y,
+    LUCKY_STAR_Y,
+    REFERENCE_HEIGHT,
+    REFERENCE_LAYOUT,
+    REFERENCE_WIDTH,
+    SIGN_TEXT_Y,
+    SUMMARY_Y,
+    UNSIGN_TEXT_Y,
+    WARNING_TEXT_Y,
+    get_render_size,
+)
+from .metrics import Metrics, MetricsExporter
+from .poster_cache import PosterCache, daily_seed, today_str
+from .prerender import ActiveUsers, PrerenderScheduler
+from .render_backend import create_render_backend
+from .renderer import PosterRenderer, RenderSpec
 
 ONE_DAY_IN_SECONDS = 86400
-IMAGE_HEIGHT = 1920
-IMAGE_WIDTH = 1080
-AVATAR_SIZE = (150, 150)
-AVATAR_POSITION = (60, 1350)
 FONT_NAME = "千图马克手写体.ttf"
 
-TEXT_BOX_Y = 1270
-TEXT_BOX_HEIGHT = 700
-TEXT_BOX_RADIUS = 50
-
-DATE_Y = 1300
-SUMMARY_Y = 1400
-LUCKY_STAR_Y = 1500
-SIGN_TEXT_Y = 1600
-UNSIGN_TEXT_Y = 1700
-WARNING_TEXT_Y = 1850
-
-WARNING_TEXT_Y_OFFSET = 10
-UNSIGN_TEXT_Y_OFFSET = 15
-TEXT_WRAP_WIDTH = 1000
-
-LEFT_PADDING = 20
+POSTER_MEMORY_CACHE_SIZE = 64
+BATCH_MAX_USERS = 10
+DEAD_LINK_RESAMPLES = 3
+SPRITE_WARMUP_POLL_INTERVAL = 0.5  # 预生成文字图层时，有请求正在渲染则每隔多少秒再检查
+OVERLOADED_REPLY = "现在生成运势的人太多啦，请稍后再试～"
+# 支持合并转发消息的平台
+FORWARD_PLATFORMS = ("aiocqhttp",)
 
 
 @register("今日运势", "ominus", "一个今日运势海报生成图", "1.0.0")
@@ -53,21 +78,32 @@ class JrysPlugin(Star):
         )  # 默认一天过期
         self.font_name = self.config.get("font_name", FONT_NAME)  # 默认字体名称
 
-        self.image_width = self.config.get("img_width", IMAGE_WIDTH)
-        self.image_height = self.config.get("img_height", IMAGE_HEIGHT)  # 默认图片高度
-
-        avatar_position_list = self.config.get("avatar_position", list(AVATAR_POSITION))
-        self.avatar_position = tuple(avatar_position_list)  # 默认头像位置
-
-        avatar_size_list = self.config.get("avatar_size", list(AVATAR_SIZE))
-        self.avatar_size = tuple(avatar_size_list)
+        # 画布尺寸：渲染尺寸配置(standard/fast)，或 custom 时使用 img_width/img_height
+        self.render_profile = self.config.get("render_profile", "custom")
+        render_size = get_render_size(self.render_profile)
+        if render_size is None:
+            if self.render_profile != "custom":
+                logger.warning(f"未知的渲染尺寸配置 {self.render_profile}，使用 img_width/img_height")
+            render_size = (
+                self.config.get("img_width", REFERENCE_WIDTH),
+                self.config.get("img_height", REFERENCE_HEIGHT),  # 默认图片高度
+            )
 
-        self.date_y = self.config.get("date_y_position", DATE_Y)
-        self.summary_y = self.config.get("summary_y_position", SUMMARY_Y)
-        self.lucky_star_y = self.config.get("lucky_star_y_position", LUCKY_STAR_Y)
-        self.sign_text_y = self.config.get("sign_text_y_position", SIGN_TEXT_Y)
-        self.unsign_text_y = self.config.get("unsign_text_y_position", UNSIGN_TEXT_Y)
-        self.warning_text_y = self.config.get("warning_text_y_position", WARNING_TEXT_Y)
+        # 版式：配置中的位置和尺寸以 1080x1920 的参考画布为准，按实际画布尺寸等比缩放
+        reference_layout = REFERENCE_LAYOUT._replace(
+            avatar_position=tuple(self.config.get("avatar_position", list(AVATAR_POSITION))),
+            avatar_size=tuple(self.config.get("avatar_size", list(AVATAR_SIZE))),
+            date_y=self.config.get("date_y_position", DATE_Y),
+            summary_y=self.config.get("summary_y_position", SUMMARY_Y),
+            lucky_star_y=self.config.get("lucky_star_y_position", LUCKY_STAR_Y),
+            sign_text_y=self.config.get("sign_text_y_position", SIGN_TEXT_Y),
+            unsign_text_y=self.config.get("unsign_text_y_position", UNSIGN_TEXT_Y),
+            warning_text_y=self.config.get("warning_text_y_position", WARNING_TEXT_Y),
+        )
+        self.layout = reference_layout.scaled(*render_size)
+        self.image_width = self.layout.image_width
+        self.image_height = self.layout.image_height
+        self.avatar_size = self.layout.avatar_size
 
         self.data_dir = os.path.dirname(os.path.abspath(__file__))
         self.avatar_dir = os.path.join(self.data_dir, "avatars")
@@ -82,44 +118,342 @@ class JrysPlugin(Star):
             timeout=self._http_timeout, connector=self._connection_limit
         )
 
-        self.fonts = {}
-        FONT_SIZES = [50, 60, 36, 30]  # 字体大小列表
-        try:
-            for size in FONT_SIZES:
-                self.fonts[size] = ImageFont.truetype(self.font_path, size)
+        # 下载合并表：同一张背景或同一个头像同时只下载一次
+        self.inflight = SingleFlight()
+
+        # 准入控制：按用户和群的令牌桶限制请求频率，全局限制同时进行的下载和渲染
+        limiter_keys = self.config.get("rate_limit_max_keys", 4096)
+        self.user_limiter = RateLimiter(
+            self.config.get("user_rate_burst", 3),
+            self.config.get("user_rate_interval", 10),
+            max_keys=limiter_keys,
+        )
+        self.group_limiter = RateLimiter(
+            self.config.get("group_rate_burst", 20),
+            self.config.get("group_rate_interval", 2),
+            max_keys=limiter_keys,
+        )
+        self.render_gate = RenderGate(
+            self.config.get("max_concurrent_renders", 4),
+            self.config.get("max_render_queue", 16),
+        )
+        # 图片下载：流式读取并限制大小，非图片响应在写入前中止
+        self.fetcher = ImageFetcher(
+            self._session,
+            connect_timeout=self.config.get("http_connect_timeout", 3),
+            read_timeout=self.config.get("http_read_timeout", 10),
+            retries=self.config.get("http_retries", 2),
+            breaker_threshold=self.config.get("circuit_breaker_threshold", 5),
+            breaker_cooldown=self.config.get("circuit_breaker_cooldown", 30),
+            negative_ttl=self.config.get("negative_cache_ttl", 3600),
+        )
+        self.background_max_bytes = self.config.get("background_max_mb", 20) * 1024 * 1024
+
+        # 指标：各阶段耗时直方图和计数器，可通过 /jrys_stats 查看，并定期导出为 Prometheus 文本
+        self.metrics = Metrics(enabled=self.config.get("metrics_enabled", True))
+        self.metrics_exporter = None
+        metrics_interval = self.config.get("metrics_dump_interval", 60)
+        if self.metrics.enabled and metrics_interval > 0:
+            self.metrics_exporter = MetricsExporter(
+                self.metrics,
+                os.path.join(self.data_dir, "metrics.prom"),
+                interval=metrics_interval,
+            )
+            self.metrics_exporter.start()
+
+        # 磁盘缓存容量管理：头像和背景目录超过上限时按访问记录淘汰
+        cache_policy = self.config.get("disk_cache_policy", "lru")
+        cache_gc_interval = self.config.get("disk_cache_gc_interval", 600)
+        self.avatar_cache = DiskCacheManager(
+            "头像",
+            self.avatar_dir,
+            avatar_entry_key,
+            max_bytes=self.config.get("avatar_cache_max_mb", 64) * 1024 * 1024,
+            max_entries=self.config.get("avatar_cache_max_entries", 0),
+            policy=cache_policy,
+            interval=cache_gc_interval,
+        )
+
+        # 头像缓存：保存处理好的圆形头像，过期后用条件请求重新验证
+        self.avatar_store = AvatarStore(
+            self._session,
+            self.avatar_dir,
+            self.avatar_size,
+            self.avatar_cache_expiration,
+            disk_cache=self.avatar_cache,
+            fetcher=self.fetcher,
+            max_bytes=self.config.get("avatar_max_kb", 2048) * 1024,
+        )
 
-        except Exception:
-            logger.error(f"无法加载字体文件 {self.font_path},使用默认字体回退")
-            self.default_font = ImageFont.load_default()
-            for size in FONT_SIZES:
-                self.fonts[size] = self.default_font
+        # 背景 URL 索引：启动时加载所有背景包，之后按文件修改时间增量刷新
+        self.background_image_dir = os.path.join(self.background_dir, "images")
+        os.makedirs(self.background_image_dir, exist_ok=True)
+        self.background_index = BackgroundIndex(
+            self.background_dir,
+            self.background_image_dir,
+            policy=self.config.get("background_sample_policy", "url"),
+            pack_weights=parse_pack_weights(
+                self.config.get("background_pack_weights", [])
+            ),
+        )
+        background_max_entries = self.config.get("background_cache_max_entries", 0)
+        self.background_cache = DiskCacheManager(
+            "背景",
+            self.background_image_dir,
+            lambda name: name,
+            max_bytes=self.config.get("background_cache_max_mb", 512) * 1024 * 1024,
+            max_entries=background_max_entries,
+            policy=cache_policy,
+            interval=cache_gc_interval,
+            on_evict=self._on_background_evicted,
+        )
+        self.avatar_cache.start()
+        self.background_cache.start()
+
+        # 背景预取：后台下载背景图片，保持本地有足够的可用图片
+        self.prefetcher = None
+        if self.config.get("background_prefetch", True):
+            target_ready = self.config.get("prefetch_target_ready", 20)
+            if background_max_entries:
+                # 预取目标不能超过背景缓存的条目上限，否则下载和淘汰会来回进行
+                target_ready = min(target_ready, background_max_entries)
+            self.prefetcher = BackgroundPrefetcher(
+                self._session,
+                self.background_index,
+                concurrency=self.config.get("prefetch_concurrency", 2),
+                bandwidth_limit=self.config.get("prefetch_bandwidth_kb", 0) * 1024,
+                target_ready=target_ready,
+                warmup_requests=self.config.get("prefetch_warmup_requests", 10),
+                inflight=self.inflight,
+                fetcher=self.fetcher,
+                max_bytes=self.background_max_bytes,
+            )
+            self.prefetcher.start()
+
+        # 已经由各组件自己维护的计数，读取指标时再收集
+        self.metrics.add_collector(self._component_counters)
+        self.metrics.add_collector(self.fetcher.counters)
+
+        # 渲染器和渲染后端：thread 在线程池中渲染，process 在预加载好的渲染进程中渲染
+        self.fallback_fonts = self._fallback_fonts()
+        self.renderer = PosterRenderer(self._renderer_config())
+        self.render_backend = create_render_backend(
+            self.config.get("render_backend", "thread"),
+            self.renderer,
+            self._renderer_config(),
+            workers=self.config.get("render_workers", 2),
+            queue_size=self.config.get("render_queue_size", 8),
+        )
+        self.render_backend.start()
+
+        # 背景模板的磁盘容量：按背景的使用记录淘汰，背景图片被淘汰时它的模板也一起删除
+        self.template_cache = None
+        if self.renderer.template_store is not None:
+            self.template_cache = DiskCacheManager(
+                "背景模板",
+                self.renderer.template_store.cache_dir,
+                template_entry_key,
+                max_bytes=self.config.get("background_template_cache_max_mb", 256)
+                * 1024
+                * 1024,
+                policy=cache_policy,
+                interval=cache_gc_interval,
+            )
+            self.template_cache.start()
+
+        # 线程渲染时在后台预先生成所有运势的文字图层；渲染进程中按需生成
+        self._sprite_warmup = None
+        if self.render_backend.name == "thread" and self.config.get("text_sprite_warmup", True):
+            self._sprite_warmup = asyncio.create_task(self._warm_text_sprites())
+
+        # 海报发送：支持 base64 的平台直接发送内存中的字节，其余平台写入 spool 目录
+        self.output_mode = self.config.get("output_mode", "auto")
+        self.output_bytes_platforms = self.config.get("output_bytes_platforms", [])
+        self.spool = PosterSpool(os.path.join(self.data_dir, "spool"))
+        self.spool.start()
+
+        # 批量模式：/jrys @a @b 一次生成所有被@用户的运势
+        self.batch_output = self.config.get("batch_output", "auto")
+        self.batch_max_users = self.config.get("batch_max_users", BATCH_MAX_USERS)
+
+        # 编码配置：默认配置，以及按平台或群覆盖的规则
+        self.encoder_profile = self.config.get("encoder_profile", DEFAULT_PROFILE)
+        if get_profile(self.encoder_profile) is None:
+            logger.warning(f"未知的编码配置 {self.encoder_profile}，使用 {DEFAULT_PROFILE}")
+            self.encoder_profile = DEFAULT_PROFILE
+        self.encoder_overrides = parse_profile_overrides(
+            self.config.get("encoder_profile_overrides", [])
+        )
+        self.encoder_stats = EncoderStats()
+
+        # 每日固定运势：同一用户同一天抽到相同的运势，并缓存生成好的海报
+        self.daily_fortune_cache = self.config.get("daily_fortune_cache", False)
+        self.poster_cache = None
+        if self.daily_fortune_cache:
+            self.poster_cache = PosterCache(
+                os.path.join(self.data_dir, "poster_cache"),
+                max_memory_items=self.config.get(
+                    "poster_memory_cache_size", POSTER_MEMORY_CACHE_SIZE
+                ),
+            )
 
-        # 初始化jrys数据
-        self.jrys_data = {}
-        self.is_data_loaded = False
+        # 午夜预渲染：为最近活跃的用户提前生成当天的海报，依赖每日固定运势
+        self.prerender = None
+        if self.config.get("prerender_enabled", False):
+            if self.poster_cache is None:
+                logger.warning("午夜预渲染需要开启每日固定运势(daily_fortune_cache)，已忽略")
+            else:
+                self.prerender = PrerenderScheduler(
+                    ActiveUsers(
+                        max_users=self.config.get("prerender_max_users", 500),
+                        max_age_days=self.config.get("prerender_active_days", 3),
+                    ),
+                    self._prerender_user,
+                    busy=lambda: self.render_backend.pending > 0,
+                    cpu_budget=self.config.get("prerender_cpu_budget", 0.25),
+                    state_path=os.path.join(self.data_dir, "active_users.json"),
+                )
+                self.prerender.start()
 
         # 确保目录存在
         os.makedirs(self.avatar_dir, exist_ok=True)
         os.makedirs(self.background_dir, exist_ok=True)
         os.makedirs(self.font_dir, exist_ok=True)
 
+    def _renderer_config(self) -> dict:
+        """渲染器配置，只包含可以传给渲染进程的简单值"""
+        template_dir = None
+        if self.config.get("background_template_cache", True):
+            template_dir = os.path.join(self.background_dir, "templates")
+
+        return {
+            "font_path": self.font_path,
+            "fallback_fonts": self.fallback_fonts,
+            "jrys_path": os.path.join(self.data_dir, "jrys.json"),
+            "jrys_cache_path": os.path.join(self.data_dir, "jrys.table.cache"),
+            "fortune_weighting": self.config.get("fortune_weighting", "bucket"),
+            # 版式的字段名就是渲染器配置的键
+            **self.layout._asdict(),
+            "template_dir": template_dir,
+            "template_compress": self.config.get("background_template_compress", False),
+            "text_sprite_cache_size": self.config.get("text_sprite_cache_size", 512),
+        }
+
+    def _fallback_fonts(self) -> list:
+        """
+        回退字体列表：配置中的字体(字体目录下的文件名或绝对路径)在前，系统字体在后
+        主字体缺少某个字符的字形时，按顺序使用第一个包含该字符的字体
+        """
+        fonts = []
+        for name in self.config.get("fallback_fonts", []):
+            path = name if os.path.isabs(name) else os.path.join(self.font_dir, name)
+            if os.path.exists(path):
+                fonts.append(path)
+            else:
+                logger.warning(f"回退字体 {path} 不存在，已忽略")
+        fonts.extend(p for p in SYSTEM_FALLBACK_FONTS if os.path.exists(p))
+        return fonts
+
     @filter.command("jrys", alias=["今日运势", "运势"])
     async def jrys(self, event: AstrMessageEvent):
         """
         输入/jrys,"/今日运势", "/运势"指令后，生成今日运势海报
         """
 
+        targets = self._mentioned_users(event)
+        refusal = self._admit(event, max(1, len(targets)))
+        if refusal:
+            yield event.plain_result(refusal)
+            return
+        if targets:
+            async for result in self._jrys_batch(event, targets):
+                yield result
+            return
+
         user_id = event.get_sender_id()
         user_name = event.get_sender_name()
+        request_start = time.perf_counter()
+        self.metrics.inc("requests")
 
-        self.jrys_data = await self._load_jrys_data()  # 确保数据已加载
-        if not self.jrys_data:
+        fortunes = await self._load_jrys_data()  # 确保数据已加载
+        if not fortunes:
             logger.error("运势数据未加载或为空")
             yield event.plain_result("运势数据加载失败，请稍后再试～")
             return
 
         logger.info(f"正在为用户 {user_name}({user_id}) 生成今日运势")
 
+        encoder = select_profile(
+            self.encoder_profile,
+            self.encoder_overrides,
+            event.get_platform_name(),
+            event.get_group_id(),
+        )
+        suffix = get_profile(encoder).suffix
+        if self.prerender is not None:
+            self.prerender.touch(user_id, encoder)
+
+        # 每日固定运势模式下，当天已经生成过的海报直接返回，跳过整个渲染流程
+        seed = None
+        if self.poster_cache is not None:
+            cached = await self.poster_cache.get(user_id, encoder, suffix)
+            self.metrics.inc("cache_hits" if cached else "cache_misses", "poster")
+            if cached:
+                logger.info(f"命中用户 {user_name}({user_id}) 的今日运势缓存")
+                result = await self._poster_result(
+                    event,
+                    cached,
+                    self.poster_cache.path_for(user_id, None, encoder, suffix),
+                    suffix,
+                )
+                self.metrics.observe("request", self._elapsed_ms(request_start))
+                yield result
+                return
+            seed = daily_seed(user_id, today_str())
+
+        # 下载和渲染占用全局名额，排队已满时直接拒绝
+        try:
+            async with self.render_gate.slot():
+                poster, error = await self._render_poster(
+                    user_id, user_name, encoder, seed
+                )
+        except Overloaded:
+            self.metrics.inc("rejected", "overload")
+            logger.warning(f"渲染排队已满，拒绝用户 {user_name}({user_id}) 的请求")
+            yield event.plain_result(OVERLOADED_REPLY)
+            return
+        if poster is None:
+            yield event.plain_result(error)
+            return
+
+        try:
+
+            poster_path = None
+            if self.poster_cache is not None:
+                poster_path = await self.poster_cache.put(
+                    user_id, poster.data, poster.profile, poster.suffix
+                )
+
+            result = await self._poster_result(
+                event, poster.data, poster_path, poster.suffix
+            )
+            self.metrics.observe("request", self._elapsed_ms(request_start))
+            yield result
+            logger.info(f"成功为用户 {user_name}({user_id}) 生成今日运势图片")
+
+        except Exception as e:
+            self.metrics.inc("errors", "request")
+            logger.error(f"生成运势图片过程中出错: {e}")
+            yield event.plain_result("生成图片失败，请稍后再试～")
+
+    async def _render_poster(
+        self, user_id: str, user_name: str, encoder: str, seed: Optional[int]
+    ) -> Tuple[Optional[EncodedPoster], Optional[str]]:
+        """
+        获取头像和背景并渲染一张海报
+        Returns:
+            tuple: (海报, None)；失败时为 (None, 回复给用户的文字)
+        """
         try:
 
             results = await asyncio.gather(
@@ -132,748 +466,602 @@ class JrysPlugin(Star):
 
             if isinstance(avatar_path, Exception):
                 logger.error(f"获取头像时出错: {avatar_path}")
-                yield event.plain_result("获取头像失败，请稍后再试～")
-                return
+                return None, "获取头像失败，请稍后再试～"
 
             if isinstance(background_path, Exception):
                 logger.error(f"获取背景图片时出错: {background_path}")
-                yield event.plain_result("获取背景图片失败，请稍后再试～")
-                return
+                return None, "获取背景图片失败，请稍后再试～"
 
         except Exception as e:
             logger.error(f"获取头像或背景图片时出错: {e}")
-            yield event.plain_result("获取头像或背景图片失败，请稍后再试～")
-            return
-
-        temp_file_path = None  # 用于存储临时文件路径
+            return None, "获取头像或背景图片失败，请稍后再试～"
 
         try:
 
-            logger.info(f"正在为用户 {user_name}({user_id}) 生成今日运势图片")
-            temp_file_path = await asyncio.to_thread(
-                self._generate_image_sync, avatar_path, background_path
+            entry = self.renderer.pick_entry(seed)
+            if entry is None:
+                logger.error("运势数据为空")
+                return None, "运势数据加载失败，请稍后再试～"
+
+            spec = RenderSpec(
+                entry_key=entry[0],
+                entry_index=entry[1],
+                background_path=background_path,
+                avatar_path=avatar_path,
+                date=datetime.now().strftime("%Y/%m/%d"),
+                encoder=encoder,
             )
 
-            if temp_file_path is None:
+            logger.info(f"正在为用户 {user_name}({user_id}) 生成今日运势图片")
+            with self.metrics.timer("render"):
+                poster = await self.render_backend.render(spec)
+            if poster is None:
+                self.metrics.inc("errors", "render")
                 logger.error("生成今日运势图片失败")
-                yield event.plain_result("生成图片失败，请稍后再试～")
-                return
-
-            yield event.image_result(temp_file_path)
-            logger.info(f"成功为用户 {user_name}({user_id}) 生成今日运势图片")
+                return None, "生成图片失败，请稍后再试～"
+
+            self.encoder_stats.record(poster)
+            if poster.timings:
+                self.metrics.observe_many("render", poster.timings)
+            logger.info(
+                f"海报编码 {poster.profile}: {poster.encode_ms:.1f} ms, "
+                f"{len(poster.data) / 1024:.1f} KB"
+            )
+            return poster, None
 
         except Exception as e:
+            self.metrics.inc("errors", "request")
             logger.error(f"生成运势图片过程中出错: {e}")
-            yield event.plain_result("生成图片失败，请稍后再试～")
+            return None, "生成图片失败，请稍后再试～"
 
-        finally:
-            # 用完后删除临时文件
-
-            if temp_file_path and os.path.exists(temp_file_path):
-                try:
-                    await aiofiles.os.remove(temp_file_path)
-                    logger.info(f"成功删除临时文件")
-
-                except OSError as e:
-                    logger.warning(f"删除临时文件 {temp_file_path} 失败: {e}")
-
-                except FileNotFoundError:
-                    logger.warning(f"临时文件 {temp_file_path} 已经被删除或不存在")
-                    pass
-
-                except Exception as e:
-                    logger.warning(f"删除临时文件 {temp_file_path} 失败: {e}")
-
-    def _generate_image_sync(
-        self, avatar_path: str, background_path: str
-    ) -> Optional[str]:
+    def _admit(self, event: AstrMessageEvent, group_cost: int = 1) -> Optional[str]:
         """
-            同步函数：执行所有CPU密集的图像处理任务。
-            这个函数将在一个单独的线程中运行，以避免阻塞asyncio事件循环。
+        按用户和群的令牌桶检查请求频率
         Args:
-            avatar_path (str): 用户头像的路径
-            background_path (str): 背景图片的路径
+            group_cost (int): 群令牌的消耗，批量模式按生成的人数计
         Returns:
-            Optional[str]: 返回生成的运势海报图片路径，如果失败则返回None
+            Optional[str]: 被限制时回复给用户的文字，允许时返回 None
         """
-        if not self.jrys_data:
-            logger.error("运势数据为空")
-            return None
-
-        date_y = self.date_y
-        summary_y = self.summary_y
-        lucky_star_y = self.lucky_star_y
-        sign_text_y = self.sign_text_y
-        unsign_text_y = self.unsign_text_y
-        warning_text_y = self.warning_text_y
-
-        try:
-            available_keys_list = list(self.jrys_data.keys())
-
-            key_1 = random.choice(available_keys_list)
-
-            if key_1 not in self.jrys_data:
-                logger.error(f"运势数据中没有找到 {key_1} 的数据")
-                return None
+        # 两个桶都允许时才同时扣除，被群限制拒绝的请求不消耗用户自己的令牌
+        user_id = str(event.get_sender_id())
+        group_id = str(event.get_group_id() or "")
+        wait = self.user_limiter.peek(user_id)
+        label = "rate_user"
+        if not wait and group_id:
+            wait = self.group_limiter.peek(group_id, group_cost)
+            label = "rate_group"
+        if wait:
+            self.metrics.inc("rejected", label)
+            return f"请求太频繁啦，请 {math.ceil(wait)} 秒后再试～"
+
+        self.user_limiter.acquire(user_id)
+        if group_id:
+            self.group_limiter.acquire(group_id, group_cost)
+        return None
+
+    def _mentioned_users(self, event: AstrMessageEvent) -> List[Tuple[str, str]]:
+        """
+        消息中被@的用户(去重，不含机器人自己和@全体成员)，最多 batch_max_users 个
+        Returns:
+            List[Tuple[str, str]]: (用户 ID, 昵称)
+        """
+        self_id = str(event.get_self_id())
+        users = {}
+        for component in event.get_messages():
+            if not isinstance(component, Comp.At):
+                continue
+            user_id = str(component.qq)
+            if user_id in ("all", self_id) or user_id in users:
+                continue
+            users[user_id] = getattr(component, "name", "") or user_id
+        return list(users.items())[: max(1, self.batch_max_users)]
+
+    async def _jrys_batch(
+        self, event: AstrMessageEvent, targets: List[Tuple[str, str]]
+    ):
+        """
+        批量生成被@用户的今日运势
+        1. 所有用户的头像和背景并发获取
+        2. 所有海报一次提交给渲染后端，同一背景的海报共用解码和合成好的底图
+        3. 支持的平台以合并转发发送，其余平台发送一张总览图
+        Args:
+            targets: (用户 ID, 昵称) 列表
+        """
+        request_start = time.perf_counter()
+        self.metrics.inc("requests", "batch")
 
-            key_2 = random.choice(list(range(len(self.jrys_data[key_1]))))
-            fortune_data = self.jrys_data[key_1][key_2]
+        fortunes = await self._load_jrys_data()
+        if not fortunes:
+            logger.error("运势数据未加载或为空")
+            yield event.plain_result("运势数据加载失败，请稍后再试～")
+            return
 
-            # 获取当前日期
-            now = datetime.now()
-            date = f"{now.strftime('%Y/%m/%d')}"
+        logger.info(f"正在批量生成 {len(targets)} 位用户的今日运势")
+        encoder = select_profile(
+            self.encoder_profile,
+            self.encoder_overrides,
+            event.get_platform_name(),
+            event.get_group_id(),
+        )
+        suffix = get_profile(encoder).suffix
+        forward = self.batch_output == "forward" or (
+            self.batch_output == "auto"
+            and event.get_platform_name() in FORWARD_PLATFORMS
+        )
 
-            # 1. 获取运势数据
-            fortune_summary = fortune_data.get("fortuneSummary", "运势数据未知")
-            lucky_star = fortune_data.get("luckyStar", "幸运星未知")
-            sign_text = fortune_data.get("signText", "星座运势未知")
-            unsign_text = fortune_data.get("unsignText", "非星座运势未知")
-            warning_text = "仅供娱乐 | 相信科学 | 请勿迷信"
+        # 合并转发时每张海报单独发送，每日固定运势模式下可以直接复用当天的缓存
+        posters = {}
+        if forward and self.poster_cache is not None:
+            for user_id, _ in targets:
+                cached = await self.poster_cache.get(user_id, encoder, suffix)
+                self.metrics.inc("cache_hits" if cached else "cache_misses", "poster")
+                if cached:
+                    posters[user_id] = cached
+        pending = [user for user in targets if user[0] not in posters]
+
+        # 整批只占用一个全局名额：下载和渲染都在同一次调度中完成
+        try:
+            await self.render_gate.acquire()
+        except Overloaded:
+            self.metrics.inc("rejected", "overload")
+            logger.warning(f"渲染排队已满，拒绝 {len(targets)} 位用户的批量请求")
+            yield event.plain_result(OVERLOADED_REPLY)
+            return
 
-            # 如果unsign_lines>3行，怕这个warning_text和unsign_text贴在一起，加个自动换行的
-            unsign_lines = self.wrap_text(
-                unsign_text, font=self.fonts[36], max_width=TEXT_WRAP_WIDTH
-            )
+        spec_users = []
+        rendered = []
+        sheet = None
+        error = None
+        try:
+            specs, spec_users = await self._batch_specs(pending, encoder)
+            if specs:
+                with self.metrics.timer("render_batch"):
+                    if forward:
+                        rendered = await self.render_backend.render_batch(specs)
+                    else:
+                        sheet = await self.render_backend.render_sheet(specs)
+        except Exception as e:
+            error = e
+        finally:
+            self.render_gate.release()
 
-            # 如果unsign_lines>3行，warning_text_y向下移动 unsign_text_y向上移动
-            if len(unsign_lines) > 3:
-                warning_text_y += (
-                    len(unsign_lines) - 3
-                ) * WARNING_TEXT_Y_OFFSET  # 每行10像素的间距
-                unsign_text_y -= (
-                    len(unsign_lines) - 3
-                ) * UNSIGN_TEXT_Y_OFFSET  # 每行15像素的间距
-
-            # 2. 核心图像处理流程
-
-            # 裁切图片
-            image = self.crop_center(background_path)
-            if image is None:
-                logger.error("裁剪背景图片失败")
-                return None
+        try:
+            if error is not None:
+                raise error
+
+            if not forward:
+                if sheet is None:
+                    self.metrics.inc("errors", "render_batch")
+                    yield event.plain_result("生成图片失败，请稍后再试～")
+                    return
+                self.encoder_stats.record(sheet)
+                if sheet.timings:
+                    self.metrics.observe_many("render", sheet.timings)
+                result = await self._poster_result(event, sheet.data, None, sheet.suffix)
+                self.metrics.observe("request.batch", self._elapsed_ms(request_start))
+                yield result
+                return
 
-            # 添加半透明图层
-            image = self.add_transparent_layer(
-                image, position=(0, 1270), box_width=1080, box_height=700
-            )
+            for user_id, poster in zip(spec_users, rendered):
+                if poster is None:
+                    self.metrics.inc("errors", "render")
+                    continue
+                self.encoder_stats.record(poster)
+                if poster.timings:
+                    self.metrics.observe_many("render", poster.timings)
+                posters[user_id] = poster.data
+                if self.poster_cache is not None:
+                    await self.poster_cache.put(
+                        user_id, poster.data, poster.profile, poster.suffix
+                    )
 
-            # 在图片上绘制文字
-
-            # 绘制日期
-            image = self.draw_text(
-                image,
-                text=date,
-                position="center",
-                y=date_y,
-                color=(255, 255, 255),
-                font=self.fonts[50],  # 使用50号字体
-                gradients=True,
-            )
+            nodes = [
+                Comp.Node(
+                    uin=user_id,
+                    name=user_name,
+                    content=[Comp.Image.fromBytes(posters[user_id])],
+                )
+                for user_id, user_name in targets
+                if user_id in posters
+            ]
+            if not nodes:
+                yield event.plain_result("生成图片失败，请稍后再试～")
+                return
+            self.metrics.observe("request.batch", self._elapsed_ms(request_start))
+            yield event.chain_result([Comp.Nodes(nodes)])
+            logger.info(f"成功批量生成 {len(nodes)}/{len(targets)} 位用户的今日运势")
 
-            # 绘制幸运总结
-            image = self.draw_text(
-                image,
-                text=fortune_summary,
-                position="center",
-                y=summary_y,
-                color=(255, 255, 255),
-                font=self.fonts[60],  # 使用60号字体
-            )
+        except Exception as e:
+            self.metrics.inc("errors", "request")
+            logger.error(f"批量生成运势图片过程中出错: {e}")
+            yield event.plain_result("生成图片失败，请稍后再试～")
 
-            # 绘制幸运星
-            image = self.draw_text(
-                image,
-                text=lucky_star,
-                position="center",
-                y=lucky_star_y,
-                color=(255, 255, 255),
-                font=self.fonts[60],  # 使用60号字体
-                gradients=True,
-            )
-            # 绘制运势文本
-            image = self.draw_text(
-                image,
-                text=sign_text,
-                position="left",
-                y=sign_text_y,
-                color=(255, 255, 255),
-                font=self.fonts[30],  # 使用30号字体
-            )
-            image = self.draw_text(
-                image,
-                text=unsign_text,
-                position="left",
-                y=unsign_text_y,
-                color=(255, 255, 255),
-                font=self.fonts[30],  # 使用30号字体
-            )
-            # 绘制警告文本
-            image = self.draw_text(
-                image,
-                text=warning_text,
-                position="center",
-                y=self.warning_text_y,
-                color=(255, 255, 255),
-                font=self.fonts[30],  # 使用30号字体
+    async def _batch_specs(
+        self, users: List[Tuple[str, str]], encoder: str
+    ) -> Tuple[List[RenderSpec], List[str]]:
+        """
+        并发获取一批用户的头像和背景，生成渲染参数
+        Returns:
+            tuple: (渲染参数列表, 对应的用户 ID 列表)，获取背景失败的用户被跳过
+        """
+        results = await asyncio.gather(
+            *(self.get_avatar_img(user_id) for user_id, _ in users),
+            *(self.get_background_image() for _ in users),
+        )
+        avatars, backgrounds = results[: len(users)], results[len(users) :]
+
+        date = datetime.now().strftime("%Y/%m/%d")
+        specs = []
+        spec_users = []
+        for (user_id, user_name), avatar_path, background_path in zip(
+            users, avatars, backgrounds
+        ):
+            if background_path is None:
+                logger.error(f"获取用户 {user_name}({user_id}) 的背景图片失败")
+                continue
+            seed = None
+            if self.poster_cache is not None:
+                seed = daily_seed(user_id, today_str())
+            entry = self.renderer.pick_entry(seed)
+            if entry is None:
+                logger.error("运势数据为空")
+                continue
+            specs.append(
+                RenderSpec(entry[0], entry[1], background_path, avatar_path, date, encoder)
             )
+            spec_users.append(user_id)
+        return specs, spec_users
 
-            # 在图片上绘制用户头像
-            image = self.draw_avatar_img(avatar_path, image)
-
-            # 3 . 保存图片到临时文件并且返回路径
-            with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as temp_file:
-                image = image.convert("RGB")  # 确保图片是RGB模式
-                image.save(temp_file, format="JPEG", quality=85, optimize=True)
-                return temp_file.name
+    async def _prerender_user(self, user_id: str, encoder: str) -> bool:
+        """
+        为用户生成今天的海报并写入海报缓存(预渲染使用)
+        Returns:
+            bool: 是否生成了新海报，今天已有缓存或生成失败时返回 False
+        """
+        suffix = get_profile(encoder).suffix
+        if await aiofiles.os.path.exists(
+            self.poster_cache.path_for(user_id, None, encoder, suffix)
+        ):
+            return False
+
+        avatar_path, background_path = await asyncio.gather(
+            self.get_avatar_img(user_id), self.get_background_image()
+        )
+        entry = self.renderer.pick_entry(daily_seed(user_id, today_str()))
+        if background_path is None or entry is None:
+            return False
+
+        spec = RenderSpec(
+            entry_key=entry[0],
+            entry_index=entry[1],
+            background_path=background_path,
+            avatar_path=avatar_path,
+            date=datetime.now().strftime("%Y/%m/%d"),
+            encoder=encoder,
+        )
+        poster = await self.render_backend.render(spec)
+        if poster is None:
+            return False
+        self.metrics.inc("prerendered")
+        await self.poster_cache.put(
+            user_id, poster.data, poster.profile, poster.suffix, remember=False
+        )
+        return True
 
+    async def _warm_text_sprites(self):
+        """
+        逐条预先生成运势文字图层，之后每次渲染只需要贴图
+        低优先级：有用户请求正在渲染时暂停
+        """
+        try:
+            table = await self._load_jrys_data()
+            start = time.perf_counter()
+            built = 0
+            for fortune in table.entries:
+                while self.render_backend.pending > 0:
+                    await asyncio.sleep(SPRITE_WARMUP_POLL_INTERVAL)
+                if await asyncio.to_thread(self.renderer.warm_text_sprite, fortune):
+                    built += 1
+                elif self.renderer.text_sprites.full:
+                    break
+            if built:
+                logger.info(
+                    f"预先生成 {built} 条运势的文字图层，耗时 {self._elapsed_ms(start):.0f} ms"
+                )
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error(f"获取运势数据失败: {e}")
-            return None
+            logger.warning(f"预先生成文字图层失败: {e}")
+
+    @staticmethod
+    def _elapsed_ms(start: float) -> float:
+        return (time.perf_counter() - start) * 1000
+
+    def _component_counters(self) -> dict:
+        """各组件自己维护的计数，读取指标时收集"""
+        counters = {
+            ("cache_hits", "avatar"): self.avatar_cache.hits,
+            ("cache_misses", "avatar"): self.avatar_cache.misses,
+            ("cache_hits", "background"): self.background_cache.hits,
+            ("cache_misses", "background"): self.background_cache.misses,
+            ("evictions", "avatar"): self.avatar_cache.evicted,
+            ("evictions", "background"): self.background_cache.evicted,
+            ("avatar_revalidations", "not_modified"): self.avatar_store.not_modified,
+            ("avatar_revalidations", "unchanged"): self.avatar_store.unchanged,
+            ("avatar_revalidations", "downloaded"): self.avatar_store.downloads,
+            ("downloads", "started"): self.inflight.calls,
+            ("downloads", "coalesced"): self.inflight.coalesced,
+        }
+        if self.template_cache is not None:
+            counters[("cache_hits", "template")] = self.template_cache.hits
+            counters[("cache_misses", "template")] = self.template_cache.misses
+            counters[("evictions", "template")] = self.template_cache.evicted
+        if self.render_backend.name == "thread":
+            # 渲染进程中的缓存不在插件进程里，无法统计
+            counters[("cache_hits", "text_sprite")] = self.renderer.text_sprites.hits
+            counters[("cache_misses", "text_sprite")] = self.renderer.text_sprites.misses
+        restarts = getattr(self.render_backend, "restarts", None)
+        if restarts is not None:
+            counters[("render_worker_restarts", "")] = restarts
+        return counters
+
+    async def _poster_result(
+        self,
+        event: AstrMessageEvent,
+        poster: bytes,
+        path: Optional[str] = None,
+        suffix: str = ".jpg",
+    ):
+        """
+        构造发送海报的消息
+        1. 平台支持 base64 图片时直接发送内存中的字节，不经过磁盘
+        2. 否则使用已有的文件(例如海报缓存)，没有时写入 spool 目录，由后台任务定期清理
+        Args:
+            event (AstrMessageEvent): 消息事件
+            poster (bytes): 编码后的海报
+            path (str): 海报已经在磁盘上时的路径
+            suffix (str): 写入 spool 时使用的文件后缀
+        """
+        if wants_bytes(
+            self.output_mode, event.get_platform_name(), self.output_bytes_platforms
+        ):
+            return event.chain_result([Comp.Image.fromBytes(poster)])
 
-    async def _load_jrys_data(self) -> dict:
+        if path is None or not await aiofiles.os.path.exists(path):
+            path = await self.spool.write(poster, suffix)
+        return event.image_result(path)
+
+    async def _load_jrys_data(self) -> FortuneTable:
         """
-        初始化 jrys.json 文件
+        加载运势表
         1. 检查当前目录下是否存在 jrys.json 文件
         2. 如果不存在，则创建一个空的 jrys.json 文件
-        3. 如果存在，则读取文件内容
-        4. 如果文件内容不是有效的 JSON 格式，则打印错误信息
+        3. 文件在上次加载后有变化时(或第一次调用时)重新编译运势表，否则直接返回当前的表
+        4. 文件内容无效时打印错误信息，继续使用之前的表
         """
-
-        if self.is_data_loaded:
-            return self.jrys_data
-
-        jrys_path = os.path.join(self.data_dir, "jrys.json")
+        fortunes = self.renderer.fortunes  # 线程渲染和抽取运势共用
+        if not fortunes.is_stale():
+            return fortunes.table
 
         # 检查 jrys.json 文件是否存在,如果不存在，则创建一个空的 jrys.json 文件
-        if not os.path.exists(jrys_path):
-            async with aiofiles.open(jrys_path, "w", encoding="utf-8") as f:
+        if not await aiofiles.os.path.exists(fortunes.path):
+            async with aiofiles.open(fortunes.path, "w", encoding="utf-8") as f:
                 await f.write(json.dumps({}))
-                logger.info(f"创建空的运势数据文件: {jrys_path}")
+                logger.info(f"创建空的运势数据文件: {fortunes.path}")
 
-        # 读取 JSON 文件
-        try:
-            async with aiofiles.open(jrys_path, "r", encoding="utf-8") as f:
-                content = await f.read()
-                # json.loads是CPU密集型，用 to_thread 包装
-                self.jrys_data = await asyncio.to_thread(json.loads, content)
-                self.is_data_loaded = True  # 标记数据已加载
-                logger.info(f"读取运势数据文件: {jrys_path}")
-
-            return self.jrys_data
-
-        except FileNotFoundError:
-            logger.error(f"文件 {jrys_path} 没找到")
-            return {}
-        except json.JSONDecodeError:
-            logger.error(f"文件 {jrys_path} 不是有效的 JSON 格式")
-            return {}
+        # 解析和编译是CPU密集型，用 to_thread 包装
+        return await asyncio.to_thread(fortunes.load)
 
     async def get_background_image(self) -> Optional[str]:
         """
         随机获取背景图片
-        1. 在当前目录下的 backgroundFolder 文件夹中查找所有的 txt 文件
-        2. 随机选择一个 txt 文件
-        3. 从选中的 txt 文件中随机选择一行
-        4. 将选中的行作为图片的 URL
-        5.返回图片路径
+        1. 背景 URL 索引按需增量刷新(背景包文件有变化时才重新读取)
+        2. 按配置的抽样策略从索引中抽取一个 URL
+        3. 本地已有该图片则直接返回，否则下载
+        4.返回图片路径
         """
 
-        try:
-            # 查找所有的 txt 文件
-            background_files = await asyncio.to_thread(
-                lambda: [
-                    f for f in os.listdir(self.background_dir) if f.endswith(".txt")
-                ]
-            )
-
-            if not background_files:
-                logger.warning("没有找到背景图片文件")
-                return None
-            # 随机选择一个 txt 文件
-            background_file = random.choice(background_files)
-            background_file_path = os.path.join(self.background_dir, background_file)
-
-            # 从选中的 txt 文件中随机选择一行
-            async with aiofiles.open(background_file_path, "r", encoding="utf-8") as f:
-
-                # 读取文件内容
-                background_urls = [line.strip() async for line in f if line.strip()]
-
-                if not background_urls:
-                    logger.warning(f"文件 {background_file} 中没有找到有效的 URL")
+        with self.metrics.timer("background"):
+            try:
+                if self.background_index.needs_refresh():
+                    await asyncio.to_thread(self.background_index.refresh)
+
+                # 预热阶段只使用本地已有的图片，保证重启后的前几次请求不需要等待下载
+                if self.prefetcher is not None and self.prefetcher.in_warmup:
+                    image_path = self.background_index.sample_cached()
+                    if image_path:
+                        self.prefetcher.take_warm_slot()
+                        self._touch_background(image_path)
+                        return image_path
+
+                image_url = self.background_index.sample()
+                # 最近返回过 4xx 的链接重新抽取几次，避免白白请求一次
+                for _ in range(DEAD_LINK_RESAMPLES):
+                    if not image_url or not self.fetcher.is_dead(image_url):
+                        break
+                    image_url = self.background_index.sample()
+                if not image_url:
+                    logger.warning("没有找到背景图片文件")
                     return None
 
-                # 随机选择一行URL
-                image_url = random.choice(background_urls)
-
-                # 创建图片目录
-                image_dir = os.path.join(self.background_dir, "images")
-                os.makedirs(image_dir, exist_ok=True)
-
-                image_name = os.path.basename(image_url)
-                image_path = os.path.join(image_dir, image_name)
+                image_path = self.background_index.image_path(image_url)
 
                 # 检查图片是否存在,如果存在则返回
                 if os.path.exists(image_path):
+                    self._touch_background(image_path)
                     return image_path
-                # 下载图片
-
-                try:
-                    async with self._session.get(image_url) as response:
-                        response.raise_for_status()  # 检查请求是否成功
-                        content = await response.read()  # 异步读取响应内容
-
-                        async with aiofiles.open(image_path, "wb") as f:
-                            await f.write(content)
-
-                        logger.info(f"下载图片成功: {image_url}")
-                    return image_path
-
-                except aiohttp.ClientResponseError as e:
-                    logger.error(f"状态码错误: {e}")
-                    return None
-                except aiohttp.ClientError as e:
-                    logger.error(f"请求错误: {e}")
-                    return None
-
-        except Exception as e:
-            logger.error(f"获取背景图片时出错: {e}")
-            return None
-
-    def draw_text(
-        self,
-        img: Image.Image,
-        text: str,
-        position: str,
-        font: ImageFont.ImageFont,
-        y: int = None,
-        color: Tuple[int, int, int] = (255, 255, 255),
-        max_width: int = 800,
-        gradients: bool = False,
-    ) -> Image.Image:
-        """
-        在图片上绘制文字
-        参数：
-            img (Image): 要绘制的图片
-            text (str): 要绘制的文字
-            position (tuple or str): 文字的位置, 可为'left','center'或坐标元组
-            y (int): 文字的y坐标,如果position为'topleft'或'center',则y无效
-            color (tuple): 文字颜色，默认为白色
-            font (ImageFont): 字体对象,如果为None则使用默认字体
-            max_width (int): 文字的最大宽度,默认为800
-            gradients (bool): 是否使用渐变色填充文字，默认为False
-        """
-
-        try:
-            draw = ImageDraw.Draw(img)
-
-            # 自动换行处理
-            lines = self.wrap_text(
-                text=text,
-                font=font,
-                draw=draw,
-                max_width=TEXT_WRAP_WIDTH,
-            )  # 将文字按最大宽度进行换行
-
-            # 获取图片的宽高
-            img_width, img_height = img.size
-
-            if isinstance(position, str):
-                if position == "center":
-
-                    def x_func(line):
-                        bbox = draw.textbbox((0, 0), line, font=font)
-                        line_width = bbox[2] - bbox[0]  # 获取文字宽度
-                        return (img_width - line_width) // 2  # 计算x坐标
-
-                    def offset_x_func(line):
-                        bbox = draw.textbbox((0, 0), line, font=font)
-                        return -bbox[0]
-
-                elif position == "left":
-
-                    def x_func(line):
-                        return LEFT_PADDING  # 固定左侧留白
-
-                    def offset_x_func(line):
-                        return 0
-
-                else:
-                    raise ValueError(
-                        "position参数错误,只能为'topleft','center'或坐标元组"
-                    )
-                # 计算y坐标
-                text_y = y if y is not None else 0
-            elif isinstance(position, tuple):
-                text_x, text_y = position
-
-                def x_func(line):
-                    return text_x
-
-                def offset_x_func(line):
-                    return 0
-
-            else:
-                raise ValueError("position参数错误,只能为'left','center'或坐标元组")
-
-            # 绘制每一行
-            line_spacing = int(font.size * 1.5)  # 行间距
-            for line in lines:
-                if gradients:
-                    base_x = x_func(line)
-                    offset_x = offset_x_func(line)
-                    for char in line:
-                        #
-                        colors = self.get_light_color()
-                        gradient_char = self.create_gradients_image(char, font, colors)
-                        img.paste(
-                            gradient_char, (base_x + offset_x, text_y), gradient_char
-                        )
-
-                        bbox = font.getbbox(char)
-                        char_width = bbox[2] - bbox[0]  # 获取字符宽度
-                        base_x += char_width  # 更新x坐标
-                        offset_x += bbox[0]  # 更新偏移量
-
-                else:
-                    # 绘制普通文字
-                    offset_x = offset_x_func(line)  # 获取偏移量
-                    draw.text(
-                        (x_func(line) + offset_x, text_y), line, font=font, fill=color
-                    )
-
-                text_y += line_spacing  # 更新y坐标
-
-            return img
-
-        except Exception as e:
-            logger.error(f"绘制文字时出错: {e}")
-            return img
-
-    def crop_center(
-        self, image_path: str, width: int = None, height: int = None
-    ) -> Optional[Image.Image]:
-        """
-        从图片中间裁剪指定尺寸的区域，如果图片尺寸小于目标尺寸，则先放大,太大则缩小。
-
-        参数：
-
-            width (int): 裁剪宽度，默认为 1080 像素。
-            height (int): 裁剪高度，默认为 1920 像素。
-
-        返回：
-            Image.Image: 裁剪后的图片对象，如果发生错误则返回 None。
-        """
-        width = width if width is not None else self.image_width
-        height = height if height is not None else self.image_height
-        try:
-            img = Image.open(image_path).convert("RGBA")
-            img_width, img_height = img.size
-
-            # 如果图片尺寸小于目标尺寸，则先放大
-            if img_width < width or img_height < height:
-                scale_x = width / img_width
-                scale_y = height / img_height
-                scale = max(scale_x, scale_y)  # 保持比例，选择较大的缩放倍数
-                new_width = int(img_width * scale)
-                new_height = int(img_height * scale)
-                img = img.resize((new_width, new_height), Image.LANCZOS)  #
-
-            # 如果图片尺寸远大于目标尺寸
-
-            else:
-                max_scale = 1.8  # 防止图片太大浪费资源
-                if img_width > width * max_scale or img_height > height * max_scale:
-                    scale_x = (width * max_scale) / img_width
-                    scale_y = (height * max_scale) / img_height
-                    scale = min(scale_x, scale_y)
-                    new_width = int(img_width * scale)
-                    new_height = int(img_height * scale)
-                    img = img.resize((new_width, new_height), Image.LANCZOS)
-
-            # 重新获取放大后的图片尺寸
-            img_width, img_height = img.size
-
-            left = (img_width - width) / 2
-            top = (img_height - height) / 2
-            right = (img_width + width) / 2
-            bottom = (img_height + height) / 2
-
-            # 创建半透明图层
-
-            cropped_img = img.crop((left, top, right, bottom))
-
-            return cropped_img
-
-        except FileNotFoundError:
-            logger.error(f"错误：找不到图片文件：{image_path}")
-        except Exception as e:
-            logger.error(f"发生错误：{e}")
-            return None
-
-    def add_transparent_layer(
-        self,
-        base_img: Image.Image,
-        box_width: int = 800,
-        box_height: int = 400,
-        position: Tuple[int, int] = (100, 200),
-        layer_color: Tuple[int, int, int, int] = (0, 0, 0, 128),
-        radius: int = 50,
-    ) -> Image.Image:
-        """
-        在图片上添加一个半透明图层
-
-        参数：
-            base_img (Image): 背景图像（RGBA 格式）
-            text (str): 要绘制的文字内容
-            box_width (int): 半透明框的宽度
-            box_height (int): 半透明框的高度
-            position (tuple): 半透明框的位置
-            layer_color (tuple): 半透明层颜色，RGBA 格式
-            radius (int): 圆角半径
-        返回：
-            合成后的 Image 对象
-        """
-        try:
-            x1, y1 = position
-            x2 = x1 + box_width
-            y2 = y1 + box_height
-
-            # 创建半透明图层
-            overlay = Image.new("RGBA", base_img.size, (0, 0, 0, 0))
-            draw = ImageDraw.Draw(overlay)
-
-            draw.rounded_rectangle((x1, y1, x2, y2), radius=radius, fill=layer_color)
-
-            return Image.alpha_composite(base_img, overlay)
-
-        except Exception as e:
-            logger.error(f"添加半透明图层时出错: {e}")
-            return base_img
+                self.background_cache.touch(os.path.basename(image_path), hit=False)
+
+                # 下载图片，多个请求同时抽到同一张图片时只下载一次
+                downloaded = await self.inflight.do(
+                    ("background", image_url),
+                    lambda: self._download_background(image_url, image_path),
+                )
+                if downloaded:
+                    return downloaded
+
+                # 下载失败(图床熔断、链接失效等)时退回本地已有的背景
+                image_path = self.background_index.sample_cached()
+                if image_path:
+                    logger.info("背景下载失败，使用本地缓存的背景")
+                    self._touch_background(image_path)
+                return image_path
+
+            except Exception as e:
+                self.metrics.inc("errors", "background")
+                logger.error(f"获取背景图片时出错: {e}")
+                return None
 
-    def wrap_text(
-        self,
-        text: str,
-        font: ImageFont.ImageFont,
-        draw: ImageDraw.ImageDraw = None,
-        max_width: int = TEXT_WRAP_WIDTH,
-    ) -> List[str]:
-        """
-        将文字按最大宽度进行换行
-        参数：
-            text (str): 原始文字
-            max_width (int): 最大宽度
-            draw: ImageDraw对象，用于测量文字宽度
-            font: ImageFont对象
-        返回：
-            list[str]: 每行一段文字
+    def _touch_background(self, image_path: str):
+        """记录一次本地背景的使用，背景模板按同样的记录淘汰"""
+        name = os.path.basename(image_path)
+        self.background_cache.touch(name)
+        if self.template_cache is not None:
+            self.template_cache.touch(
+                name, hit=self.renderer.template_store.has(image_path)
+            )
 
-        """
-        try:
-            if draw is None:
-                img = Image.new("RGB", (self.image_width, self.image_height))
-                draw = ImageDraw.Draw(img)
-
-            lines: List[str] = []
-            current_line = ""
-            for char in text:
-                test_line = current_line + char
-                bbox = draw.textbbox((0, 0), test_line, font=font)
-                width = bbox[2] - bbox[0]  # 获取文字宽度
-                if width <= max_width:
-                    current_line = test_line
-                else:
-                    lines.append(current_line)
-                    current_line = char
-            if current_line:
-                lines.append(current_line)
-            return lines
-        except Exception as e:
-            logger.error(f"换行时出错: {e}")
-            return [text]  # 如果出错，返回原始文本
+    def _on_background_evicted(self, name: str):
+        """背景图片被磁盘缓存淘汰后，从索引中标记为未下载并删除它的模板"""
+        self.background_index.mark_cached(name, False)
+        if self.renderer.template_store is not None:
+            self.renderer.template_store.discard(name)
 
-    def create_gradients_image(
-        self, char: str, font, colors: List[Tuple[int, int, int]]
-    ) -> Image.Image:
+    async def _download_background(self, image_url: str, image_path: str) -> Optional[str]:
         """
-        创建渐变色字体图像
-        参数：
-            char (str): 要绘制的字符
-            font: ImageFont对象
-            colors (list of tuple): 渐变色列表，包含起始和结束颜色
-
+        下载背景图片，先写入临时文件再重命名
+        Args:
+            image_url (str): 图片 URL
+            image_path (str): 保存路径
         Returns:
-            Image: 渐变色字体图像
-
+            Optional[str]: 图片路径，下载失败时返回 None
         """
         try:
-            bbox = font.getbbox(char)
-            width = bbox[2] - bbox[0]  # 字符宽度
-            height = bbox[3] - bbox[1]  # 字符高度
-            if width <= 0 or height <= 0:
-                width, height = font.getsize(
-                    char
-                )  # 如果获取的宽度或高度为0，则使用字体大小
-                offset_x, offset_y = 0, 0
-
-            else:
-                # 计算偏移量
-                offset_x = -bbox[0]
-                offset_y = -bbox[1]
-
-            gradient = Image.new("RGBA", (width, height), color=0)
-            draw = ImageDraw.Draw(gradient)
-
-            # 字体蒙版
-            mask = Image.new("L", (width, height), 0)
-            mask_draw = ImageDraw.Draw(mask)
-            mask_draw.text((offset_x, offset_y), char, font=font, fill=255)
-
-            num_colors = len(colors)
-            if num_colors < 2:
-                raise ValueError("至少需要两个颜色进行渐变")
-
-            # 绘制横向多颜色渐变色条
-            segement_width = width / (num_colors - 1)  # 每个颜色段的宽度
-            for i in range(num_colors - 1):
-                start_color = colors[i]
-                end_color = colors[i + 1]
-                start_x = int(i * segement_width)
-                end_x = int((i + 1) * segement_width)
-
-                for x in range(start_x, end_x):
-                    factor = (x - start_x) / segement_width
-                    color = tuple(
-                        [
-                            int(
-                                start_color[j]
-                                + (end_color[j] - start_color[j]) * factor
-                            )
-                            for j in range(3)
-                        ]
-                    )
-                    draw.line([(x, 0), (x, height)], fill=color)
-
-            gradient.putalpha(mask)  # 添加蒙版
-
-            return gradient
-        except Exception as e:
-            logger.error(f"创建渐变色字体图像时出错: {e}")
-            # 如果出错，返回一个透明图像
-
-            img = Image.new("RGBA", (width, height), (255, 255, 255, 0))
-            draw = ImageDraw.Draw(img)
-            draw.text((0, 0), char, font=font, fill=(255, 255, 255))
-            return img
-
-    def get_light_color(self) -> List[Tuple[int, int, int]]:
-        """获取浅色调颜色列表用于渐变
-
-        Returns:
-            浅色调颜色列表
-        """
+            start = time.perf_counter()
+            size = await self.fetcher.download(
+                image_url, image_path, "background", max_bytes=self.background_max_bytes
+            )
+            self.background_index.mark_cached(image_url)
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"下载图片成功: {image_url}，{size / 1024:.0f} KB，"
+                f"{size / 1024 / max(elapsed, 1e-6):.0f} KB/s"
+            )
+            return image_path
 
-        light_colors = [
-            (255, 250, 205),  # 浅黄色
-            (173, 216, 230),  # 浅蓝色
-            (221, 160, 221),  # 浅紫色
-            (255, 182, 193),  # 浅粉色
-            (240, 230, 140),  # 浅卡其色
-            (224, 255, 255),  # 浅青色
-            (245, 245, 220),  # 浅米色
-            (230, 230, 250),  # 浅薰衣草色
-        ]
-        return random.choices(light_colors, k=4)  # 随机选4个颜色进行渐变
+        except aiohttp.ClientResponseError as e:
+            self.metrics.inc("errors", "background_download")
+            logger.error(f"状态码错误: {e}")
+            return None
+        except aiohttp.ClientError as e:
+            self.metrics.inc("errors", "background_download")
+            logger.error(f"请求错误: {e}")
+            return None
+        except asyncio.TimeoutError:
+            # 重试用完后总超时仍可能抛出，交给调用方退回本地背景
+            self.metrics.inc("errors", "background_download")
+            logger.error(f"下载超时: {image_url}")
+            return None
+        except OSError as e:
+            self.metrics.inc("errors", "background_download")
+            logger.error(f"保存背景图片失败: {e}")
+            return None
 
     async def get_avatar_img(self, user_id: str) -> Optional[str]:
         """
         获取用户头像
-          1. 获取用户头像2. 获取用户头像的 URL3. 下载头像4. 返回头像的路径
+          1. 检查处理好的头像缓存 2. 过期则向上游发起条件请求 3. 头像有变化时重新处理 4. 返回头像的路径
         Args:
             user_id (str): 用户 ID
 
         Returns:
             str: 头像的路径
         """
-        try:
-            avatar_path = os.path.join(self.avatar_dir, f"{user_id}.jpg")
-            # 检查头像是否存在
-            if await aiofiles.os.path.exists(avatar_path):
-
-                def _file_stat(path):
-                    try:
-                        st = os.stat(path)
-                        return st.st_mtime
-                    except FileNotFoundError:
-                        return None
-
-                file_mtime = await asyncio.to_thread(_file_stat, avatar_path)
-                file_age = datetime.now().timestamp() - file_mtime
-                if (
-                    file_age < self.avatar_cache_expiration
-                ):  # 默认如果头像文件小于一天，则不下载
-                    return avatar_path
-
-            url = f"http://q.qlogo.cn/g?b=qq&nk={user_id}&s=640"
-
+        with self.metrics.timer("avatar"):
             try:
-                async with self._session.get(url) as response:
-                    response.raise_for_status()
-                    content = await response.read()  # 异步读取响应内容
-
-                    async with aiofiles.open(os.path.join(avatar_path), "wb") as f:
-                        await f.write(content)
-
-                    return avatar_path
-
-            except aiohttp.ClientResponseError as e:
-                logger.error(f"状态码错误: {e}")
+                # 同一用户连续触发时只下载一次头像
+                avatar_path = await self.inflight.do(
+                    ("avatar", str(user_id)), lambda: self.avatar_store.get(user_id)
+                )
+                if avatar_path is None:
+                    self.metrics.inc("errors", "avatar")
+                return avatar_path
+            except Exception as e:
+                self.metrics.inc("errors", "avatar")
+                logger.error(f"获取用户头像失败: {e}")
                 return None
-            except aiohttp.ClientError as e:
-                logger.error(f"请求错误: {e}")
-                return None
-
-        except Exception as e:
-            logger.error(f"获取用户头像失败: {e}")
-            return None
 
-    def draw_avatar_img(self, avatar_path: str, img: Image.Image) -> Image.Image:
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("jrys_cache")
+    async def jrys_cache(self, event: AstrMessageEvent):
         """
-        在图片上绘制用户头像
-        1. 获取用户头像
-        2. 将头像裁剪为圆形
-        3. 将头像绘制到图片上
-        Args:
-            avatar_path (str): 头像的路径
-            img (Image): 要绘制的图片
-        Returns:
-            Image: 绘制了头像的图片
+        管理员指令：回收一次头像和背景缓存，并报告占用和命中率
         """
-        try:
-            avatar = Image.open(avatar_path).convert("RGBA")
-            avatar = avatar.resize(self.avatar_size, Image.LANCZOS)
-
-            # 创建一个与头像尺寸相同的透明蒙版
-            mask = Image.new("L", avatar.size, 0)
-            mask_draw = ImageDraw.Draw(mask)
-
-            # 绘制一个白色的圆形，作为不透明区域
-            mask_draw.ellipse((0, 0, avatar.size[0], avatar.size[1]), fill=255)
-
-            # 将蒙版应用到头像上
-            avatar.putalpha(mask)
+        lines = []
+        caches = [self.avatar_cache, self.background_cache]
+        if self.template_cache is not None:
+            caches.append(self.template_cache)
+        for cache in caches:
+            await cache.collect()
+            stats = cache.stats()
+            max_entries = stats["max_entries"] or "不限"
+            max_mb = (
+                f"{stats['max_bytes'] / 1024 / 1024:.0f} MB"
+                if stats["max_bytes"]
+                else "不限"
+            )
+            lines.append(
+                f"{cache.name}缓存: {stats['entries']} 个(上限 {max_entries})，"
+                f"{stats['bytes'] / 1024 / 1024:.1f} MB(上限 {max_mb})，"
+                f"命中率 {stats['hit_rate']:.1%}"
+                f"(命中 {stats['hits']} / 未命中 {stats['misses']})，"
+                f"已淘汰 {stats['evicted']} 个"
+            )
+        yield event.plain_result("\n".join(lines))
 
-            # 将头像粘贴到图片上
-            img.paste(avatar, self.avatar_position, avatar)
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("jrys_stats")
+    async def jrys_stats(self, event: AstrMessageEvent):
+        """
+        管理员指令：查看各阶段耗时、缓存命中率和错误次数
+        """
+        if not self.metrics.enabled:
+            yield event.plain_result("指标统计未开启(metrics_enabled)")
+            return
 
-            return img
-        except Exception as e:
-            logger.error(f"绘制头像时出错: {e}")
-            # 如果出错，返回原始图片
-            return img
+        lines = self.metrics.summary_lines()
+        for name, stats in self.encoder_stats.summary().items():
+            lines.append(
+                f"编码[{name}]: {stats['count']} 次，平均 {stats['avg_encode_ms']:.1f} ms，"
+                f"{stats['avg_bytes'] / 1024:.1f} KB"
+            )
+        for label, (count, avg_bytes, rate) in self.fetcher.throughput().items():
+            lines.append(
+                f"下载[{label}]: {count} 次，平均 {avg_bytes / 1024:.1f} KB，"
+                f"{rate / 1024:.0f} KB/s"
+            )
+        yield event.plain_result("\n".join(lines))
 
     async def terminate(self):
         """插件终止时的清理工作"""
+        if self._sprite_warmup is not None:
+            self._sprite_warmup.cancel()
+            await asyncio.gather(self._sprite_warmup, return_exceptions=True)
+        if self.prefetcher is not None:
+            await self.prefetcher.stop()
+        if self.prerender is not None:
+            await self.prerender.stop()
+
+        await self.avatar_cache.stop()
+        await self.background_cache.stop()
+        if self.template_cache is not None:
+            await self.template_cache.stop()
+
+        await self.render_backend.close()
+        await self.spool.stop()
+        if self.metrics_exporter is not None:
+            await self.metrics_exporter.stop()
+
         if self._session:
             await self._session.close()
             logger.info("HTTP会话已关闭")
@@ -0,0 +1,241 @@
+import asyncio
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from astrbot.api import logger
+
+from .io_utils import async_atomic_write
+
+
+# 延迟直方图的桶上界(毫秒)，最后一个桶为 +Inf
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+METRICS_DUMP_INTERVAL = 60  # 秒
+METRIC_PREFIX = "jrys"
+
+
+class Histogram:
+    """固定分桶的延迟直方图，记录一次观测只需要一次二分查找和几次加法"""
+
+    __slots__ = ("buckets", "counts", "count", "total", "max")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """按桶估算分位数(返回所在桶的上界，最后一个桶返回观测到的最大值)"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class Metrics:
+    """
+    插件内的轻量指标
+    1. 延迟直方图：下载头像、下载背景、渲染的各个阶段和整个请求
+    2. 计数器：缓存命中/未命中、错误次数等
+    渲染线程和事件循环都会写入，所有更新都在一把锁内完成，开销只有几次加法
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.started_at = time.time()
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[Tuple[str, str], int] = {}
+        self._collectors: List[Callable[[], Dict[Tuple[str, str], int]]] = []
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, ms: float):
+        """记录一次耗时(毫秒)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(ms)
+
+    def observe_many(self, prefix: str, timings: Dict[str, float]):
+        """记录一组阶段耗时，例如渲染进程返回的各阶段耗时"""
+        for stage, ms in timings.items():
+            self.observe(f"{prefix}.{stage}", ms)
+
+    def inc(self, name: str, label: str = "", n: int = 1):
+        """
+        计数器加 n
+        Args:
+            name (str): 计数器名称，例如 cache_hits
+            label (str): 区分同一计数器的不同对象，例如 avatar
+        """
+        if not self.enabled:
+            return
+        key = (name, label)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def add_collector(self, collector: Callable[[], Dict[Tuple[str, str], int]]):
+        """
+        注册一个在读取指标时才调用的计数器来源，适合其他组件已经自己维护的计数，
+        例如磁盘缓存的命中次数，请求路径上不需要重复计数
+        Args:
+            collector: 返回 {(计数器名称, 标签): 值}
+        """
+        self._collectors.append(collector)
+
+    @contextmanager
+    def timer(self, name: str):
+        """计时上下文，退出时记录耗时；出现异常时同样记录并计入 errors"""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc("errors", name)
+            raise
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def snapshot(self) -> Tuple[Dict[str, Histogram], Dict[Tuple[str, str], int]]:
+        """复制当前的指标，读取方不需要持有锁"""
+        with self._lock:
+            histograms = {}
+            for name, h in self._histograms.items():
+                copy = Histogram(h.buckets)
+                copy.counts = list(h.counts)
+                copy.count, copy.total, copy.max = h.count, h.total, h.max
+                histograms[name] = copy
+            counters = dict(self._counters)
+        for collector in self._collectors:
+            try:
+                counters.update(collector())
+            except Exception as e:
+                logger.warning(f"读取指标失败: {e}")
+        return histograms, counters
+
+    def summary_lines(self) -> List[str]:
+        """供 /jrys_stats 使用的文字摘要"""
+        histograms, counters = self.snapshot()
+        uptime = time.time() - self.started_at
+        lines = [f"运行 {uptime / 3600:.1f} 小时"]
+        if histograms:
+            lines.append("耗时(毫秒): 次数 平均 p50 p95 p99 最大")
+        for name in sorted(histograms):
+            h = histograms[name]
+            lines.append(
+                f"{name}: {h.count} {h.mean:.1f} {h.quantile(0.5):g} "
+                f"{h.quantile(0.95):g} {h.quantile(0.99):g} {h.max:.1f}"
+            )
+
+        hits: Dict[str, int] = {}
+        misses: Dict[str, int] = {}
+        others = []
+        for (name, label), value in sorted(counters.items()):
+            if name == "cache_hits":
+                hits[label] = value
+            elif name == "cache_misses":
+                misses[label] = value
+            else:
+                others.append(f"{name}{f'[{label}]' if label else ''}: {value}")
+        for label in sorted(set(hits) | set(misses)):
+            hit, miss = hits.get(label, 0), misses.get(label, 0)
+            total = hit + miss
+            rate = hit / total if total else 0.0
+            lines.append(f"{label}缓存: 命中 {hit} / 未命中 {miss}，命中率 {rate:.1%}")
+        lines.extend(others)
+        return lines
+
+    def prometheus_text(self) -> str:
+        """导出 Prometheus 文本格式"""
+        histograms, counters = self.snapshot()
+        out = []
+        metric = f"{METRIC_PREFIX}_latency_ms"
+        out.append(f"# HELP {metric} 各阶段耗时(毫秒)")
+        out.append(f"# TYPE {metric} histogram")
+        for name in sorted(histograms):
+            h = histograms[name]
+            cumulative = 0
+            for bound, n in zip(list(h.buckets) + ["+Inf"], h.counts):
+                cumulative += n
+                out.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            out.append(f'{metric}_sum{{stage="{name}"}} {h.total:.3f}')
+            out.append(f'{metric}_count{{stage="{name}"}} {h.count}')
+
+        names = sorted({name for name, _ in counters})
+        for name in names:
+            metric = f"{METRIC_PREFIX}_{name}_total"
+            out.append(f"# TYPE {metric} counter")
+            for (n, label), value in sorted(counters.items()):
+                if n != name:
+                    continue
+                labels = f'{{target="{label}"}}' if label else ""
+                out.append(f"{metric}{labels} {value}")
+
+        out.append(f"# TYPE {METRIC_PREFIX}_start_time_seconds gauge")
+        out.append(f"{METRIC_PREFIX}_start_time_seconds {self.started_at:.0f}")
+        return "\n".join(out) + "\n"
+
+
+class MetricsExporter:
+    """定期把指标以 Prometheus 文本格式写入文件，可由 node_exporter 的 textfile collector 采集"""
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        path: str,
+        interval: float = METRICS_DUMP_INTERVAL,
+    ):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def dump(self):
+        await async_atomic_write(self.path, self.metrics.prometheus_text().encode("utf-8"))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.dump()
+            except Exception as e:
+                logger.warning(f"写入指标文件 {self.path} 失败: {e}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await self.dump()
+        except Exception as e:
+            logger.warning(f"写入指标文件 {self.path} 失败: {e}")
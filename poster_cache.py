@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import os
+import shutil
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+
+from astrbot.api import logger
+
+from .io_utils import async_atomic_write
+
+
+def today_str(now: Optional[datetime] = None) -> str:
+    """返回本地日期字符串(YYYYMMDD)，作为每日缓存的分区键"""
+    now = now or datetime.now()
+    return now.strftime("%Y%m%d")
+
+
+def daily_seed(user_id: str, day: str) -> int:
+    """
+    根据用户 ID 和日期计算确定性的随机种子
+    同一用户同一天得到的种子相同，从而抽到相同的运势
+    Args:
+        user_id (str): 用户 ID
+        day (str): 日期字符串(YYYYMMDD)
+    Returns:
+        int: 64 位随机种子
+    """
+    digest = hashlib.sha256(f"{user_id}:{day}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+class PosterCache:
+    """
+    每日海报缓存
+    1. 内存层：有界 LRU，保存编码后的海报字节
+    2. 磁盘层：按日期分目录保存海报文件，本地午夜后整个目录过期
+    同一用户在不同编码配置下的海报分开缓存(variant)
+    """
+
+    def __init__(self, cache_dir: str, max_memory_items: int = 64):
+        self.cache_dir = cache_dir
+        self.max_memory_items = max(0, int(max_memory_items))
+        self._memory: "OrderedDict[Tuple[str, str, str], bytes]" = OrderedDict()
+        self._memory_day = today_str()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _safe_name(self, user_id: str) -> str:
+        # 用户 ID 可能来自不同平台，过滤掉不适合作为文件名的字符
+        return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(user_id))
+
+    def path_for(
+        self,
+        user_id: str,
+        day: Optional[str] = None,
+        variant: str = "",
+        suffix: str = ".jpg",
+    ) -> str:
+        """返回指定用户某天海报在磁盘上的路径"""
+        day = day or today_str()
+        name = self._safe_name(user_id)
+        if variant:
+            name = f"{name}.{self._safe_name(variant)}"
+        return os.path.join(self.cache_dir, day, f"{name}{suffix}")
+
+    def _roll_day(self, day: str):
+        """日期变化时清空内存层，旧日期的海报不再命中"""
+        if day != self._memory_day:
+            self._memory.clear()
+            self._memory_day = day
+
+    def _remember(self, key: Tuple[str, str, str], data: bytes):
+        if self.max_memory_items <= 0:
+            return
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    async def get(
+        self, user_id: str, variant: str = "", suffix: str = ".jpg"
+    ) -> Optional[bytes]:
+        """
+        读取用户今天的海报
+        Args:
+            user_id (str): 用户 ID
+            variant (str): 编码配置名称
+            suffix (str): 该编码配置的文件后缀
+        Returns:
+            Optional[bytes]: 命中时返回编码后的海报字节，否则返回 None
+        """
+        day = today_str()
+        self._roll_day(day)
+        key = (day, str(user_id), variant)
+
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            return data
+
+        path = self.path_for(user_id, day, variant, suffix)
+        if not await aiofiles.os.path.exists(path):
+            return None
+        try:
+            async with aiofiles.open(path, "rb") as f:
+                data = await f.read()
+        except OSError as e:
+            logger.warning(f"读取海报缓存 {path} 失败: {e}")
+            return None
+
+        if not data:
+            return None
+        self._remember(key, data)
+        return data
+
+    async def put(
+        self,
+        user_id: str,
+        data: bytes,
+        variant: str = "",
+        suffix: str = ".jpg",
+        remember: bool = True,
+    ) -> str:
+        """
+        保存用户今天的海报
+        Args:
+            user_id (str): 用户 ID
+            data (bytes): 编码后的海报
+            variant (str): 编码配置名称
+            suffix (str): 该编码配置的文件后缀
+            remember (bool): 是否放入内存层，预渲染的海报只写磁盘，避免挤掉正在使用的海报
+        Returns:
+            str: 海报在磁盘上的路径
+        """
+        day = today_str()
+        self._roll_day(day)
+        if remember:
+            self._remember((day, str(user_id), variant), data)
+
+        path = self.path_for(user_id, day, variant, suffix)
+        day_dir = os.path.dirname(path)
+        first_of_day = not os.path.isdir(day_dir)
+        os.makedirs(day_dir, exist_ok=True)
+        await async_atomic_write(path, data)
+
+        # 每天第一次写入时顺便清理前一天的缓存
+        if first_of_day:
+            await self.purge_expired()
+        return path
+
+    async def purge_expired(self):
+        """删除今天以前的磁盘缓存目录"""
+        day = today_str()
+
+        def _purge():
+            removed = 0
+            for name in os.listdir(self.cache_dir):
+                full = os.path.join(self.cache_dir, name)
+                if name != day and os.path.isdir(full):
+                    shutil.rmtree(full, ignore_errors=True)
+                    removed += 1
+            return removed
+
+        removed = await asyncio.to_thread(_purge)
+        if removed:
+            logger.info(f"已清理 {removed} 个过期的海报缓存目录")
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, time as dtime, timedelta
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from astrbot.api import logger
+
+from .io_utils import async_atomic_write
+
+
+PRERENDER_MAX_USERS = 500
+PRERENDER_ACTIVE_DAYS = 3
+PRERENDER_DELAY = 120  # 午夜后等待的秒数，避开零点整的请求高峰
+PRERENDER_CPU_BUDGET = 0.25  # 预渲染占用的时间比例上限
+BUSY_POLL_INTERVAL = 1.0  # 有用户请求时暂停预渲染，每秒检查一次
+
+
+class ActiveUsers:
+    """
+    最近活跃用户记录
+    用户 ID -> (最后活跃时间, 使用的编码配置)，按活跃时间排序的有界 LRU，
+    以 JSON 列表持久化，每个用户只占一行
+    """
+
+    def __init__(
+        self,
+        max_users: int = PRERENDER_MAX_USERS,
+        max_age_days: float = PRERENDER_ACTIVE_DAYS,
+    ):
+        self.max_users = max(1, int(max_users))
+        self.max_age = max_age_days * 86400
+        self._users: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+
+    def touch(self, user_id: str, encoder: str, now: float):
+        """记录一次活跃"""
+        user_id = str(user_id)
+        self._users[user_id] = (int(now), encoder)
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def recent(self, now: float) -> List[Tuple[str, str]]:
+        """
+        返回 max_age_days 内活跃过的用户，最近活跃的在前
+        Returns:
+            List[Tuple[str, str]]: (用户 ID, 编码配置)
+        """
+        cutoff = now - self.max_age
+        return [
+            (user_id, encoder)
+            for user_id, (seen, encoder) in reversed(self._users.items())
+            if seen >= cutoff
+        ]
+
+    def prune(self, now: float) -> int:
+        """删除超过 max_age_days 没有活跃的用户，返回删除的数量"""
+        cutoff = now - self.max_age
+        stale = [uid for uid, (seen, _) in self._users.items() if seen < cutoff]
+        for user_id in stale:
+            del self._users[user_id]
+        return len(stale)
+
+    def dumps(self) -> bytes:
+        rows = [[uid, seen, encoder] for uid, (seen, encoder) in self._users.items()]
+        return json.dumps(rows, separators=(",", ":")).encode("utf-8")
+
+    def load(self, path: str):
+        """从文件恢复记录，文件不存在或损坏时保持为空"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+            for user_id, seen, encoder in rows:
+                self._users[str(user_id)] = (int(seen), str(encoder))
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"读取活跃用户记录 {path} 失败: {e}")
+            self._users.clear()
+            return
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+
+def next_run_at(now: float, delay: float = PRERENDER_DELAY) -> float:
+    """
+    计算下一次预渲染的时间：本地午夜之后 delay 秒
+    Args:
+        now (float): 当前时间戳
+        delay (float): 午夜后等待的秒数
+    Returns:
+        float: 下一次运行的时间戳(严格晚于 now)
+    """
+    today = datetime.fromtimestamp(now).date()
+    run = datetime.combine(today, dtime.min).timestamp() + delay
+    if run <= now:
+        tomorrow = today + timedelta(days=1)
+        run = datetime.combine(tomorrow, dtime.min).timestamp() + delay
+    return run
+
+
+class PrerenderScheduler:
+    """
+    午夜预渲染
+    1. 每天本地午夜后为最近活跃的用户预先获取头像并生成当天的海报，早上的请求直接命中海报缓存
+    2. 低优先级：一次只渲染一张，有用户请求正在处理时暂停；
+       每张渲染后按耗时休眠，使预渲染占用的时间比例不超过 cpu_budget
+    3. 时钟、计时和休眠函数可以注入，测试时不需要等到午夜(见 benchmarks/check_prerender_schedule.py)
+    """
+
+    def __init__(
+        self,
+        active_users: ActiveUsers,
+        prerender: Callable[[str, str], Awaitable[bool]],
+        busy: Callable[[], bool] = lambda: False,
+        cpu_budget: float = PRERENDER_CPU_BUDGET,
+        delay: float = PRERENDER_DELAY,
+        state_path: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+        timer: Callable[[], float] = time.perf_counter,
+    ):
+        """
+        Args:
+            active_users (ActiveUsers): 活跃用户记录
+            prerender: prerender(用户 ID, 编码配置)，生成并缓存海报，已有缓存或失败时返回 False
+            busy: 返回 True 时表示有用户请求正在渲染，预渲染暂停
+            cpu_budget (float): 预渲染占用时间的比例上限，(0, 1]
+            delay (float): 午夜后等待的秒数
+            state_path (str): 活跃用户记录的保存路径，为 None 时不持久化
+            clock: 返回当前时间戳
+            sleep: 异步休眠函数
+            timer: 计量每张渲染耗时的单调计时器
+        """
+        self.active_users = active_users
+        self._prerender = prerender
+        self._busy = busy
+        self.cpu_budget = min(1.0, max(0.01, float(cpu_budget)))
+        self.delay = delay
+        self.state_path = state_path
+        self.clock = clock
+        self.sleep = sleep
+        self.timer = timer
+        self.rendered = 0
+        self.skipped = 0
+        self.last_run: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+        if state_path:
+            self.active_users.load(state_path)
+
+    def touch(self, user_id: str, encoder: str):
+        """记录用户活跃，在每次请求时调用"""
+        self.active_users.touch(user_id, encoder, self.clock())
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.save()
+
+    async def save(self):
+        if not self.state_path:
+            return
+        try:
+            await async_atomic_write(self.state_path, self.active_users.dumps())
+        except OSError as e:
+            logger.warning(f"保存活跃用户记录 {self.state_path} 失败: {e}")
+
+    async def _run(self):
+        while True:
+            wait = next_run_at(self.clock(), self.delay) - self.clock()
+            await self.sleep(max(0.0, wait))
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"预渲染出错: {e}")
+
+    async def run_once(self) -> int:
+        """
+        为最近活跃的用户预渲染一轮
+        Returns:
+            int: 本轮生成的海报数
+        """
+        now = self.clock()
+        self.last_run = now
+        self.active_users.prune(now)
+        users = self.active_users.recent(now)
+        logger.info(f"开始预渲染 {len(users)} 位活跃用户的今日运势")
+
+        rendered = 0
+        for user_id, encoder in users:
+            while self._busy():
+                await self.sleep(BUSY_POLL_INTERVAL)
+
+            start = self.timer()
+            try:
+                done = await self._prerender(user_id, encoder)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"为用户 {user_id} 预渲染失败: {e}")
+                done = False
+            elapsed = self.timer() - start
+
+            if done:
+                rendered += 1
+                self.rendered += 1
+            else:
+                self.skipped += 1
+            # 工作 elapsed 秒后休息，使工作时间占比不超过 cpu_budget
+            await self.sleep(elapsed * (1 - self.cpu_budget) / self.cpu_budget)
+
+        logger.info(f"预渲染完成，生成 {rendered} 张海报")
+        await self.save()
+        return rendered
@@ -0,0 +1,240 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Sequence
+
+from astrbot.api import logger
+
+from .encoders import EncodedPoster
+from .renderer import PosterRenderer, RenderSpec
+
+
+RENDER_BACKENDS = ("thread", "process")
+RENDER_WORKERS = 2
+RENDER_QUEUE_SIZE = 8
+
+
+def split_batch(specs: Sequence[RenderSpec], parts: int) -> List[List[int]]:
+    """
+    把一批渲染任务分成最多 parts 份，同一背景的任务总在同一份里(共用底图)
+    分组按大小从大到小依次放进当前最轻的一份
+    Returns:
+        List[List[int]]: 每份包含的 specs 下标，不含空的份
+    """
+    groups: Dict[str, List[int]] = {}
+    for i, spec in enumerate(specs):
+        groups.setdefault(spec.background_path, []).append(i)
+    chunks: List[List[int]] = [[] for _ in range(max(1, parts))]
+    for indexes in sorted(groups.values(), key=len, reverse=True):
+        min(chunks, key=len).extend(indexes)
+    return [chunk for chunk in chunks if chunk]
+
+
+class ThreadRenderBackend:
+    """线程渲染：在默认线程池中调用插件进程内的渲染器"""
+
+    name = "thread"
+
+    def __init__(self, renderer: PosterRenderer):
+        self.renderer = renderer
+        self._pending = 0
+
+    def start(self):
+        pass
+
+    async def _call(self, func, arg):
+        self._pending += 1
+        try:
+            return await asyncio.to_thread(func, arg)
+        finally:
+            self._pending -= 1
+
+    async def render(self, spec: RenderSpec) -> Optional[EncodedPoster]:
+        return await self._call(self.renderer.render_encoded, spec)
+
+    async def render_batch(
+        self, specs: Sequence[RenderSpec]
+    ) -> List[Optional[EncodedPoster]]:
+        return await self._call(self.renderer.render_batch_encoded, specs)
+
+    async def render_sheet(self, specs: Sequence[RenderSpec]) -> Optional[EncodedPoster]:
+        return await self._call(self.renderer.render_sheet_encoded, specs)
+
+    @property
+    def pending(self) -> int:
+        """正在渲染的请求数"""
+        return self._pending
+
+    async def close(self):
+        pass
+
+
+# 渲染进程内的渲染器，由 _init_worker 在进程启动时创建
+_worker_renderer: Optional[PosterRenderer] = None
+
+
+def _init_worker(config: dict):
+    """渲染进程初始化：加载字体、运势表和背景模板缓存，之后每次渲染都复用"""
+    global _worker_renderer
+    _worker_renderer = PosterRenderer(config, purge_templates=False)
+    _worker_renderer.fortunes.load()
+
+
+def _worker_ping() -> int:
+    return os.getpid()
+
+
+def _worker_render(spec: RenderSpec) -> Optional[EncodedPoster]:
+    if _worker_renderer is None:
+        return None
+    return _worker_renderer.render_encoded(spec)
+
+
+def _worker_render_batch(specs: List[RenderSpec]) -> List[Optional[EncodedPoster]]:
+    if _worker_renderer is None:
+        return [None] * len(specs)
+    return _worker_renderer.render_batch_encoded(specs)
+
+
+def _worker_render_sheet(specs: List[RenderSpec]) -> Optional[EncodedPoster]:
+    if _worker_renderer is None:
+        return None
+    return _worker_renderer.render_sheet_encoded(specs)
+
+
+class ProcessRenderBackend:
+    """
+    进程池渲染
+    1. 每个渲染进程启动时加载一次字体、运势表和背景模板缓存，请求只传递很小的 RenderSpec，返回编码后的字节
+    2. 正在渲染和排队的请求总数有上限，超过时调用方等待(背压)，不会无限堆积
+    3. 渲染进程崩溃导致进程池损坏时，自动重建进程池并重试一次
+    """
+
+    name = "process"
+
+    def __init__(
+        self,
+        config: dict,
+        workers: int = RENDER_WORKERS,
+        queue_size: int = RENDER_QUEUE_SIZE,
+    ):
+        self.config = config
+        self.workers = max(1, int(workers))
+        self.queue_size = max(0, int(queue_size))
+        self._slots = asyncio.Semaphore(self.workers + self.queue_size)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self.restarts = 0
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.config,),
+        )
+        # 提前拉起所有渲染进程，让第一批请求不需要等待进程初始化
+        for _ in range(self.workers):
+            executor.submit(_worker_ping)
+        return executor
+
+    def start(self):
+        if self._executor is None:
+            self._executor = self._new_executor()
+            logger.info(f"渲染进程池已启动，进程数 {self.workers}")
+
+    def _replace(self, broken: ProcessPoolExecutor):
+        # 多个请求可能同时发现进程池损坏，只重建一次
+        if self._executor is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._new_executor()
+        self.restarts += 1
+        logger.warning(f"渲染进程异常退出，已重建进程池(第 {self.restarts} 次)")
+
+    async def _submit(self, func, arg, failed):
+        """占用一个渲染槽位在进程池中执行 func(arg)，进程池损坏时重建并重试一次"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        try:
+            async with self._slots:
+                for _ in range(2):
+                    executor = self._executor
+                    try:
+                        return await loop.run_in_executor(executor, func, arg)
+                    except BrokenProcessPool:
+                        self._replace(executor)
+        finally:
+            self._pending -= 1
+        logger.error("渲染进程连续异常退出，放弃本次渲染")
+        return failed
+
+    async def render(self, spec: RenderSpec) -> Optional[EncodedPoster]:
+        """
+        在渲染进程中生成海报
+        Args:
+            spec (RenderSpec): 渲染参数
+        Returns:
+            Optional[EncodedPoster]: 编码后的海报，如果失败则返回None
+        """
+        return await self._submit(_worker_render, spec, None)
+
+    async def render_batch(
+        self, specs: Sequence[RenderSpec]
+    ) -> List[Optional[EncodedPoster]]:
+        """
+        批量生成海报：按背景分成最多 workers 份，每份在一个渲染进程中共用底图依次渲染
+        Returns:
+            List[Optional[EncodedPoster]]: 与 specs 一一对应，失败的位置为None
+        """
+        chunks = split_batch(specs, self.workers)
+        results = await asyncio.gather(
+            *(
+                self._submit(
+                    _worker_render_batch, [specs[i] for i in chunk], [None] * len(chunk)
+                )
+                for chunk in chunks
+            )
+        )
+        posters: List[Optional[EncodedPoster]] = [None] * len(specs)
+        for chunk, chunk_posters in zip(chunks, results):
+            for i, poster in zip(chunk, chunk_posters):
+                posters[i] = poster
+        return posters
+
+    async def render_sheet(self, specs: Sequence[RenderSpec]) -> Optional[EncodedPoster]:
+        """在一个渲染进程中生成批量模式的总览图"""
+        return await self._submit(_worker_render_sheet, list(specs), None)
+
+    @property
+    def pending(self) -> int:
+        """正在渲染、排队和等待排队的请求数"""
+        return self._pending
+
+    async def close(self):
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, True, cancel_futures=True)
+            logger.info("渲染进程池已关闭")
+
+
+def create_render_backend(
+    name: str,
+    renderer: PosterRenderer,
+    config: dict,
+    workers: int = RENDER_WORKERS,
+    queue_size: int = RENDER_QUEUE_SIZE,
+):
+    """
+    按配置创建渲染后端
+    Args:
+        name (str): thread 或 process
+        renderer (PosterRenderer): 插件进程内的渲染器，线程模式使用
+        config (dict): 渲染配置，进程模式下传给每个渲染进程
+    """
+    if name == "process":
+        return ProcessRenderBackend(config, workers=workers, queue_size=queue_size)
+    if name != "thread":
+        logger.warning(f"未知的渲染后端 {name}，使用 thread")
+    return ThreadRenderBackend(renderer)
@@ -0,0 +1,834 @@
+import functools
+import math
+import random
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from astrbot.api import logger
+
+from .background_templates import BackgroundTemplateStore
+from .encoders import DEFAULT_PROFILE, EncodedPoster, encode_image, get_profile
+from .font_manager import FontChain
+from .fortune_table import FortuneStore
+from .gradient_text import create_gradient_glyph, draw_gradient_line
+from .layout import TEXT_WRAP_WIDTH, PosterLayout
+from .text_layout import TextLayout, layout_text
+from .text_sprites import TEXT_SPRITE_CACHE_SIZE, TextSprite, TextSpriteCache, crop_sprite
+
+
+WARNING_TEXT = "仅供娱乐 | 相信科学 | 请勿迷信"
+
+# 批量模式的总览图：每张海报缩小到约 360 像素宽，按网格排列
+SHEET_THUMB_WIDTH = 360
+SHEET_MAX_COLUMNS = 5
+SHEET_GAP = 12
+SHEET_BACKGROUND = (24, 24, 24)
+
+
+class RenderSpec(NamedTuple):
+    """
+    一次海报渲染所需的全部输入
+    只包含运势条目的编号和文件路径，可以廉价地传给渲染进程
+    """
+
+    entry_key: str  # jrys.json 中的分组键(FortuneEntry.bucket)
+    entry_index: int  # 分组内的下标
+    background_path: str
+    avatar_path: Optional[str]
+    date: str  # 海报上显示的日期
+    encoder: str = DEFAULT_PROFILE  # 编码配置名称
+
+
+class PosterRenderer:
+    """
+    运势海报渲染器
+    持有字体、运势数据和背景模板缓存，不依赖插件实例，
+    既可以在插件进程的线程中使用，也可以在渲染进程中独立创建。
+    """
+
+    def __init__(self, config: dict, purge_templates: bool = True):
+        """
+        Args:
+            config (dict): 渲染配置，由插件的 _renderer_config 生成，只包含可序列化的值
+            purge_templates (bool): 是否删除其他配置下的旧背景模板，渲染进程中为 False
+        """
+        self.config = config
+        self.font_path = config["font_path"]
+
+        # 版式：位置、字号、面板和头像都已经按画布尺寸缩放好
+        self.layout = PosterLayout.from_config(config)
+        self.image_width = self.layout.image_width
+        self.image_height = self.layout.image_height
+        self.avatar_position = self.layout.avatar_position
+        self.avatar_size = self.layout.avatar_size
+
+        self.date_y = self.layout.date_y
+        self.summary_y = self.layout.summary_y
+        self.lucky_star_y = self.layout.lucky_star_y
+        self.sign_text_y = self.layout.sign_text_y
+        self.unsign_text_y = self.layout.unsign_text_y
+        self.warning_text_y = self.layout.warning_text_y
+
+        self.panel_geometry = self.layout.panel_geometry
+
+        # 背景模板缓存：裁切后的背景和半透明面板合成一次，之后直接复制
+        self.template_store = None
+        if config.get("template_dir"):
+            self.template_store = BackgroundTemplateStore(
+                config["template_dir"],
+                self.image_width,
+                self.image_height,
+                self.panel_geometry,
+                purge_stale=purge_templates,
+                compress=config.get("template_compress", False),
+            )
+
+        # 字体按字号懒加载，进程内共享；主字体缺字时按回退链选择字体
+        self.fonts = FontChain(self.font_path, config.get("fallback_fonts", ()))
+
+        # 幸运总结、签文、解签和警告文字的图层缓存，键中包含影响绘制结果的字体和排版配置
+        self.text_sprites = TextSpriteCache(
+            config.get("text_sprite_cache_size", TEXT_SPRITE_CACHE_SIZE)
+        )
+        self._text_config = (self.font_path, tuple(self.fonts.fallbacks), self.layout)
+        self._warning_sprite: Optional[TextSprite] = None
+
+        # 运势表：文件变化后自动重新加载，线程渲染时与插件共用同一个实例
+        self.fortunes = FortuneStore(
+            config.get("jrys_path"),
+            config.get("jrys_cache_path"),
+            weighting=config.get("fortune_weighting", "bucket"),
+        )
+
+    def pick_entry(self, seed: Optional[int] = None) -> Optional[Tuple[str, int]]:
+        """
+        抽取一条运势
+        Args:
+            seed (int): 随机种子，为None时完全随机；固定种子时总是抽到同一条运势
+        Returns:
+            Optional[tuple]: (分组键, 分组内下标)，运势数据为空时返回None
+        """
+        # 固定种子时使用独立的随机数生成器，保证同一种子抽到同一条运势
+        rng = random.Random(seed) if seed is not None else random
+        entry = self.fortunes.table.pick(rng)
+        if entry is None:
+            return None
+        return entry.bucket, entry.index
+
+    def render_encoded(self, spec: RenderSpec) -> Optional[EncodedPoster]:
+        """
+        渲染海报并按 spec.encoder 指定的编码配置编码
+        Args:
+            spec (RenderSpec): 渲染参数
+        Returns:
+            Optional[EncodedPoster]: 编码后的海报，如果失败则返回None
+        """
+        timings = {}
+        image = self.render(spec, timings)
+        if image is None:
+            return None
+        return self._encode_timed(image, spec.encoder, timings)
+
+    def _encode_timed(
+        self, image: Image.Image, encoder: str, timings: dict
+    ) -> Optional[EncodedPoster]:
+        try:
+            poster = self.encode(image, encoder)
+            timings["encode"] = poster.encode_ms
+            return poster._replace(timings=timings)
+        except Exception as e:
+            logger.error(f"编码运势图片失败: {e}")
+            return None
+
+    def _render_grouped(
+        self, specs: Sequence[RenderSpec]
+    ) -> Iterator[Tuple[int, Optional[Image.Image], dict]]:
+        """
+        按背景分组渲染一批海报，同一背景只解码、裁切和合成一次底图
+        生成 (下标, 海报, 各阶段耗时)，调用方处理完一张再渲染下一张，内存中只保留当前分组的底图
+        """
+        groups: Dict[str, List[int]] = {}
+        for i, spec in enumerate(specs):
+            groups.setdefault(spec.background_path, []).append(i)
+
+        for background_path, indexes in groups.items():
+            start = time.perf_counter()
+            base = self._background_base(background_path)
+            base_ms = (time.perf_counter() - start) * 1000
+            if base is None:
+                logger.error(f"裁剪背景图片失败: {background_path}")
+            for n, i in enumerate(indexes):
+                timings = {}
+                image = None
+                if base is not None:
+                    image = self.render(specs[i], timings, base=base)
+                if n == 0 and "background" in timings:
+                    # 底图的生成耗时计入分组内的第一张海报
+                    timings["background"] += base_ms
+                yield i, image, timings
+
+    def render_batch_encoded(
+        self, specs: Sequence[RenderSpec]
+    ) -> List[Optional[EncodedPoster]]:
+        """
+        批量渲染并编码海报
+        Args:
+            specs: 渲染参数列表
+        Returns:
+            List[Optional[EncodedPoster]]: 与 specs 一一对应，失败的位置为None
+        """
+        posters: List[Optional[EncodedPoster]] = [None] * len(specs)
+        for i, image, timings in self._render_grouped(specs):
+            if image is not None:
+                posters[i] = self._encode_timed(image, specs[i].encoder, timings)
+        return posters
+
+    def render_sheet_encoded(
+        self, specs: Sequence[RenderSpec]
+    ) -> Optional[EncodedPoster]:
+        """
+        批量渲染海报，缩小后拼成一张总览图，按第一个 spec 的编码配置编码
+        Args:
+            specs: 渲染参数列表，按顺序从左到右、从上到下排列
+        Returns:
+            Optional[EncodedPoster]: 编码后的总览图，全部渲染失败时返回None
+        """
+        if not specs:
+            return None
+        start = time.perf_counter()
+        count = len(specs)
+        columns = min(SHEET_MAX_COLUMNS, math.ceil(math.sqrt(count)))
+        rows = math.ceil(count / columns)
+        # reduce 按整数倍缩小，比任意尺寸的缩放快得多
+        factor = max(1, self.image_width // SHEET_THUMB_WIDTH)
+        thumb_width = math.ceil(self.image_width / factor)
+        thumb_height = math.ceil(self.image_height / factor)
+        sheet = Image.new(
+            "RGB",
+            (
+                columns * thumb_width + (columns + 1) * SHEET_GAP,
+                rows * thumb_height + (rows + 1) * SHEET_GAP,
+            ),
+            SHEET_BACKGROUND,
+        )
+
+        rendered = 0
+        for i, image, _ in self._render_grouped(specs):
+            if image is None:
+                continue
+            row, column = divmod(i, columns)
+            thumb = image.reduce(factor).convert("RGB")
+            sheet.paste(
+                thumb,
+                (
+                    SHEET_GAP + column * (thumb_width + SHEET_GAP),
+                    SHEET_GAP + row * (thumb_height + SHEET_GAP),
+                ),
+            )
+            rendered += 1
+        if not rendered:
+            return None
+
+        timings = {"sheet": (time.perf_counter() - start) * 1000}
+        return self._encode_timed(sheet, specs[0].encoder, timings)
+
+    def encode(
+        self, image: Image.Image, encoder: str = DEFAULT_PROFILE
+    ) -> EncodedPoster:
+        profile = get_profile(encoder)
+        if profile is None:
+            logger.warning(f"未知的编码配置 {encoder}，使用 {DEFAULT_PROFILE}")
+            profile = get_profile(DEFAULT_PROFILE)
+        return encode_image(image, profile)
+
+    def render(
+        self,
+        spec: RenderSpec,
+        timings: Optional[dict] = None,
+        base: Optional[Image.Image] = None,
+    ) -> Optional[Image.Image]:
+        """
+            同步函数：执行所有CPU密集的图像处理任务(不含编码)
+        Args:
+            spec (RenderSpec): 渲染参数
+            timings (dict): 不为None时写入各阶段耗时(毫秒)
+            base (Image.Image): 已经合成好的背景底图，批量渲染时共用，不会被修改
+        Returns:
+            Optional[Image.Image]: 绘制好的海报，如果失败则返回None
+        """
+        date_y = self.date_y
+        lucky_star_y = self.lucky_star_y
+        if timings is None:
+            timings = {}
+
+        try:
+            stage_start = time.perf_counter()
+
+            # 运势文件被修改后，渲染进程在这里加载新表，与插件进程保持一致
+            fortune = self.fortunes.load().get(spec.entry_key, spec.entry_index)
+            if fortune is None:
+                logger.error(f"运势数据中没有找到 {spec.entry_key} 的数据")
+                return None
+
+            date = spec.date
+            background_path = spec.background_path
+            avatar_path = spec.avatar_path
+
+            # 1. 获取运势数据
+            lucky_star = fortune.lucky_star
+
+            # 幸运总结、签文、解签和警告文字对同一条运势每次都相同，排版和绘制结果缓存为图层
+            summary_sprite, *text_sprites = self.text_sprites.get(
+                self._sprite_key(fortune), lambda: self._build_text_sprites(fortune)
+            )
+            stage_start = self._mark(timings, "layout", stage_start)
+
+            # 2. 核心图像处理流程
+
+            # 裁切图片并添加半透明图层(有模板时直接复制模板)
+            if base is not None:
+                image = base.copy()
+            else:
+                image = self._background_base(background_path)
+            if image is None:
+                logger.error("裁剪背景图片失败")
+                return None
+            stage_start = self._mark(timings, "background", stage_start)
+
+            # 在图片上绘制文字
+
+            # 绘制日期
+            image = self.draw_text(
+                image,
+                text=date,
+                position="center",
+                y=date_y,
+                color=(255, 255, 255),
+                font=self.fonts[self.layout.date_font_size],
+                gradients=True,
+            )
+
+            # 绘制幸运总结
+            if summary_sprite is not None:
+                summary_sprite.paste(image)
+
+            # 绘制幸运星
+            image = self.draw_text(
+                image,
+                text=lucky_star,
+                position="center",
+                y=lucky_star_y,
+                color=(255, 255, 255),
+                font=self.fonts[self.layout.lucky_star_font_size],
+                gradients=True,
+            )
+            # 绘制运势文本和警告文本
+            for sprite in text_sprites:
+                if sprite is not None:
+                    sprite.paste(image)
+
+            stage_start = self._mark(timings, "text", stage_start)
+
+            # 在图片上绘制用户头像
+            image = self.draw_avatar_img(avatar_path, image)
+            self._mark(timings, "avatar", stage_start)
+
+            return image
+
+        except Exception as e:
+            logger.error(f"获取运势数据失败: {e}")
+            return None
+
+    def _sprite_key(self, fortune) -> tuple:
+        # 运势表重新加载后同一编号可能对应不同的文字，文字本身也作为键的一部分
+        return (
+            fortune.bucket,
+            fortune.index,
+            fortune.fortune_summary,
+            fortune.sign_text,
+            fortune.unsign_text,
+            self._text_config,
+        )
+
+    def _text_sprite(
+        self,
+        text: str,
+        position: str,
+        y: int,
+        font: ImageFont.ImageFont,
+        layout: Optional[TextLayout] = None,
+    ) -> Optional[TextSprite]:
+        """
+        把一段文字绘制成图层，绘制方式与 draw_text 相同
+        Args:
+            text (str): 文字
+            position (str): 'left' 或 'center'
+            y (int): 文字在海报上的y坐标
+            font (ImageFont): 字体对象
+            layout (TextLayout): 已经算好的换行结果
+        Returns:
+            Optional[TextSprite]: 文字为空时返回None
+        """
+        if layout is None:
+            layout = layout_text(text, font, self.layout.wrap_width)
+        # 上下各留一个字号的余量，容纳超出行高的笔画
+        margin = getattr(font, "size", 0) or layout.line_spacing
+        canvas = Image.new(
+            "L", (self.image_width, len(layout.lines) * layout.line_spacing + 2 * margin), 0
+        )
+        self.draw_text(
+            canvas, text, position, font, y=margin, color=255, layout=layout
+        )
+        return crop_sprite(canvas, 0, y - margin, (255, 255, 255))
+
+    def _build_text_sprites(self, fortune) -> Tuple[Optional[TextSprite], ...]:
+        """
+        生成一条运势的固定文字图层
+        Returns:
+            tuple: (幸运总结, 签文, 解签, 警告文字)，文字为空的项为None
+        """
+        text_font = self.fonts[self.layout.text_font_size]
+
+        # 如果unsign_lines>3行，怕这个warning_text和unsign_text贴在一起，加个自动换行的
+        # 行数按 36 号字统计(比绘制用的 30 号字宽，行数偏多，文字整体上移得更多)，
+        # 与原有海报的排版一致；绘制时的换行结果单独排版
+        unsign_lines = layout_text(
+            fortune.unsign_text,
+            self.fonts[self.layout.unsign_count_font_size],
+            self.layout.wrap_width,
+        ).lines
+
+        # 如果unsign_lines>3行，unsign_text_y向上移动
+        # (警告文字一直画在配置的位置上，与海报原有的效果保持一致)
+        unsign_text_y = self.unsign_text_y
+        if len(unsign_lines) > 3:
+            unsign_text_y -= (
+                len(unsign_lines) - 3
+            ) * self.layout.unsign_line_offset  # 每行15像素的间距(按画布缩放)
+
+        # 警告文字与运势无关，所有条目共用一个图层
+        if self._warning_sprite is None:
+            self._warning_sprite = self._text_sprite(
+                WARNING_TEXT, "center", self.warning_text_y, text_font
+            )
+
+        return (
+            self._text_sprite(
+                fortune.fortune_summary,
+                "center",
+                self.summary_y,
+                self.fonts[self.layout.summary_font_size],
+            ),
+            self._text_sprite(fortune.sign_text, "left", self.sign_text_y, text_font),
+            self._text_sprite(
+                fortune.unsign_text, "left", unsign_text_y, text_font
+            ),
+            self._warning_sprite,
+        )
+
+    def warm_text_sprite(self, fortune) -> bool:
+        """
+        预先生成一条运势的文字图层(同步函数)
+        Returns:
+            bool: 是否新生成；已有缓存或缓存已满时返回False
+        """
+        key = self._sprite_key(fortune)
+        if self.text_sprites.full or key in self.text_sprites:
+            return False
+        self.text_sprites.put(key, self._build_text_sprites(fortune))
+        return True
+
+    @staticmethod
+    def _mark(timings: dict, stage: str, start: float) -> float:
+        """记录从 start 到现在的耗时，返回现在的时间作为下一阶段的起点"""
+        now = time.perf_counter()
+        timings[stage] = (now - start) * 1000
+        return now
+
+    def _background_base(self, background_path: str) -> Optional[Image.Image]:
+        """获取可以直接绘制的背景底图，有模板缓存时复制模板"""
+        if self.template_store is not None:
+            return self.template_store.get(
+                background_path, self._build_background_template
+            )
+        return self._build_background_template(background_path)
+
+    def _build_background_template(self, background_path: str) -> Optional[Image.Image]:
+        """
+        生成背景模板：裁切背景并合成半透明面板
+        Args:
+            background_path (str): 背景图片的路径
+        Returns:
+            Optional[Image.Image]: 合成后的背景，如果失败则返回None
+        """
+        image = self.crop_center(background_path)
+        if image is None:
+            return None
+
+        x, y, box_width, box_height, radius, layer_color = self.panel_geometry
+        return self.add_transparent_layer(
+            image,
+            position=(x, y),
+            box_width=box_width,
+            box_height=box_height,
+            layer_color=layer_color,
+            radius=radius,
+        )
+
+    def draw_text(
+        self,
+        img: Image.Image,
+        text: str,
+        position: str,
+        font: ImageFont.ImageFont,
+        y: int = None,
+        color: Tuple[int, int, int] = (255, 255, 255),
+        max_width: int = 800,
+        gradients: bool = False,
+        layout: Optional[TextLayout] = None,
+    ) -> Image.Image:
+        """
+        在图片上绘制文字
+        参数：
+            img (Image): 要绘制的图片
+            text (str): 要绘制的文字
+            position (tuple or str): 文字的位置, 可为'left','center'或坐标元组
+            y (int): 文字的y坐标,如果position为'topleft'或'center',则y无效
+            color (tuple): 文字颜色，默认为白色
+            font (ImageFont): 字体对象,如果为None则使用默认字体
+            max_width (int): 文字的最大宽度,默认为800
+            gradients (bool): 是否使用渐变色填充文字，默认为False
+            layout (TextLayout): 已经算好的换行结果，为None时按字体重新排版
+        """
+
+        try:
+            draw = ImageDraw.Draw(img)
+
+            # 自动换行处理，每行的宽度和左边界在排版时已经算好
+            if layout is None:
+                layout = layout_text(text, font, self.layout.wrap_width)
+
+            # 获取图片的宽高
+            img_width, img_height = img.size
+
+            if isinstance(position, str):
+                if position == "center":
+
+                    def x_func(line):
+                        return (img_width - line.width) // 2  # 计算x坐标
+
+                    def offset_x_func(line):
+                        return -line.left
+
+                elif position == "left":
+
+                    def x_func(line):
+                        return self.layout.left_padding  # 固定左侧留白
+
+                    def offset_x_func(line):
+                        return 0
+
+                else:
+                    raise ValueError(
+                        "position参数错误,只能为'topleft','center'或坐标元组"
+                    )
+                # 计算y坐标
+                text_y = y if y is not None else 0
+            elif isinstance(position, tuple):
+                text_x, text_y = position
+
+                def x_func(line):
+                    return text_x
+
+                def offset_x_func(line):
+                    return 0
+
+            else:
+                raise ValueError("position参数错误,只能为'left','center'或坐标元组")
+
+            # 绘制每一行
+            line_spacing = layout.line_spacing  # 行间距
+            for line in layout.lines:
+                # 只有主字体缺字的行才按字符选择回退字体
+                font_for = None
+                if self.fonts.is_primary(font) and self.fonts.missing(line.text):
+                    font_for = functools.partial(self.fonts.font_for, font=font)
+
+                if gradients:
+                    # 逐字符绘制渐变色，字形蒙版来自共享缓存，只有颜色每次重新填充
+                    draw_gradient_line(
+                        img,
+                        line.text,
+                        font,
+                        x_func(line) + offset_x_func(line),
+                        text_y,
+                        self.get_light_color,
+                        font_for=font_for,
+                    )
+
+                elif font_for is not None:
+                    # 按字体拆成片段依次绘制
+                    text_x = x_func(line) + offset_x_func(line)
+                    for run, run_font in self.fonts.split_runs(line.text, font):
+                        draw.text((text_x, text_y), run, font=run_font, fill=color)
+                        text_x += run_font.getlength(run)
+
+                else:
+                    # 绘制普通文字
+                    offset_x = offset_x_func(line)  # 获取偏移量
+                    draw.text(
+                        (x_func(line) + offset_x, text_y),
+                        line.text,
+                        font=font,
+                        fill=color,
+                    )
+
+                text_y += line_spacing  # 更新y坐标
+
+            return img
+
+        except Exception as e:
+            logger.error(f"绘制文字时出错: {e}")
+            return img
+
+    def crop_center(
+        self, image_path: str, width: int = None, height: int = None
+    ) -> Optional[Image.Image]:
+        """
+        从图片中间裁剪指定尺寸的区域，如果图片尺寸小于目标尺寸，则先放大,太大则缩小。
+
+        参数：
+
+            width (int): 裁剪宽度，默认为 1080 像素。
+            height (int): 裁剪高度，默认为 1920 像素。
+
+        返回：
+            Image.Image: 裁剪后的图片对象，如果发生错误则返回 None。
+        """
+        width = width if width is not None else self.image_width
+        height = height if height is not None else self.image_height
+        try:
+            # 只读取文件头，先确定缩放后的尺寸，再决定怎样解码
+            img = Image.open(image_path)
+            img_width, img_height = img.size
+            new_width, new_height = img_width, img_height
+
+            # 如果图片尺寸小于目标尺寸，则先放大
+            if img_width < width or img_height < height:
+                scale_x = width / img_width
+                scale_y = height / img_height
+                scale = max(scale_x, scale_y)  # 保持比例，选择较大的缩放倍数
+                new_width = int(img_width * scale)
+                new_height = int(img_height * scale)
+
+            # 如果图片尺寸远大于目标尺寸
+
+            else:
+                max_scale = 1.8  # 防止图片太大浪费资源
+                if img_width > width * max_scale or img_height > height * max_scale:
+                    scale_x = (width * max_scale) / img_width
+                    scale_y = (height * max_scale) / img_height
+                    scale = min(scale_x, scale_y)
+                    new_width = int(img_width * scale)
+                    new_height = int(img_height * scale)
+
+            # 缩小时让 JPEG 解码器直接按 1/2、1/4、1/8 解码(结果不小于缩放后的尺寸)，
+            # 解码耗时和内存随之下降；其他格式 draft 不生效，返回 None
+            valid_width, valid_height = img_width, img_height
+            if new_width < img_width:
+                drafted = img.draft(None, (new_width, new_height))
+                if drafted is not None:
+                    _, (_, _, valid_width, valid_height) = drafted
+            if img.mode not in ("RGB", "RGBA", "L"):
+                # 调色板等模式不能高质量缩放，先转换(这类图片通常不大)
+                img = img.convert("RGBA")
+
+            # 缩放后坐标系中的居中裁切框，超出图片的部分保持透明(与先缩放再裁切一致)
+            left = round((new_width - width) / 2)
+            top = round((new_height - height) / 2)
+            crop = (
+                max(0, left),
+                max(0, top),
+                min(new_width, left + width),
+                min(new_height, top + height),
+            )
+            if (new_width, new_height) == img.size:
+                region = img.crop(crop)
+            else:
+                # 只对裁切区域重采样，大倍数缩小时先用 reduce 做整数倍缩小
+                sx = valid_width / new_width
+                sy = valid_height / new_height
+                region = img.resize(
+                    (crop[2] - crop[0], crop[3] - crop[1]),
+                    Image.LANCZOS,
+                    box=(crop[0] * sx, crop[1] * sy, crop[2] * sx, crop[3] * sy),
+                    reducing_gap=3.0,
+                )
+
+            # 只转换裁切后的区域
+            cropped_img = region.convert("RGBA")
+            if cropped_img.size != (width, height):
+                canvas = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+                canvas.paste(cropped_img, (crop[0] - left, crop[1] - top))
+                cropped_img = canvas
+
+            return cropped_img
+
+        except FileNotFoundError:
+            logger.error(f"错误：找不到图片文件：{image_path}")
+        except Exception as e:
+            logger.error(f"发生错误：{e}")
+            return None
+
+    def add_transparent_layer(
+        self,
+        base_img: Image.Image,
+        box_width: int = 800,
+        box_height: int = 400,
+        position: Tuple[int, int] = (100, 200),
+        layer_color: Tuple[int, int, int, int] = (0, 0, 0, 128),
+        radius: int = 50,
+    ) -> Image.Image:
+        """
+        在图片上添加一个半透明图层
+
+        参数：
+            base_img (Image): 背景图像（RGBA 格式）
+            text (str): 要绘制的文字内容
+            box_width (int): 半透明框的宽度
+            box_height (int): 半透明框的高度
+            position (tuple): 半透明框的位置
+            layer_color (tuple): 半透明层颜色，RGBA 格式
+            radius (int): 圆角半径
+        返回：
+            合成后的 Image 对象
+        """
+        try:
+            x1, y1 = position
+            x2 = x1 + box_width
+            y2 = y1 + box_height
+
+            # 创建半透明图层
+            overlay = Image.new("RGBA", base_img.size, (0, 0, 0, 0))
+            draw = ImageDraw.Draw(overlay)
+
+            draw.rounded_rectangle((x1, y1, x2, y2), radius=radius, fill=layer_color)
+
+            return Image.alpha_composite(base_img, overlay)
+
+        except Exception as e:
+            logger.error(f"添加半透明图层时出错: {e}")
+            return base_img
+
+    def wrap_text(
+        self,
+        text: str,
+        font: ImageFont.ImageFont,
+        draw: ImageDraw.ImageDraw = None,
+        max_width: int = TEXT_WRAP_WIDTH,
+    ) -> List[str]:
+        """
+        将文字按最大宽度进行换行
+        参数：
+            text (str): 原始文字
+            max_width (int): 最大宽度
+            draw: 已不再使用，保留参数以兼容旧的调用方式
+            font: ImageFont对象
+        返回：
+            list[str]: 每行一段文字
+
+        """
+        try:
+            return [line.text for line in layout_text(text, font, max_width).lines]
+        except Exception as e:
+            logger.error(f"换行时出错: {e}")
+            return [text]  # 如果出错，返回原始文本
+
+    def create_gradients_image(
+        self, char: str, font, colors: List[Tuple[int, int, int]]
+    ) -> Image.Image:
+        """
+        创建渐变色字体图像
+        参数：
+            char (str): 要绘制的字符
+            font: ImageFont对象
+            colors (list of tuple): 渐变色列表，包含起始和结束颜色
+
+        Returns:
+            Image: 渐变色字体图像
+
+        """
+        try:
+            return create_gradient_glyph(char, font, colors)
+        except Exception as e:
+            logger.error(f"创建渐变色字体图像时出错: {e}")
+            # 如果出错，返回一个普通白色文字图像
+            width = max(1, int(font.getlength(char)))
+            img = Image.new("RGBA", (width, font.size), (255, 255, 255, 0))
+            draw = ImageDraw.Draw(img)
+            draw.text((0, 0), char, font=font, fill=(255, 255, 255))
+            return img
+
+    def get_light_color(self) -> List[Tuple[int, int, int]]:
+        """获取浅色调颜色列表用于渐变
+
+        Returns:
+            浅色调颜色列表
+        """
+
+        light_colors = [
+            (255, 250, 205),  # 浅黄色
+            (173, 216, 230),  # 浅蓝色
+            (221, 160, 221),  # 浅紫色
+            (255, 182, 193),  # 浅粉色
+            (240, 230, 140),  # 浅卡其色
+            (224, 255, 255),  # 浅青色
+            (245, 245, 220),  # 浅米色
+            (230, 230, 250),  # 浅薰衣草色
+        ]
+        return random.choices(light_colors, k=4)  # 随机选4个颜色进行渐变
+
+    def draw_avatar_img(self, avatar_path: Optional[str], img: Image.Image) -> Image.Image:
+        """
+        在图片上绘制用户头像
+        1. 获取用户头像
+        2. 将头像裁剪为圆形
+        3. 将头像绘制到图片上
+        Args:
+            avatar_path (str): 头像的路径，为 None 时(头像获取失败)不绘制头像
+            img (Image): 要绘制的图片
+        Returns:
+            Image: 绘制了头像的图片
+        """
+        if not avatar_path:
+            return img
+        try:
+            avatar = Image.open(avatar_path)
+            if avatar.mode == "RGBA" and avatar.size == self.avatar_size:
+                # 头像缓存中的头像已经缩放并裁成圆形，直接粘贴
+                img.paste(avatar, self.avatar_position, avatar)
+                return img
+
+            avatar = avatar.convert("RGBA")
+            avatar = avatar.resize(self.avatar_size, Image.LANCZOS)
+
+            # 创建一个与头像尺寸相同的透明蒙版
+            mask = Image.new("L", avatar.size, 0)
+            mask_draw = ImageDraw.Draw(mask)
+
+            # 绘制一个白色的圆形，作为不透明区域
+            mask_draw.ellipse((0, 0, avatar.size[0], avatar.size[1]), fill=255)
+
+            # 将蒙版应用到头像上
+            avatar.putalpha(mask)
+
+            # 将头像粘贴到图片上
+            img.paste(avatar, self.avatar_position, avatar)
+
+            return img
+        except Exception as e:
+            logger.error(f"绘制头像时出错: {e}")
+            # 如果出错，返回原始图片
+            return img
@@ -0,0 +1,55 @@
+import random
+from typing import List, Sequence
+
+
+class AliasSampler:
+    """
+    Walker/Vose 别名采样器
+    构建时 O(n)，每次按权重抽取一个下标为 O(1)，抽取过程不分配新对象。
+    """
+
+    __slots__ = ("_prob", "_alias", "_n")
+
+    def __init__(self, weights: Sequence[float]):
+        n = len(weights)
+        if n == 0:
+            raise ValueError("权重列表不能为空")
+        total = float(sum(weights))
+        if total <= 0 or any(w < 0 for w in weights):
+            raise ValueError("权重必须为非负数且总和大于 0")
+
+        prob: List[float] = [0.0] * n
+        alias: List[int] = [0] * n
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        while small and large:
+            s = small.pop()
+            g = large.pop()
+            prob[s] = scaled[s]
+            alias[s] = g
+            scaled[g] = scaled[g] + scaled[s] - 1.0
+            if scaled[g] < 1.0:
+                small.append(g)
+            else:
+                large.append(g)
+
+        # 剩下的都是浮点误差导致的概率接近 1 的项
+        for i in large + small:
+            prob[i] = 1.0
+            alias[i] = i
+
+        self._prob = prob
+        self._alias = alias
+        self._n = n
+
+    def sample(self, rng: random.Random = random) -> int:
+        """按权重抽取一个下标"""
+        i = int(rng.random() * self._n)
+        if rng.random() < self._prob[i]:
+            return i
+        return self._alias[i]
+
+    def __len__(self) -> int:
+        return self._n
@@ -0,0 +1,180 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from PIL import ImageFont
+
+
+LAYOUT_CACHE_SIZE = 512
+KERNING_CACHE_SIZE = 4096
+
+
+class AdvanceTable:
+    """
+    单个 (字体, 字号) 的字符度量表
+    每个字符只测量一次步进宽度和墨迹 bbox；字偶距通过相邻两个字符的局部修正得到，
+    不需要像逐字测量整行前缀那样反复测量。
+    """
+
+    def __init__(self, font: ImageFont.ImageFont):
+        self.font = font
+        self._advances: Dict[str, float] = {}
+        self._ink: Dict[str, Tuple[int, int, int, int]] = {}
+        self._kerning: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def advance(self, char: str) -> float:
+        """字符的步进宽度"""
+        value = self._advances.get(char)
+        if value is None:
+            value = self.font.getlength(char)
+            self._advances[char] = value
+        return value
+
+    def ink(self, char: str) -> Tuple[int, int, int, int]:
+        """字符在原点处绘制时的墨迹 bbox"""
+        value = self._ink.get(char)
+        if value is None:
+            value = self.font.getbbox(char)
+            self._ink[char] = value
+        return value
+
+    def kerning(self, left: str, right: str) -> float:
+        """
+        相邻两个字符的字偶距修正
+        等于两个字符连写的宽度减去各自步进宽度之和，没有字偶距时为 0
+        """
+        pair = left + right
+        value = self._kerning.get(pair)
+        if value is None:
+            value = self.font.getlength(pair) - self.advance(left) - self.advance(right)
+            with self._lock:
+                if len(self._kerning) >= KERNING_CACHE_SIZE:
+                    self._kerning.clear()
+                self._kerning[pair] = value
+        return value
+
+
+class TextLine:
+    """
+    排版后的一行文字
+    width 和 left 与 draw.textbbox((0, 0), text) 得到的宽度和左边界一致
+    """
+
+    __slots__ = ("text", "width", "left")
+
+    def __init__(self, text: str, width: int, left: int):
+        self.text = text
+        self.width = width
+        self.left = left
+
+    def __repr__(self) -> str:
+        return f"TextLine({self.text!r}, width={self.width}, left={self.left})"
+
+
+class TextLayout:
+    """一段文字的换行结果，可以在计算高度和绘制之间共享"""
+
+    __slots__ = ("text", "lines", "font", "max_width")
+
+    def __init__(
+        self,
+        text: str,
+        lines: List[TextLine],
+        font: ImageFont.ImageFont,
+        max_width: int,
+    ):
+        self.text = text
+        self.lines = lines
+        self.font = font
+        self.max_width = max_width
+
+    @property
+    def line_spacing(self) -> int:
+        return int(self.font.size * 1.5)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+
+_tables: "OrderedDict[tuple, AdvanceTable]" = OrderedDict()
+_layouts: "OrderedDict[tuple, TextLayout]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _font_key(font: ImageFont.ImageFont) -> tuple:
+    # 默认字体没有路径，用对象 id 区分
+    return (getattr(font, "path", None) or id(font), getattr(font, "size", 0))
+
+
+def get_advance_table(font: ImageFont.ImageFont) -> AdvanceTable:
+    """获取字体对应的共享度量表"""
+    key = _font_key(font)
+    with _lock:
+        table = _tables.get(key)
+        if table is None:
+            table = AdvanceTable(font)
+            _tables[key] = table
+        return table
+
+
+def layout_text(
+    text: str, font: ImageFont.ImageFont, max_width: int
+) -> TextLayout:
+    """
+    将文字按最大宽度换行
+    每个字符只参与一次计算，整体为线性复杂度；相同的 (字体, 文字, 宽度) 直接复用缓存结果。
+    参数：
+        text (str): 原始文字
+        font (ImageFont): 字体对象
+        max_width (int): 最大宽度
+    返回：
+        TextLayout: 换行结果
+    """
+    key = (_font_key(font), text, max_width)
+    with _lock:
+        layout = _layouts.get(key)
+        if layout is not None:
+            _layouts.move_to_end(key)
+            return layout
+
+    table = get_advance_table(font)
+    lines: List[TextLine] = []
+
+    start = 0  # 当前行起始下标
+    pen = 0.0  # 当前行下一个字符的笔位置
+    left = 0  # 当前行首字符的墨迹左边界
+    width = 0  # 当前行的墨迹宽度
+    prev: Optional[str] = None
+
+    for i, char in enumerate(text):
+        ink = table.ink(char)
+        if prev is None:
+            left = ink[0]
+            width = ink[2] - ink[0]
+            pen = table.advance(char)
+            prev = char
+            continue
+
+        char_x = pen + table.kerning(prev, char)
+        test_width = int(char_x) + ink[2] - left
+        if test_width <= max_width:
+            width = max(width, test_width)
+            pen = char_x + table.advance(char)
+        else:
+            lines.append(TextLine(text[start:i], width, left))
+            start = i
+            left = ink[0]
+            width = ink[2] - ink[0]
+            pen = table.advance(char)
+        prev = char
+
+    if start < len(text):
+        lines.append(TextLine(text[start:], width, left))
+
+    layout = TextLayout(text, lines, font, max_width)
+    with _lock:
+        _layouts[key] = layout
+        while len(_layouts) > LAYOUT_CACHE_SIZE:
+            _layouts.popitem(last=False)
+    return layout
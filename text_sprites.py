@@ -0,0 +1,105 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+
+TEXT_SPRITE_CACHE_SIZE = 512
+
+
+class TextSprite(NamedTuple):
+    """
+    预先绘制好的一段文字
+    蒙版为 L 模式，只覆盖文字墨迹的范围；按颜色透过蒙版贴到海报上，
+    结果与直接在海报上 draw.text 逐像素相同
+    """
+
+    mask: Image.Image
+    x: int  # 蒙版左上角在海报上的坐标
+    y: int
+    color: Tuple[int, ...]
+
+    def paste(self, img: Image.Image):
+        """把文字贴到海报上(原地修改)"""
+        width, height = self.mask.size
+        img.paste(self.color, (self.x, self.y, self.x + width, self.y + height), self.mask)
+
+
+class TextSpriteCache:
+    """
+    运势文字图层缓存
+    同一条运势在同一套字体和排版配置下，幸运总结、签文、解签和警告文字每次绘制的结果都相同。
+    以 (运势条目, 字体配置, 排版配置) 为键缓存这些文字的蒙版，超出上限时按最近最少使用淘汰；
+    运势只有几百条，默认上限可以全部放下。
+    渲染在多个线程中进行，所有读写都在锁内完成；返回的图层是共享对象，调用方不能修改。
+    """
+
+    def __init__(self, max_items: int = TEXT_SPRITE_CACHE_SIZE):
+        self.max_items = max(0, int(max_items))
+        self._items: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, build: Callable[[], tuple]) -> tuple:
+        """
+        获取一条运势的文字图层，不存在时调用 build 生成
+        参数：
+            key: 缓存键
+            build: 生成图层的函数，返回 Optional[TextSprite] 组成的元组
+        """
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item
+            self.misses += 1
+
+        item = build()
+        self.put(key, item)
+        return item
+
+    def put(self, key: Hashable, item: tuple):
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._items[key] = item
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
+
+    @property
+    def full(self) -> bool:
+        return len(self._items) >= self.max_items
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+def crop_sprite(
+    canvas: Image.Image, x: int, y: int, color: Tuple[int, ...]
+) -> Optional[TextSprite]:
+    """
+    把画布上的文字裁成只包含墨迹的图层
+    参数：
+        canvas (Image): 绘制了文字的 L 模式画布
+        x, y (int): 画布左上角在海报上的坐标
+        color (tuple): 文字颜色
+    返回：
+        Optional[TextSprite]: 画布上没有墨迹(空文字)时返回 None
+    """
+    bbox = canvas.getbbox()
+    if bbox is None:
+        return None
+    return TextSprite(canvas.crop(bbox), x + bbox[0], y + bbox[1], color)